@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     'django.middleware.security.SecurityMiddleware',
+    'store.profiling.ProfilingMiddleware',
+    'store.traffic.TrafficCaptureMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,6 +99,16 @@ DATABASES = {
 }
 
 
+# Cache
+# product and category read caches use cache.add() as a lock between workers,
+# so use a shared backend (redis, memcached) when there is more than one worker
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -146,7 +158,19 @@ REST_FRAMEWORK = {
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination', # pagination for all classes
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # orjson for JSON, MessagePack for the mobile apps (Accept: application/msgpack or ?format=msgpack)
+    'DEFAULT_RENDERER_CLASSES': (
+        'store.renderers.FastJSONRenderer',
+        'store.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'store.renderers.FastJSONParser',
+        'store.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -163,4 +187,28 @@ DJOSER = {
 }
 
 # CustomUser config
-AUTH_USER_MODEL = 'core.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'core.CustomUser'
+
+
+# Store config
+# True: order create only saves a checkout job and returns 202, process_checkouts command places orders in batches
+STORE_ASYNC_CHECKOUT = False
+# sweep_stale command: carts and unpaid orders older than these are deleted / canceled
+STORE_CART_TTL = timedelta(days=30)
+STORE_UNPAID_ORDER_TTL = timedelta(days=7)
+# archive_history command: closed orders and moderated comments older than these move to archive tables
+STORE_ARCHIVE_ORDERS_AFTER = timedelta(days=365)
+STORE_ARCHIVE_COMMENTS_AFTER = timedelta(days=365)
+# build_related_products command keeps the product co-purchase counts here for incremental updates
+STORE_CO_PURCHASES_PATH = BASE_DIR / 'var' / 'co_purchases.npz'
+# ProfilingMiddleware: part of requests that are profiled (0.01 is 1%), requests with an X-Store-Profile header
+# from the profiles/token/ endpoint are profiled too. oldest profiles are deleted above STORE_PROFILES_MAX_BYTES
+STORE_PROFILE_SAMPLE_RATE = 0
+STORE_PROFILE_TOKEN_MAX_AGE = timedelta(hours=1)
+STORE_PROFILES_DIR = BASE_DIR / 'var' / 'profiles'
+STORE_PROFILES_MAX_BYTES = 200 * 1024 * 1024
+# TrafficCaptureMiddleware: part of requests written (anonymized) to rotating NDJSON files for replay_traffic command
+STORE_TRAFFIC_SAMPLE_RATE = 0
+STORE_TRAFFIC_DIR = BASE_DIR / 'var' / 'traffic'
+STORE_TRAFFIC_FILE_MAX_BYTES = 50 * 1024 * 1024
+STORE_TRAFFIC_FILES = 10 # rotated files kept
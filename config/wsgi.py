@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# product name suggestions (store/autocomplete.py) are served from memory of every worker
+from django.core.signals import request_started
+from store.autocomplete import warm_product_names
+request_started.connect(warm_product_names)
@@ -3,8 +3,15 @@ from django.db.models import Count
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.http import urlencode
+from django.utils import timezone
 
 from . import models
+from .caches import bump_catalog_generation
+from .orders import change_orders_status
+from .autocomplete import product_names
+from .comments import delete_comments, moderate_comments
+
+AUTOCOMPLETE_LIMIT = 100 # products in admin autocomplete results
 
 class InventoryFilter(admin.SimpleListFilter):
     title = 'Critical Inventory Status'
@@ -44,6 +51,13 @@ class ProdcutAdmin(admin.ModelAdmin):
         'slug':['name',]
     }
 
+    def get_search_results(self, request, queryset, search_term):
+        # autocomplete_fields of other admins use the in memory name index, not LIKE
+        if search_term and request.path.endswith('/autocomplete/'):
+            product_ids = [product_id for product_id, _ in product_names.search(search_term, AUTOCOMPLETE_LIMIT)]
+            return queryset.filter(id__in=product_ids), False
+        return super().get_search_results(request, queryset, search_term)
+
     def inventory_status(self, product):
         if product.inventory < 10:
             return 'Low'
@@ -75,7 +89,8 @@ class ProdcutAdmin(admin.ModelAdmin):
 
     @admin.action(description='Clear Inventory')
     def clear_inventory(self, request, queryset):
-        update_count = queryset.update(inventory=0)
+        update_count = queryset.update(inventory=0, datetime_modified=timezone.now()) # update() dont call auto_now, cached fragments use it as version
+        bump_catalog_generation() # update() dont send post_save
         self.message_user(
             request,
             f'{update_count} of products inventories cleared to zero',
@@ -96,19 +111,42 @@ class OrderItemInline(admin.TabularInline):
 @admin.register(models.Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'customer','datetime_created', 'status', 'num_of_items']
-    list_editable = ['status']
     list_per_page = 10
     ordering = ['datetime_created']
+    list_select_related = ['customer__user']
     inlines = [OrderItemInline]
-
-    def get_queryset(self, request):
-        return super().get_queryset(request)\
-                      .prefetch_related('items')\
-                      .annotate(items_count=Count('items'))
+    readonly_fields = ['items_count', 'total_price'] # update_totals() keeps them
+    actions = ['mark_paid', 'mark_canceled'] # status changes just with them, they check ORDER_STATUS_TRANSITIONS
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None:
+            return [*self.readonly_fields, 'status']
+        return self.readonly_fields
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if any(formset.has_changed() for formset in formsets): # items are changed in OrderItemInline
+            form.instance.update_totals()
         
+    def change_status(self, request, queryset, status):
+        order_ids = list(queryset.values_list('id', flat=True))
+        changed_order_ids = change_orders_status(order_ids, status, sender=self.__class__)
+        self.message_user(
+            request,
+            f'{len(changed_order_ids)} of {len(order_ids)} orders changed to {dict(models.Order.ORDER_STATUS)[status]}',
+        )
+
+    @admin.action(description='Mark as Paid')
+    def mark_paid(self, request, queryset):
+        self.change_status(request, queryset, models.Order.ORDER_STATUS_PAID)
+
+    @admin.action(description='Mark as Canceled')
+    def mark_canceled(self, request, queryset):
+        self.change_status(request, queryset, models.Order.ORDER_STATUS_CANCELED)
+
     @admin.display(ordering='items_count', description='# items') # descriptin is show in db with name of description not with name of func
     def num_of_items(self, order):
-        return order.items_count
+        return order.items_count # saved on order, no need to count items
     
 
 @admin.register(models.Comment)
@@ -116,7 +154,22 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ['id', 'product', 'status']
     list_editable = ['status']
     list_per_page = 10
+    list_filter = ['status']
     autocomplete_fields = ['product',]
+    actions = ['approve', 'reject']
+
+    @admin.action(description='Approve selected comments')
+    def approve(self, request, queryset):
+        count = moderate_comments(queryset, list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f'{count} comments approved')
+
+    @admin.action(description='Reject selected comments')
+    def reject(self, request, queryset):
+        count = moderate_comments(queryset, [])
+        self.message_user(request, f'{count} comments rejected')
+
+    def delete_queryset(self, request, queryset): # delete selected comments action
+        delete_comments(queryset)
     # list_display_links = ['product']
 
 @admin.register(models.Customer)
@@ -141,6 +194,25 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'unit_price']
     autocomplete_fields = ['product']
 
+    # keep order totals right
+    def save_model(self, request, obj, form, change):
+        old_order_id = form.initial.get('order')
+        super().save_model(request, obj, form, change)
+        obj.order.update_totals()
+        if old_order_id is not None and old_order_id != obj.order_id:
+            models.Order.objects.get(pk=old_order_id).update_totals()
+
+    def delete_model(self, request, obj):
+        order = obj.order
+        super().delete_model(request, obj)
+        order.update_totals()
+
+    def delete_queryset(self, request, queryset):
+        orders = list(models.Order.objects.filter(id__in=queryset.values('order_id')))
+        super().delete_queryset(request, queryset)
+        for order in orders:
+            order.update_totals()
+
 
 
 
@@ -157,3 +229,11 @@ class CartItemInline(admin.TabularInline):
 class CartAdmin(admin.ModelAdmin):
     list_display = ['id', 'created_at']
     inlines = [CartItemInline]
+
+
+@admin.register(models.CheckoutJob)
+class CheckoutJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'customer', 'status', 'order', 'datetime_created']
+    list_filter = ['status']
+    list_select_related = ['customer__user']
+    list_per_page = 10
@@ -0,0 +1,57 @@
+from django.db import transaction
+
+from .comments import delete_comments
+from .models import ArchivedComment, ArchivedOrder, ArchivedOrderItem, CheckoutJob, Comment, Order, OrderItem
+
+
+ARCHIVE_BATCH_SIZE = 1000
+
+# orders that can not change any more (except paid --> canceled, so keep them long enough before archiving)
+CLOSED_ORDER_STATUSES = [Order.ORDER_STATUS_PAID, Order.ORDER_STATUS_CANCELED]
+MODERATED_COMMENT_STATUSES = [Comment.COMMENT_STATUS_APPROVED, Comment.COMMENT_STATUS_NOT_APPROVED]
+
+
+def copy_to(archive_model, instance):
+    # archive models have the same column names as the hot ones. hot only columns (moderation claims) are not kept
+    return archive_model(**{
+        field.attname: getattr(instance, field.attname)
+        for field in archive_model._meta.concrete_fields
+        if hasattr(instance, field.attname)
+    })
+
+
+def archive_orders(queryset, batch_size=ARCHIVE_BATCH_SIZE):
+    # moves one batch of orders (and their items) of queryset, returns number of moved orders
+    with transaction.atomic():
+        orders = list(queryset.select_for_update().order_by('id')[:batch_size])
+        if not orders:
+            return 0
+        order_ids = [order.id for order in orders]
+        order_items = list(OrderItem.objects.filter(order_id__in=order_ids))
+
+        ArchivedOrder.objects.bulk_create([copy_to(ArchivedOrder, order) for order in orders])
+        ArchivedOrderItem.objects.bulk_create([copy_to(ArchivedOrderItem, order_item) for order_item in order_items])
+        # checkout jobs are polled just until their order is placed, a done job without its order (SET_NULL) would
+        # look like it never placed one. closed orders are archived long after, so their jobs are deleted
+        CheckoutJob.objects.filter(order_id__in=order_ids).delete()
+        OrderItem.objects.filter(order_id__in=order_ids).delete()
+        Order.objects.filter(id__in=order_ids).delete()
+    return len(orders)
+
+
+def archive_comments(queryset, batch_size=ARCHIVE_BATCH_SIZE):
+    with transaction.atomic():
+        comments = list(queryset.select_for_update().order_by('id')[:batch_size])
+        if not comments:
+            return 0
+        ArchivedComment.objects.bulk_create([copy_to(ArchivedComment, comment) for comment in comments])
+        delete_comments(Comment.objects.filter(id__in=[comment.id for comment in comments]))
+    return len(comments)
+
+
+def archivable_orders(before):
+    return Order.objects.filter(status__in=CLOSED_ORDER_STATUSES, datetime_created__lt=before)
+
+
+def archivable_comments(before):
+    return Comment.objects.filter(status__in=MODERATED_COMMENT_STATUSES, datetime_created__lt=before)
@@ -0,0 +1,204 @@
+import bisect
+import os
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Product
+
+
+SUGGESTIONS_LIMIT = 10
+MAX_NAME_LENGTH = 100 # longer names are cut, so memory of an entry is bounded
+# other workers change products too. every change is kept in cache with a version (cache.incr) and workers apply
+# the ones newer than their index every REFRESH_INTERVAL. when some are lost the index is built again in the background
+NAMES_VERSION_KEY = 'product-names-version'
+NAMES_CHANGE_TIMEOUT = 60 * 60
+MAX_NAMES_CHANGES = 1000 # more changes than this since the last check are loaded by building the index again
+REFRESH_INTERVAL = 10
+SEPARATOR = '\x00'
+
+
+def normalize(text):
+    return ' '.join(text.casefold().split())[:MAX_NAME_LENGTH]
+
+
+class PrefixIndex:
+    # one sorted list of 'normalized name\0name\0id' strings, names with a prefix are a range of it (found with bisect).
+    # about 150 bytes for a 20 character name, so a million names are ~150MB (names are cut at MAX_NAME_LENGTH)
+    def __init__(self, products=()):
+        self._entries_by_id = {product_id: self._entry(product_id, name) for product_id, name in products}
+        self._entries = sorted(self._entries_by_id.values())
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _entry(self, product_id, name):
+        name = name.replace(SEPARATOR, '')[:MAX_NAME_LENGTH]
+        return f'{normalize(name)}{SEPARATOR}{name}{SEPARATOR}{product_id}'
+
+    def _remove(self, product_id):
+        entry = self._entries_by_id.pop(product_id, None)
+        if entry is not None:
+            del self._entries[bisect.bisect_left(self._entries, entry)]
+
+    def contains(self, product_id, name):
+        return self._entries_by_id.get(product_id) == self._entry(product_id, name)
+
+    def add(self, product_id, name):
+        with self._lock:
+            self._remove(product_id)
+            entry = self._entry(product_id, name)
+            bisect.insort(self._entries, entry)
+            self._entries_by_id[product_id] = entry
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def search(self, prefix, limit=SUGGESTIONS_LIMIT):
+        # [(product_id, name), ...] in name order
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._entries, prefix)
+            entries = self._entries[start:start + limit]
+        suggestions = []
+        for entry in entries:
+            if not entry.startswith(prefix):
+                break
+            _, name, product_id = entry.split(SEPARATOR)
+            suggestions.append((int(product_id), name))
+        return suggestions
+
+
+def search_names_in_db(prefix, limit=SUGGESTIONS_LIMIT):
+    # same as PrefixIndex.search, used while the first index of a worker is built
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    return list(Product.objects.filter(name__istartswith=prefix).order_by('name', 'id').values_list('id', 'name')[:limit])
+
+
+def names_change_key(version):
+    return f'product-names-change:{version}'
+
+
+class ProductNameIndex:
+    # index of this worker process, built once (first request of the worker) and kept by changes of products
+    def __init__(self):
+        self._index = None
+        self._version = 0 # changes up to this version are in the index
+        self._checked_at = 0
+        self._missing_version = None # change that was not in cache at the last check
+        self._build_lock = threading.Lock()
+        self._changes_lock = threading.Lock()
+        self._refreshing = False
+        self._warmed_pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # threads of the parent are not in the child, a lock they held would stay locked
+        self._build_lock = threading.Lock()
+        self._changes_lock = threading.Lock()
+        self._refreshing = False
+
+    def _build(self):
+        version = cache.get(NAMES_VERSION_KEY, 0) # before reading names, so a change while building is applied later
+        index = PrefixIndex(Product.objects.values_list('id', 'name').iterator(chunk_size=10000))
+        with self._changes_lock:
+            self._index, self._version, self._missing_version = index, version, None
+            self._checked_at = time.monotonic()
+
+    def _start_build(self):
+        # in a thread, the old index (or the db before the first one) is used until then
+        with self._build_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def build():
+            try:
+                self._build()
+            finally:
+                self._refreshing = False
+                if self._index is None: # failed, the next request tries again
+                    self._warmed_pid = None
+                connection.close() # connection of this thread
+        threading.Thread(target=build, daemon=True).start()
+
+    def _apply(self, product_id, name):
+        # changes are applied more than once (the worker that made it applies it again), so they are idempotent
+        if name is None:
+            self._index.remove(product_id)
+        elif not self._index.contains(product_id, name):
+            self._index.add(product_id, name)
+
+    def _apply_changes(self):
+        # changes of other workers since the last check, with one get_many
+        version = cache.get(NAMES_VERSION_KEY, 0)
+        if version <= self._version:
+            return
+        if version - self._version > MAX_NAMES_CHANGES:
+            self._start_build()
+            return
+        versions = range(self._version + 1, version + 1)
+        changes = cache.get_many([names_change_key(change_version) for change_version in versions])
+        for change_version in versions:
+            change = changes.get(names_change_key(change_version))
+            if change is None:
+                # its worker took the version and did not write it yet, or it was evicted (still missing next time)
+                if self._missing_version == change_version:
+                    self._start_build()
+                self._missing_version = change_version
+                return
+            self._apply(*change)
+            self._version = change_version
+
+    def warm(self):
+        # builds it in a thread once per process, web workers start without waiting for it
+        if self._warmed_pid == os.getpid():
+            return
+        self._warmed_pid = os.getpid()
+        self._start_build()
+
+    def get_index(self):
+        # None until the first build is done
+        if self._index is None:
+            self.warm()
+        elif time.monotonic() - self._checked_at > REFRESH_INTERVAL:
+            self._checked_at = time.monotonic()
+            if self._changes_lock.acquire(blocking=False): # another thread is applying them
+                try:
+                    self._apply_changes()
+                finally:
+                    self._changes_lock.release()
+        return self._index
+
+    def search(self, prefix, limit=SUGGESTIONS_LIMIT):
+        index = self.get_index()
+        if index is None:
+            return search_names_in_db(prefix, limit)
+        return index.search(prefix, limit)
+
+    def product_changed(self, product_id, name=None):
+        # name None is a deleted product. applied here and published with the next version for other workers
+        if self._index is not None:
+            if name is not None and self._index.contains(product_id, name):
+                return # name is not changed (price, inventory, ...)
+            self._apply(product_id, name)
+        cache.add(NAMES_VERSION_KEY, 0, None)
+        version = cache.incr(NAMES_VERSION_KEY)
+        cache.set(names_change_key(version), (product_id, name), NAMES_CHANGE_TIMEOUT)
+
+
+product_names = ProductNameIndex()
+
+
+def warm_product_names(sender, **kwargs):
+    # request_started receiver of config/wsgi.py. pre-fork servers import wsgi.py before the fork,
+    # so the index is warmed by the first request of every worker, not at import
+    product_names.warm()
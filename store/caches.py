@@ -0,0 +1,173 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+# change it when product serializers change, so old fragments are not used after deploy
+PRODUCT_FRAGMENT_VERSION = 2
+PRODUCT_FRAGMENT_TIMEOUT = 60 * 60
+
+
+def product_fragment_key(product_id):
+    return f'product-fragment:v{PRODUCT_FRAGMENT_VERSION}:{product_id}'
+
+
+def product_version(product):
+    if 'datetime_modified' in product.get_deferred_fields(): # dont make a query just for version
+        return None
+    return product.datetime_modified.isoformat()
+
+
+def get_product_fragments(serializer_name, products):
+    # one cache entry per product: {'version': ..., 'ProductSerializer': {...}, 'CartProductSerializer': {...}}
+    # returns (fragments by product id, cache entries for writing misses)
+    keys = {product_fragment_key(product.pk): product for product in products if product_version(product)}
+    entries = cache.get_many(keys)
+    fragments = {}
+    for key, product in keys.items():
+        entry = entries.get(key)
+        if entry is None or entry['version'] != product_version(product):
+            entries[key] = {'version': product_version(product)}
+        elif serializer_name in entry:
+            fragments[product.pk] = entry[serializer_name]
+    return fragments, entries
+
+
+def set_product_fragments(serializer_name, entries, data_by_product):
+    changed = {}
+    for product, data in data_by_product.items():
+        key = product_fragment_key(product.pk)
+        if key in entries:
+            entries[key][serializer_name] = data
+            changed[key] = entries[key]
+    if changed:
+        cache.set_many(changed, PRODUCT_FRAGMENT_TIMEOUT)
+
+
+def delete_product_fragments(product_id):
+    cache.delete(product_fragment_key(product_id))
+
+
+# read caches of product and category endpoints
+CATALOG_GENERATION_KEY = 'catalog-generation'
+READ_CACHE_TIMEOUT = 60
+STALE_TIMEOUT = 30 # old data is served this long while one worker recomputes it
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5 # waiting for another worker, after this we compute it ourselves
+LOCK_POLL_INTERVAL = 0.05
+
+# threads of this worker wait on these locks, so just one of them goes to the shared lock and db.
+# a fixed number of locks keeps memory bounded, keys with the same lock just wait for each other
+_key_locks = [threading.Lock() for _ in range(64)]
+
+
+def bump_catalog_generation():
+    # every product and category read cache entry becomes stale (not deleted, so it can be served as stale)
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        cache.set(CATALOG_GENERATION_KEY, 1, None)
+
+
+def _is_fresh(entry, generation):
+    return entry is not None and entry['generation'] == generation and entry['expires_at'] > time.time()
+
+
+def _get_entry(key):
+    values = cache.get_many([key, CATALOG_GENERATION_KEY])
+    return values.get(key), values.get(CATALOG_GENERATION_KEY, 0)
+
+
+def _compute_and_set(key, compute, generation, timeout):
+    data = compute()
+    entry = {'generation': generation, 'expires_at': time.time() + timeout, 'data': data}
+    cache.set(key, entry, timeout + STALE_TIMEOUT)
+    return data
+
+
+def get_or_compute(key, compute, timeout=READ_CACHE_TIMEOUT):
+    # single flight: when key is missed or stale, just one thread in all workers computes it and
+    # the others serve the stale data or wait for the new one
+    entry, generation = _get_entry(key)
+    if _is_fresh(entry, generation):
+        return entry['data']
+
+    key_lock = _key_locks[hash(key) % len(_key_locks)]
+    if entry is not None:
+        if not key_lock.acquire(blocking=False):
+            return entry['data'] # another thread of this worker is computing it
+    elif not key_lock.acquire(timeout=LOCK_WAIT):
+        return compute()
+    try:
+        entry, generation = _get_entry(key) # maybe it is computed while we were waiting
+        if _is_fresh(entry, generation):
+            return entry['data']
+
+        lock_key = f'lock:{key}'
+        token = uuid4().hex
+        if cache.add(lock_key, token, LOCK_TIMEOUT):
+            try:
+                return _compute_and_set(key, compute, generation, timeout)
+            finally:
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        if entry is not None:
+            return entry['data'] # another worker is computing it
+
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry, generation = _get_entry(key)
+            if entry is not None:
+                return entry['data']
+        return compute()
+    finally:
+        key_lock.release()
+
+
+# Idempotency-Key of create requests
+IDEMPOTENCY_TIMEOUT = 24 * 60 * 60 # retries in this time get the first response
+IDEMPOTENCY_LOCK_TIMEOUT = 60 # in progress marker, if the request dies the key is free after this
+IDEMPOTENCY_WAIT = 10 # a duplicate waits this long for the first request
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def _holds_idempotency_key(key, token):
+    # false when our in progress marker expired and a retry took the key, the retry keeps it
+    entry = cache.get(key)
+    return entry is None or entry.get('in_progress') == token
+
+
+def run_idempotent(key, fingerprint, run):
+    # run() returns (status, data, headers) and the result is kept for retries with the same key.
+    # returns (result, replayed)
+    token = uuid4().hex
+    if cache.add(key, {'in_progress': token, 'fingerprint': fingerprint}, IDEMPOTENCY_LOCK_TIMEOUT):
+        try:
+            result = run()
+        except Exception:
+            if _holds_idempotency_key(key, token):
+                cache.delete(key) # not finished, a retry should run it again
+            raise
+        if _holds_idempotency_key(key, token):
+            cache.set(key, {'fingerprint': fingerprint, 'result': result}, IDEMPOTENCY_TIMEOUT)
+        return result, False
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        entry = cache.get(key)
+        if entry is None: # first request failed or expired, try again
+            return run_idempotent(key, fingerprint, run)
+        if entry['fingerprint'] != fingerprint:
+            raise IdempotencyConflict('Idempotency-Key is already used with another request body.')
+        if 'result' in entry:
+            return entry['result'], True
+        if time.monotonic() > deadline:
+            raise IdempotencyConflict('A request with this Idempotency-Key is still in progress.')
+        time.sleep(LOCK_POLL_INTERVAL)
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Cart, CartItem, CheckoutJob, Order, OrderItem
+from .signals import order_created
+
+
+CHECKOUT_CLAIM_TIMEOUT = timedelta(minutes=10) # worker died, another worker takes its processing jobs after this
+
+
+def place_orders(checkouts):
+    # checkouts is a list of (customer_id, cart_id). orders of all carts are inserted together.
+    # returns orders in the same order, None for a cart that is empty or not exists (or came twice)
+    with transaction.atomic():
+        # carts are locked until they are deleted, so two checkouts of a cart in different workers
+        # dont both place it, the second one finds no cart
+        cart_ids = list(
+            Cart.objects
+                .select_for_update()
+                .filter(id__in=[cart_id for _, cart_id in checkouts])
+                .order_by('id')
+                .values_list('id', flat=True)
+        )
+        cart_items_by_cart = defaultdict(list)
+        cart_items = CartItem.objects.select_related('product').filter(cart_id__in=cart_ids)
+        for cart_item in cart_items:
+            cart_items_by_cart[cart_item.cart_id].append(cart_item)
+
+        orders = []
+        order_items = []
+        placed_cart_ids = []
+        for customer_id, cart_id in checkouts:
+            cart_items = cart_items_by_cart.get(cart_id) if cart_id not in placed_cart_ids else None
+            if not cart_items:
+                orders.append(None)
+                continue
+            placed_cart_ids.append(cart_id)
+            order = Order(
+                customer_id=customer_id,
+                items_count=len(cart_items),
+                total_price=sum(cart_item.quantity * cart_item.product.unit_price for cart_item in cart_items),
+            )
+            orders.append(order)
+            order_items += [
+                OrderItem(
+                    order=order,
+                    product=cart_item.product,
+                    unit_price=cart_item.product.unit_price,
+                    quantity=cart_item.quantity,
+                ) for cart_item in cart_items
+            ]
+
+        new_orders = [order for order in orders if order is not None]
+        if connection.features.can_return_rows_from_bulk_insert: # mysql dont return ids of bulk insert
+            Order.objects.bulk_create(new_orders)
+        else:
+            for order in new_orders:
+                order.save()
+
+        OrderItem.objects.bulk_create(order_items) # its create all items with one hit
+        Cart.objects.filter(id__in=placed_cart_ids).delete()
+
+    return orders
+
+
+def claim_checkout_jobs(worker_id, batch_size):
+    # pending jobs and jobs of a dead worker (processing longer than CHECKOUT_CLAIM_TIMEOUT).
+    # the update checks the claim again, so a job is claimed just by one worker on every database backend
+    now = timezone.now()
+    claimable = CheckoutJob.objects.filter(
+        Q(status=CheckoutJob.CHECKOUT_STATUS_PENDING)
+        | Q(status=CheckoutJob.CHECKOUT_STATUS_PROCESSING, claimed_at__lt=now - CHECKOUT_CLAIM_TIMEOUT)
+    )
+    job_ids = list(claimable.order_by('datetime_created').values_list('id', flat=True)[:batch_size])
+    if not job_ids:
+        return []
+    claimable.filter(id__in=job_ids).update(
+        status=CheckoutJob.CHECKOUT_STATUS_PROCESSING,
+        claimed_by=worker_id,
+        claimed_at=now,
+    )
+    return list(CheckoutJob.objects.filter(id__in=job_ids, claimed_by=worker_id, claimed_at=now).order_by('datetime_created'))
+
+
+def process_checkout_jobs(worker_id, batch_size):
+    # returns number of claimed jobs, 0 means the queue is empty
+    claimed_jobs = claim_checkout_jobs(worker_id, batch_size)
+    if not claimed_jobs:
+        return 0
+
+    # orders and job statuses are saved together, so a job of a dead worker has no order and can be placed again
+    with transaction.atomic():
+        # locked jobs can not be reclaimed meanwhile. jobs that another worker reclaimed already are not ours any more
+        jobs = list(
+            CheckoutJob.objects
+                       .select_for_update()
+                       .filter(
+                           id__in=[job.id for job in claimed_jobs],
+                           status=CheckoutJob.CHECKOUT_STATUS_PROCESSING,
+                           claimed_by=worker_id,
+                       )
+                       .order_by('datetime_created')
+        )
+        try:
+            orders = place_orders([(job.customer_id, job.cart_id) for job in jobs])
+            errors = [None] * len(jobs)
+        except Exception:
+            # one bad job should not fail the others, so try them one by one
+            orders, errors = [], []
+            for job in jobs:
+                try:
+                    orders += place_orders([(job.customer_id, job.cart_id)])
+                    errors.append(None)
+                except Exception as e:
+                    orders.append(None)
+                    errors.append(str(e)[:255])
+
+        for job, order, error in zip(jobs, orders, errors):
+            job.order = order
+            if order is not None:
+                job.status = CheckoutJob.CHECKOUT_STATUS_DONE
+            else:
+                job.status = CheckoutJob.CHECKOUT_STATUS_FAILED
+                job.error = error or 'Your cart is empty or there is no cart with this cart id.'
+        CheckoutJob.objects.bulk_update(jobs, ['status', 'order', 'error'])
+
+    for order in orders:
+        if order is not None:
+            order_created.send_robust(CheckoutJob, order=order)
+    return len(claimed_jobs)
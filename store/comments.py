@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caches import bump_catalog_generation, delete_product_fragments
+from .models import Comment, Product
+
+
+MODERATION_BATCH_SIZE = 20
+MODERATION_CLAIM_TIMEOUT = timedelta(minutes=10) # moderator left, others can take the comments after this
+
+
+def refresh_approved_comments_counts(product_ids):
+    # Product.approved_comments_count is shown in product list without counting comments for every product.
+    # call it after any change of approved comments (signals do it for save and delete, not for queryset.update)
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    approved_comments_count = Comment.objects \
+                                     .filter(product_id=OuterRef('pk'), status=Comment.COMMENT_STATUS_APPROVED) \
+                                     .order_by() \
+                                     .values('product_id') \
+                                     .annotate(count=Count('id')) \
+                                     .values('count')
+    Product.objects \
+           .filter(id__in=product_ids) \
+           .update(approved_comments_count=Coalesce(Subquery(approved_comments_count), 0))
+
+    # update() does not send product signals
+    for product_id in product_ids:
+        delete_product_fragments(product_id)
+    bump_catalog_generation()
+
+
+def delete_comments(comments):
+    # one DELETE and one refresh of approved counts. queryset.delete() loads the comments and sends post_delete
+    # for every one of them (the receiver turns off fast delete), so each approved comment would refresh it again.
+    # nothing references comments, so _raw_delete() does not skip any cascade. when a model gets a foreign key
+    # to them, queryset.delete() is used and the test of delete_comments tells about it
+    if Comment._meta.related_objects:
+        return comments.delete()[1].get(Comment._meta.label, 0)
+    product_ids = set(comments.filter(status=Comment.COMMENT_STATUS_APPROVED).values_list('product_id', flat=True))
+    count = comments._raw_delete(comments.db)
+    refresh_approved_comments_counts(product_ids)
+    return count
+
+
+def claim_waiting_comments(moderator_id, batch_size=MODERATION_BATCH_SIZE, after_id=None):
+    # gives the next batch of waiting comments (oldest first, keyset on id) to this moderator.
+    # concurrent moderators never get the same comment
+    now = timezone.now()
+    queue = Comment.objects.filter(status=Comment.COMMENT_STATUS_WAITING).order_by('id')
+    if after_id is not None:
+        queue = queue.filter(id__gt=after_id)
+    claimable = queue.filter(Q(claimed_by='') | Q(claimed_at__lt=now - MODERATION_CLAIM_TIMEOUT))
+
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            # rows locked by another moderator are skipped instead of waiting for them
+            comment_ids = list(claimable.select_for_update(skip_locked=True).values_list('id', flat=True)[:batch_size])
+            Comment.objects.filter(id__in=comment_ids).update(claimed_by=moderator_id, claimed_at=now)
+        else:
+            # the update checks the claim again, so a comment is claimed just by one moderator
+            comment_ids = list(claimable.values_list('id', flat=True)[:batch_size])
+            claimable.filter(id__in=comment_ids).update(claimed_by=moderator_id, claimed_at=now)
+
+    return list(Comment.objects.filter(id__in=comment_ids, claimed_by=moderator_id, claimed_at=now).order_by('id'))
+
+
+def moderate_comments(comments, approved_ids):
+    # one UPDATE for all comments: approved_ids are approved, the others are not approved. returns number of changed comments
+    approved_ids = list(approved_ids)
+    with transaction.atomic():
+        product_ids = set(comments.values_list('product_id', flat=True)) # a rejected comment may be approved before
+        count = comments.update(
+            status=Case(
+                When(id__in=approved_ids, then=Value(Comment.COMMENT_STATUS_APPROVED)),
+                default=Value(Comment.COMMENT_STATUS_NOT_APPROVED),
+            ),
+            claimed_by='',
+            claimed_at=None,
+        )
+    refresh_approved_comments_counts(product_ids)
+    return count
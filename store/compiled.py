@@ -0,0 +1,166 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields, relations, serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+
+
+# read path of a model serializer as one flat python function, generated from its fields:
+#     def represent(instance):
+#         ret = {}
+#         value = instance.id
+#         ret['id'] = None if value is None else int(value)
+#         value = instance.unit_price
+#         ret['price'] = None if value is None else to_representation_3(value)
+#         ret['unit_price_after_tax'] = get_unit_price_after_tax_4(instance)
+#         items = list(instance.items.all())
+#         ret['items'] = [represent_5(item) for item in items]
+#         ...
+# output is the same as serializer.to_representation(instance). fields it does not know (dotted sources through
+# nullable relations, callables, custom fields) are read with field.get_attribute() like drf does.
+# the code is compiled once per serializer class and fields (?fields=, ?expand=), the names in it (method fields,
+# converters, nested functions) are taken from the serializer instance of every list
+
+# to_representation that is just a builtin, they are called directly
+BUILTIN_CONVERTERS = {
+    fields.IntegerField.to_representation: 'int',
+    fields.CharField.to_representation: 'str',
+    fields.ReadOnlyField.to_representation: '',
+}
+COMPILED_CACHE_SIZE = 512 # ?fields= makes many field sets, the cache is emptied when it is full
+
+_compiled = {} # representation_key() -> (code, binders)
+
+
+def is_compilable(serializer):
+    # serializers that change to_representation must say their output is the normal one (compilable = True)
+    return isinstance(serializer, serializers.ModelSerializer) and getattr(
+        serializer, 'compilable', type(serializer).to_representation is serializers.Serializer.to_representation,
+    )
+
+
+def model_field_path(model, source_attrs):
+    # model fields of a source like customer.user.email, None when it is not reached by not null foreign keys
+    path = []
+    for attr in source_attrs:
+        if path:
+            if not (path[-1].many_to_one or (path[-1].one_to_one and path[-1].concrete)) or path[-1].null:
+                return None
+            model = path[-1].related_model
+        try:
+            path.append(model._meta.get_field(attr))
+        except FieldDoesNotExist:
+            return None
+    return path
+
+
+def field_key(field):
+    # everything of a field that its generated code depends on
+    if isinstance(field, serializers.ListSerializer):
+        nested = representation_key(field.child)
+    elif isinstance(field, serializers.Serializer):
+        nested = representation_key(field)
+    else:
+        nested = None
+    return (
+        field.field_name, type(field), field.source, getattr(field, 'method_name', None),
+        getattr(field, 'coerce_to_string', None), getattr(field, 'uuid_format', None), getattr(field, 'pk_field', None) is None,
+        nested,
+    )
+
+
+def representation_key(serializer):
+    return type(serializer), tuple(field_key(field) for field in serializer._readable_fields)
+
+
+class RepresentationCompiler:
+    def __init__(self, serializer):
+        self.serializer = serializer
+        self.model = serializer.Meta.model
+        self.binders = {} # name in the code -> function(serializer) that returns its value for a serializer instance
+        self.lines = ['def represent(instance):', '    ret = {}']
+
+    def add_name(self, prefix, field, get):
+        # name of get(field) of the serializer instance the function is made for
+        field_name = field.field_name # not the field, cached code does not keep serializers alive
+        name = f'{prefix}_{len(self.binders)}'
+        self.binders[name] = lambda serializer: get(serializer.fields[field_name])
+        return name
+
+    def add_line(self, line):
+        self.lines.append(f'    {line}')
+
+    def converter(self, field):
+        to_representation = type(field).to_representation
+        if to_representation in BUILTIN_CONVERTERS:
+            return BUILTIN_CONVERTERS[to_representation]
+        if to_representation is fields.BigIntegerField.to_representation \
+                and not getattr(field, 'coerce_to_string', api_settings.COERCE_BIGINT_TO_STRING): # ids
+            return 'int'
+        if to_representation is fields.UUIDField.to_representation and field.uuid_format == 'hex_verbose':
+            return 'str'
+        return self.add_name('to_representation', field, lambda field: field.to_representation)
+
+    def add_field(self, field):
+        key = repr(field.field_name)
+        path = model_field_path(self.model, field.source_attrs) if field.source != '*' else None
+        last = path[-1] if path else None
+        getter = 'instance.' + '.'.join(field.source_attrs)
+
+        if isinstance(field, fields.SerializerMethodField):
+            method = self.add_name(field.method_name, field, lambda field: getattr(field.parent, field.method_name))
+            self.add_line(f'ret[{key}] = {method}(instance)')
+        elif isinstance(field, serializers.ListSerializer) and is_compilable(field.child) \
+                and len(field.source_attrs) == 1 and last is not None and (last.one_to_many or last.many_to_many):
+            represent = self.add_name('represent', field, lambda field: compile_representation(field.child))
+            self.add_line(f'items = list({getter}.all())')
+            for child_field in field.child._readable_fields:
+                # fields that read their values of the whole list at once (product fragments of order items)
+                if hasattr(child_field, 'prime') and len(child_field.source_attrs) == 1:
+                    prime = self.add_name('prime', field, lambda field, name=child_field.field_name: field.child.fields[name].prime)
+                    self.add_line(f'{prime}([item.{child_field.source} for item in items])')
+            self.add_line(f'ret[{key}] = [{represent}(item) for item in items]')
+        elif isinstance(field, serializers.Serializer) and is_compilable(field) \
+                and last is not None and (last.many_to_one or (last.one_to_one and last.concrete)):
+            represent = self.add_name('represent', field, compile_representation)
+            self.add_line(f'value = {getter}')
+            self.add_line(f'ret[{key}] = None if value is None else {represent}(value)')
+        elif type(field).to_representation is relations.PrimaryKeyRelatedField.to_representation and field.pk_field is None \
+                and len(field.source_attrs) == 1 and last is not None and last.many_to_one:
+            self.add_line(f'ret[{key}] = instance.{last.attname}') # no query for the related object
+        elif last is not None and last.concrete and not last.is_relation:
+            converter = self.converter(field)
+            self.add_line(f'value = {getter}')
+            self.add_line(f'ret[{key}] = None if value is None else {converter}(value)' if converter else f'ret[{key}] = value')
+        else:
+            name = self.add_name('field', field, lambda field: field)
+            self.add_line('try:')
+            self.add_line(f'    value = {name}.get_attribute(instance)')
+            self.add_line('except SkipField:')
+            self.add_line('    pass')
+            self.add_line('else:')
+            self.add_line(f'    ret[{key}] = None if (value.pk if isinstance(value, PKOnlyObject) else value) is None else {name}.to_representation(value)')
+
+    def compile(self):
+        for field in self.serializer._readable_fields:
+            self.add_field(field)
+        self.add_line('return ret')
+        source = '\n'.join(self.lines)
+        return compile(source, f'<compiled {type(self.serializer).__name__}>', 'exec'), self.binders
+
+
+def compile_representation(serializer):
+    # function(instance) -> serializer.to_representation(instance). the code is cached, the function is made for
+    # this serializer instance (its method fields, field settings and nested serializers)
+    key = representation_key(serializer)
+    compiled = _compiled.get(key)
+    if compiled is None:
+        if len(_compiled) >= COMPILED_CACHE_SIZE:
+            _compiled.clear()
+        compiled = _compiled[key] = RepresentationCompiler(serializer).compile()
+    code, binders = compiled
+    namespace = {'SkipField': SkipField, 'PKOnlyObject': PKOnlyObject}
+    for name, get in binders.items():
+        namespace[name] = get(serializer)
+    exec(code, namespace)
+    return namespace['represent']
@@ -0,0 +1,37 @@
+import hashlib
+import json
+from functools import wraps
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import caches
+
+
+def idempotent(view_method):
+    # for create methods of viewsets: clients send Idempotency-Key header and a retry with the same key
+    # gets the first response, the method is not run again
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return view_method(self, request, *args, **kwargs)
+
+        user = request.user.id if request.user.is_authenticated else 'anonymous'
+        key = 'idempotency:' + hashlib.md5(f'{user}:{request.path}:{idempotency_key}'.encode()).hexdigest()
+        fingerprint = hashlib.md5(json.dumps(request.data, sort_keys=True, default=str).encode()).hexdigest()
+
+        def run():
+            response = view_method(self, request, *args, **kwargs)
+            headers = {'Location': response['Location']} if response.has_header('Location') else {}
+            return response.status_code, response.data, headers
+
+        try:
+            (status_code, data, headers), replayed = caches.run_idempotent(key, fingerprint, run)
+        except caches.IdempotencyConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        response = Response(data, status=status_code, headers=headers)
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+    return wrapper
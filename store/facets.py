@@ -0,0 +1,42 @@
+from django.db.models import Count, Q
+
+
+# unit_price buckets [min, max), None is no limit
+PRICE_BUCKETS = [(0, 10), (10, 50), (50, 100), (100, 500), (500, 1000), (1000, None)]
+# same bands as InventoryFilter of product admin
+INVENTORY_BANDS = [
+    ('<3', Q(inventory__lt=3)),
+    ('3<=10', Q(inventory__range=(3, 10))),
+    ('>10', Q(inventory__gt=10)),
+]
+
+
+def price_bucket_filter(low, high):
+    if high is None:
+        return Q(unit_price__gte=low)
+    return Q(unit_price__gte=low, unit_price__lt=high)
+
+
+def product_facets(queryset):
+    # counts of filtered products per category, price bucket and inventory band in one GROUP BY category query
+    aggregates = {'count': Count('id')}
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = Count('id', filter=price_bucket_filter(low, high))
+    for index, (_, band_filter) in enumerate(INVENTORY_BANDS):
+        aggregates[f'inventory_{index}'] = Count('id', filter=band_filter)
+    rows = list(queryset.order_by().values('category_id', 'category__title').annotate(**aggregates))
+
+    return {
+        'category': [
+            {'id': row['category_id'], 'title': row['category__title'], 'count': row['count']}
+            for row in sorted(rows, key=lambda row: (-row['count'], row['category_id']))
+        ],
+        'price': [
+            {'min': low, 'max': high, 'count': sum(row[f'price_{index}'] for row in rows)}
+            for index, (low, high) in enumerate(PRICE_BUCKETS)
+        ],
+        'inventory': [
+            {'value': value, 'count': sum(row[f'inventory_{index}'] for row in rows)}
+            for index, (value, _) in enumerate(INVENTORY_BANDS)
+        ],
+    }
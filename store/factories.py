@@ -3,6 +3,7 @@ import factory
 from datetime import datetime
 from faker import Faker
 from factory.django import DjangoModelFactory
+from django.conf import settings
 
 from . import models
 
@@ -39,16 +40,32 @@ class ProductFactory(DjangoModelFactory):
     inventory = factory.LazyFunction(lambda: random.randint(1, 100))
 
 
-class CustomerFactory(DjangoModelFactory):
+class UserFactory(DjangoModelFactory):
     class Meta:
-        model = models.Customer
+        model = settings.AUTH_USER_MODEL
 
+    username = factory.Sequence(lambda n: f'customer{n}')
+    email = factory.Sequence(lambda n: f'customer{n}@example.com')
     first_name = factory.Faker("first_name")
     last_name = factory.Faker("last_name")
-    email = factory.Faker("email")
+
+
+class CustomerFactory(DjangoModelFactory):
+    class Meta:
+        model = models.Customer
+
+    user = factory.SubFactory(UserFactory)
     phone_number = factory.Faker("phone_number")
     birth_date = factory.LazyFunction(lambda: faker.date_time_ad(start_datetime=datetime(1990,1,1), end_datetime=datetime(2015,1,1)))
 
+    @classmethod
+    def _create(cls, model_class, user, **kwargs):
+        customer = user.customer # made by the post_save signal of user
+        for name, value in kwargs.items():
+            setattr(customer, name, value)
+        customer.save()
+        return customer
+
 
 class AddressFactory(DjangoModelFactory):
     class Meta:
@@ -1,10 +1,21 @@
 from django_filters.rest_framework import FilterSet
 
-from .models import Product
+from .models import Order, Product
 
 class ProductFilter(FilterSet):
     class Meta:
         model = Product
         fields = {
             'inventory': ['gt', 'lt'],
-        }
\ No newline at end of file
+        }
+
+
+class OrderFilter(FilterSet):
+    class Meta:
+        model = Order
+        fields = {
+            'status': ['exact'],
+            'customer': ['exact'],
+            'datetime_created': ['gte', 'lt'],
+            'total_price': ['gte'],
+        }
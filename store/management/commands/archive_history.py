@@ -0,0 +1,46 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.archive import ARCHIVE_BATCH_SIZE, archivable_comments, archivable_orders, archive_comments, archive_orders
+
+
+PAUSE = 0.5
+
+
+class Command(BaseCommand):
+    help = "Moves closed orders (with items) and moderated comments to archive tables in batches (run it from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-days', type=float, help=f'Default is STORE_ARCHIVE_ORDERS_AFTER ({settings.STORE_ARCHIVE_ORDERS_AFTER.days} days)')
+        parser.add_argument('--comment-days', type=float, help=f'Default is STORE_ARCHIVE_COMMENTS_AFTER ({settings.STORE_ARCHIVE_COMMENTS_AFTER.days} days)')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=PAUSE, help='Seconds to sleep between batches')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches of every table')
+
+    def archive(self, label, archive_batch, options):
+        moved = 0
+        batches = 0
+        start = time.perf_counter()
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count = archive_batch(options['batch_size'])
+            moved += count
+            if count:
+                batches += 1
+            if count < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(f'{label}: {moved} archived in {batches} batches, {time.perf_counter() - start:.2f}s')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        orders_after = timedelta(days=options['order_days']) if options['order_days'] is not None else settings.STORE_ARCHIVE_ORDERS_AFTER
+        comments_after = timedelta(days=options['comment_days']) if options['comment_days'] is not None else settings.STORE_ARCHIVE_COMMENTS_AFTER
+
+        orders = archivable_orders(now - orders_after)
+        self.archive('orders', lambda batch_size: archive_orders(orders, batch_size), options)
+        comments = archivable_comments(now - comments_after)
+        self.archive('comments', lambda batch_size: archive_comments(comments, batch_size), options)
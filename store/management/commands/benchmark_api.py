@@ -0,0 +1,104 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from store.models import Cart, Product
+
+
+REPEAT = 20
+
+
+def product_urls():
+    product_id = Product.objects.values_list('id', flat=True).first()
+    return [
+        ('product list', '/store/products/'),
+        ('product list (narrow)', '/store/products/?fields=id,name,price'),
+        ('product list (no description)', '/store/products/?exclude=description'),
+        ('product list (expanded)', '/store/products/?expand=category,discounts'),
+        ('product detail', f'/store/products/{product_id}/'),
+        ('product detail (narrow)', f'/store/products/{product_id}/?fields=id,name,price'),
+    ]
+
+
+def cart_urls():
+    cart_id = Cart.objects.values_list('id', flat=True).first()
+    return [
+        ('cart detail', f'/store/carts/{cart_id}/'),
+        ('cart detail (narrow)', f'/store/carts/{cart_id}/?fields=id,created_at'),
+    ]
+
+
+def order_urls():
+    return [
+        ('order list', '/store/orders/'),
+        ('order list (narrow)', '/store/orders/?fields=id,status,datetime_created'),
+    ]
+
+
+def fragment_urls():
+    # (label, url, function called before every request)
+    return [
+        ('product list (cold fragments)', '/store/products/', cache.clear),
+        ('product list (warm fragments)', '/store/products/', None),
+        ('order list (cold fragments)', '/store/orders/', cache.clear),
+        ('order list (warm fragments)', '/store/orders/', None),
+    ]
+
+
+SCENARIOS = {
+    'products': product_urls,
+    'carts': cart_urls,
+    'orders': order_urls,
+    'fragments': fragment_urls,
+}
+
+
+class Command(BaseCommand):
+    help = "Measures latency and payload size of store endpoints (run setup_fake_data first)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Any of {", ".join(SCENARIOS)} (default: all)')
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+        parser.add_argument('--username', help='Run requests as this user (default: first superuser)')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'] or list(SCENARIOS)
+        for scenario in scenarios:
+            if scenario not in SCENARIOS:
+                raise CommandError(f'Unknown scenario {scenario}.')
+
+        User = get_user_model()
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('There is no user to run requests with. Create a superuser first.')
+
+        # debug toolbar and DEBUG query logging make numbers useless
+        settings.DEBUG = False
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user)
+
+        self.stdout.write(f"{'endpoint':<40}{'avg ms':>10}{'req/s':>10}{'bytes':>10}")
+        for scenario in scenarios:
+            for label, url, *before_request in SCENARIOS[scenario]():
+                before_request = before_request[0] if before_request else None
+                durations = []
+                client.get(url) # first request warm up
+                for _ in range(options['repeat']):
+                    if before_request is not None:
+                        before_request()
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    durations.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    self.stdout.write(f'{label:<40}{"status " + str(response.status_code):>20}')
+                    continue
+                avg_ms = sum(durations) / len(durations) * 1000
+                self.stdout.write(f'{label:<40}{avg_ms:>10.2f}{1000 / avg_ms:>10.1f}{len(response.content):>10}')
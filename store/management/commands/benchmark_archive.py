@@ -0,0 +1,90 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from rest_framework.test import APIClient
+
+from store.archive import archive_comments, archive_orders
+from store.models import Comment, Customer, Order, OrderItem, Product
+
+
+REPEAT = 20
+PAGE_SIZE = 100
+ARCHIVED_PART = 0.9
+
+
+class Command(BaseCommand):
+    help = "Times hot path order and comment queries before and after archiving 90% of rows (everything is rolled back). " \
+           "Use benchmark_order_filters --orders N first for a big orders table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+
+    def get_scenarios(self):
+        customer = Customer.objects.annotate(orders_count=Count('orders')).order_by('-orders_count').first()
+        product = Product.objects.annotate(comments_count=Count('comments')).order_by('-comments_count').first()
+        # (label, function that runs the query)
+        return [
+            ('unpaid orders page', lambda: list(Order.objects.filter(status=Order.ORDER_STATUS_UNPAID).order_by('-datetime_created')[:PAGE_SIZE])),
+            ('customer orders page', lambda: list(Order.objects.filter(customer=customer).order_by('-datetime_created')[:PAGE_SIZE])),
+            ('orders count', lambda: Order.objects.count()),
+            ('order items of a page', lambda: list(OrderItem.objects.filter(order_id__in=list(Order.objects.order_by('-datetime_created').values_list('id', flat=True)[:PAGE_SIZE])))),
+            ('approved comments of product', lambda: list(Comment.objects.filter(product=product, status=Comment.COMMENT_STATUS_APPROVED)[:PAGE_SIZE])),
+            ('comments count', lambda: Comment.objects.count()),
+        ]
+
+    def run_scenarios(self, repeat):
+        results = {}
+        for label, run in self.get_scenarios():
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                durations.append(time.perf_counter() - start)
+            results[label] = sum(durations) / len(durations) * 1000
+        return results
+
+    def archive_oldest(self):
+        # oldest 90% of all orders and comments, whatever their status is
+        orders_count = int(Order.objects.count() * ARCHIVED_PART)
+        comments_count = int(Comment.objects.count() * ARCHIVED_PART)
+        # ids are read first, mysql does not support LIMIT in an IN subquery
+        order_ids = list(Order.objects.order_by('id').values_list('id', flat=True)[:orders_count])
+        comment_ids = list(Comment.objects.order_by('id').values_list('id', flat=True)[:comments_count])
+        start = time.perf_counter()
+        archived_orders = archive_orders(Order.objects.filter(id__in=order_ids), batch_size=orders_count)
+        archived_comments = archive_comments(Comment.objects.filter(id__in=comment_ids), batch_size=comments_count)
+        self.stdout.write(f'{archived_orders} orders and {archived_comments} comments archived in {time.perf_counter() - start:.2f}s')
+
+    def check_fallback(self, order_id):
+        # archived order is still readable from the orders endpoint
+        user = get_user_model().objects.filter(is_staff=True).first()
+        if user is None:
+            return
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user)
+        start = time.perf_counter()
+        response = client.get(f'/store/orders/{order_id}/')
+        if response.status_code != 200:
+            raise CommandError(f'Archived order {order_id} returned {response.status_code}')
+        self.stdout.write(f'archived order {order_id} read from /store/orders/{order_id}/ in {(time.perf_counter() - start) * 1000:.2f} ms')
+
+    def handle(self, *args, **options):
+        if not Order.objects.exists():
+            raise CommandError('Run setup_fake_data first.')
+
+        with transaction.atomic():
+            before = self.run_scenarios(options['repeat'])
+            first_order_id = Order.objects.order_by('id').values_list('id', flat=True).first()
+            self.archive_oldest()
+            after = self.run_scenarios(options['repeat'])
+            self.check_fallback(first_order_id)
+            transaction.set_rollback(True) # keep the data as it was
+
+        self.stdout.write(f'{"":<32}{"before ms":>12}{"after ms":>12}')
+        for label in before:
+            self.stdout.write(f'{label:<32}{before[label]:>12.2f}{after[label]:>12.2f}')
@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from rest_framework.test import APIClient
+
+from store.models import Cart, CartItem, CheckoutJob, Customer, Order, OrderItem, Product
+
+
+NUM_CHECKOUTS = 200
+CONCURRENCY = 16
+ITEMS_PER_CART = 3
+
+
+class Command(BaseCommand):
+    help = "Compares checkouts per second of sync and async (STORE_ASYNC_CHECKOUT) order create"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--checkouts', type=int, default=NUM_CHECKOUTS)
+        parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='Clients sending checkouts at the same time')
+        parser.add_argument('--workers', type=int, default=4, help='process_checkouts workers in async mode')
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def create_carts(self, count):
+        products = list(Product.objects.all()[:ITEMS_PER_CART])
+        carts = Cart.objects.bulk_create([Cart() for _ in range(count)])
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1) for cart in carts for product in products
+        ])
+        return [cart.id for cart in carts]
+
+    def send_checkouts(self, user, cart_ids, concurrency):
+        def checkout(cart_id):
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user)
+            try:
+                return client.post('/store/orders/', {'cart_id': str(cart_id)}, format='json').status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(checkout, cart_ids))
+
+    def run(self, user, options, async_checkout):
+        settings.STORE_ASYNC_CHECKOUT = async_checkout
+        cart_ids = self.create_carts(options['checkouts'])
+        first_order_id = (Order.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+        start = time.perf_counter()
+        statuses = self.send_checkouts(user, cart_ids, options['concurrency'])
+        accepted = time.perf_counter() - start
+        if async_checkout:
+            call_command('process_checkouts', workers=options['workers'], batch_size=options['batch_size'], once=True, stdout=self.stdout)
+        duration = time.perf_counter() - start
+
+        mode = 'async' if async_checkout else 'sync'
+        self.stdout.write(
+            f'{mode:<6} status codes {sorted(set(statuses))}: all accepted in {accepted:.2f}s, '
+            f'all placed in {duration:.2f}s ({len(cart_ids) / duration:.1f} checkouts/s)'
+        )
+
+        # clean up, orders are protected
+        CheckoutJob.objects.filter(cart_id__in=cart_ids).delete()
+        OrderItem.objects.filter(order_id__gte=first_order_id).delete()
+        Order.objects.filter(id__gte=first_order_id).delete()
+        Cart.objects.filter(id__in=cart_ids).delete()
+
+    def handle(self, *args, **options):
+        customer = Customer.objects.select_related('user').first()
+        if customer is None or Product.objects.count() < ITEMS_PER_CART:
+            raise CommandError('Run setup_fake_data first.')
+
+        settings.DEBUG = False
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+        async_checkout = settings.STORE_ASYNC_CHECKOUT
+        try:
+            self.run(customer.user, options, async_checkout=False)
+            self.run(customer.user, options, async_checkout=True)
+        finally:
+            settings.STORE_ASYNC_CHECKOUT = async_checkout
@@ -0,0 +1,64 @@
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+
+from store.models import Product
+
+
+REPEAT = 10
+PAGE_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = "Compares payload size, CPU time and peak memory of JSON and columnar (?format=columnar) list responses"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE)
+
+    def measure(self, client, url, repeat):
+        # cache is cleared before every request, so the whole response is built each time
+        cpu_times = []
+        for _ in range(repeat):
+            cache.clear()
+            start = time.process_time()
+            response = client.get(url)
+            cpu_times.append(time.process_time() - start)
+        if response.status_code != 200:
+            raise CommandError(f'{url} returned {response.status_code}')
+
+        cache.clear()
+        tracemalloc.start()
+        client.get(url)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return len(response.content), sum(cpu_times) / len(cpu_times) * 1000, peak / 1024
+
+    def handle(self, *args, **options):
+        if not Product.objects.exists():
+            raise CommandError('Run setup_fake_data first.')
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('There is no user to run requests with. Create a superuser first.')
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user)
+
+        page_size = min(options['page_size'], 1000) # max_page_size of DefaultPagination
+        urls = [
+            ('product list', f'/store/products/?page_size={page_size}'),
+            ('product list (narrow)', f'/store/products/?page_size={page_size}&fields=id,name,price'),
+            ('order list', '/store/orders/'),
+            ('order list (summary)', '/store/orders/?summary=true'),
+        ]
+        self.stdout.write(f'{"":<24}{"":>10}{"bytes":>12}{"cpu ms":>10}{"peak KiB":>12}')
+        for label, url in urls:
+            separator = '&' if '?' in url else '?'
+            for format_label, format_url in [('json', url), ('columnar', f'{url}{separator}format=columnar')]:
+                size, cpu_ms, peak_kib = self.measure(client, format_url, options['repeat'])
+                self.stdout.write(f'{label:<24}{format_label:>10}{size:>12}{cpu_ms:>10.2f}{peak_kib:>12.0f}')
@@ -0,0 +1,97 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store.filters import OrderFilter
+from store.models import Customer, Order
+
+
+CHUNK_SIZE = 10000
+REPEAT = 20
+PAGE_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = "Shows query plans and timing of staff order filters and checks the intended indexes are used"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=0, help='Add this many fake orders first (for example 5000000)')
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+
+    def generate_orders(self, count):
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+        if not customer_ids:
+            raise CommandError('Run setup_fake_data first.')
+        statuses = [status for status, _ in Order.ORDER_STATUS]
+        now = timezone.now()
+
+        datetime_created = Order._meta.get_field('datetime_created')
+        datetime_created.auto_now_add = False # keep our random dates
+        try:
+            for start in range(0, count, CHUNK_SIZE):
+                with transaction.atomic():
+                    Order.objects.bulk_create([
+                        Order(
+                            customer_id=random.choice(customer_ids),
+                            status=random.choice(statuses),
+                            datetime_created=now - timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60)),
+                            items_count=random.randint(1, 10),
+                            total_price=Decimal(random.randint(100, 1000000)) / 100,
+                        ) for _ in range(min(CHUNK_SIZE, count - start))
+                    ])
+                self.stdout.write(f'{min(start + CHUNK_SIZE, count)} orders added', ending='\r')
+        finally:
+            datetime_created.auto_now_add = True
+        self.stdout.write('')
+
+    def get_scenarios(self):
+        customer = Customer.objects.first()
+        month_ago = (timezone.now() - timedelta(days=30)).isoformat()
+        week_ago = (timezone.now() - timedelta(days=7)).isoformat()
+        # (label, filter params, customer user id for non staff users, index that should be used).
+        # total_price has no index, min total reads orders newest first and filters them
+        return [
+            ('status', {'status': Order.ORDER_STATUS_PAID}, None, 'order_status_created_idx'),
+            ('status + created range', {'status': Order.ORDER_STATUS_UNPAID, 'datetime_created__gte': month_ago, 'datetime_created__lt': week_ago}, None, 'order_status_created_idx'),
+            ('created range', {'datetime_created__gte': month_ago, 'datetime_created__lt': week_ago}, None, 'order_created_idx'),
+            ('customer', {'customer': customer.id}, None, 'order_customer_created_idx'),
+            ('min total', {'total_price__gte': 5000}, None, None),
+            ('own orders (non staff)', {}, customer.user_id, 'order_customer_created_idx'),
+        ]
+
+    def handle(self, *args, **options):
+        if options['orders']:
+            self.generate_orders(options['orders'])
+
+        failed = []
+        for label, params, user_id, index_name in self.get_scenarios():
+            # same queryset as OrderViewSet
+            queryset = Order.objects.all()
+            if user_id is not None:
+                queryset = queryset.filter(customer__user_id=user_id)
+            queryset = OrderFilter(params, queryset=queryset).qs.order_by('-datetime_created')[:PAGE_SIZE]
+
+            plan = queryset.explain()
+            durations = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                list(queryset)
+                durations.append(time.perf_counter() - start)
+
+            duration = f'{sum(durations) / len(durations) * 1000:>10.2f} ms'
+            if index_name is None:
+                self.stdout.write(f'{label:<28}{duration}  no index for this filter')
+            elif index_name in plan:
+                self.stdout.write(f'{label:<28}{duration}  {index_name}: used')
+            else:
+                failed.append(label)
+                self.stdout.write(f'{label:<28}{duration}  {index_name}: NOT USED')
+            self.stdout.write(f'    {plan}'.replace('\n', '\n    '))
+
+        if failed:
+            raise CommandError(f'Intended index is not used for: {", ".join(failed)}')
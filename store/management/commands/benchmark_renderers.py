@@ -0,0 +1,66 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from store.models import Cart
+from store.renderers import FastJSONRenderer, MessagePackRenderer
+
+
+REPEAT = 200
+REQUESTS = 20
+RENDERERS = [
+    ('json (stdlib)', JSONRenderer),
+    ('json (orjson)', FastJSONRenderer),
+    ('msgpack', MessagePackRenderer),
+]
+
+
+class Command(BaseCommand):
+    help = "Measures throughput of the stdlib JSON, orjson and MessagePack renderers on product, cart and order responses " \
+           "and checks that orjson writes the same bytes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=REPEAT, help='Renders of the same data per renderer')
+        parser.add_argument('--requests', type=int, default=REQUESTS, help='Whole requests per renderer')
+
+    def get_urls(self):
+        cart_id = Cart.objects.filter(items__isnull=False).values_list('id', flat=True).first()
+        if cart_id is None:
+            raise CommandError('There is no cart with items. Run setup_fake_data first.')
+        return [
+            ('product list', '/store/products/?page_size=100'),
+            ('cart detail', f'/store/carts/{cart_id}/'),
+            ('order list', '/store/orders/'),
+        ]
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('There is no user to run requests with. Create a superuser first.')
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user)
+
+        self.stdout.write(f'{"":<16}{"":<16}{"bytes":>10}{"renders/s":>12}{"requests/s":>12}')
+        for label, url in self.get_urls():
+            data = client.get(url).data
+            if FastJSONRenderer().render(data) != JSONRenderer().render(data):
+                raise CommandError(f'orjson output of {url} is not the same as JSONRenderer output')
+
+            for renderer_label, renderer_class in RENDERERS:
+                renderer = renderer_class()
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    content = renderer.render(data)
+                renders_per_second = options['repeat'] / (time.perf_counter() - start)
+
+                # the whole request, views and serializers included (renderer is chosen by Accept)
+                start = time.perf_counter()
+                for _ in range(options['requests']):
+                    client.get(url, HTTP_ACCEPT=renderer_class.media_type)
+                requests_per_second = options['requests'] / (time.perf_counter() - start)
+                self.stdout.write(f'{label:<16}{renderer_label:<16}{len(content):>10}{renders_per_second:>12.0f}{requests_per_second:>12.1f}')
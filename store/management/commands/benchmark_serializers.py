@@ -0,0 +1,105 @@
+import gc
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.serializers import ListSerializer
+
+from store.models import Cart, CartItem, Category, Customer, Order, OrderItem, Product
+from store.serializers import CartItemSerializer, OrderForAdminSerializer, OrderSerializer, OrderSummaryForAdminSerializer, ProductSerializer
+
+
+REPEAT = 20
+ORDERS = 100
+ITEMS_PER_ORDER = 50
+
+
+def prefetched(queryset, objects):
+    # what prefetch_related leaves in _prefetched_objects_cache
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    return queryset
+
+
+def make_payloads(orders_count, items_count):
+    # unsaved objects with everything loaded, so just serialization is measured (no db)
+    now = timezone.now()
+    categories = [Category(id=index, title=f'Category {index}') for index in range(1, 11)]
+    products = [
+        Product(
+            id=index, name=f'Product {index}', slug=f'product-{index}', category=categories[index % 10],
+            unit_price=Decimal(index % 500) + Decimal('0.99'), inventory=index % 100, description='x' * 200,
+            approved_comments_count=index % 7, datetime_created=now, datetime_modified=now,
+        )
+        for index in range(1, items_count * 2 + 1)
+    ]
+    orders = []
+    for order_index in range(1, orders_count + 1):
+        user = get_user_model()(id=order_index, first_name='First', last_name='Last', email=f'user{order_index}@example.com')
+        customer = Customer(id=order_index, user=user)
+        order = Order(
+            id=order_index, customer=customer, status=Order.ORDER_STATUS_PAID,
+            datetime_created=now - timedelta(minutes=order_index), items_count=items_count, total_price=Decimal('1234.50'),
+        )
+        items = [
+            OrderItem(id=order_index * 1000 + index, order=order, product=products[(order_index + index) % len(products)],
+                      quantity=index % 5 + 1, unit_price=Decimal('10.25'))
+            for index in range(items_count)
+        ]
+        order._prefetched_objects_cache = {'items': prefetched(OrderItem.objects.all(), items)}
+        orders.append(order)
+    cart = Cart(id='a5b8f6a2-7c3e-4d2b-9a11-5f0c2e9d8b7a', created_at=now)
+    cart_items = [CartItem(id=index, cart=cart, product=product, quantity=index % 5 + 1) for index, product in enumerate(products)]
+    return orders, products, cart_items
+
+
+class Command(BaseCommand):
+    help = "Compares compiled many=True serializers with the normal DRF path on in memory payloads " \
+           "(default 100 orders of 50 items) and checks that their output is the same"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=REPEAT)
+        parser.add_argument('--orders', type=int, default=ORDERS)
+        parser.add_argument('--items', type=int, default=ITEMS_PER_ORDER, help='Items per order')
+
+    def measure(self, run, repeat, before=None):
+        durations = []
+        for _ in range(repeat):
+            if before:
+                before()
+            gc.collect()
+            gc.disable() # like timeit, collections of earlier runs are not counted
+            try:
+                start = time.perf_counter()
+                data = run()
+                durations.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+        return data, min(durations) * 1000
+
+    def handle(self, *args, **options):
+        orders, products, cart_items = make_payloads(options['orders'], options['items'])
+        context = {'user_id': None}
+        # (label, serializer class, objects)
+        scenarios = [
+            (f'{len(orders)} orders (admin)', OrderForAdminSerializer, orders),
+            (f'{len(orders)} orders', OrderSerializer, orders),
+            (f'{len(orders)} orders (summary)', OrderSummaryForAdminSerializer, orders),
+            (f'{len(products)} products', ProductSerializer, products),
+            (f'{len(cart_items)} cart items', CartItemSerializer, cart_items),
+        ]
+        self.stdout.write(f'{"":<28}{"normal ms":>12}{"warm ms":>12}{"compiled ms":>14}{"speedup":>10}')
+        for label, serializer_class, objects in scenarios:
+            # normal path: DRF ListSerializer, nested lists still use their own list serializers (product fragments)
+            normal = lambda: ListSerializer(objects, child=serializer_class(context=context)).data
+            compiled = lambda: serializer_class(objects, many=True, context=context).data
+            normal_data, normal_ms = self.measure(normal, options['repeat'], before=cache.clear)
+            _, warm_ms = self.measure(normal, options['repeat'])
+            compiled_data, compiled_ms = self.measure(compiled, options['repeat'])
+            if normal_data != compiled_data:
+                raise CommandError(f'Compiled output of {serializer_class.__name__} is not the same as the normal one')
+            self.stdout.write(f'{label:<28}{normal_ms:>12.2f}{warm_ms:>12.2f}{compiled_ms:>14.2f}{min(normal_ms, warm_ms) / compiled_ms:>9.1f}x')
@@ -0,0 +1,23 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from store.recommendations import RELATED_PRODUCTS_COUNT, build_related_products
+
+
+class Command(BaseCommand):
+    help = "Builds frequently bought together products from orders placed since the last build (run it from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Count co-purchases of all orders again')
+        parser.add_argument('--count', type=int, default=RELATED_PRODUCTS_COUNT, help='Related products kept per product')
+        parser.add_argument('--path', default=settings.STORE_CO_PURCHASES_PATH, help='Co-purchase counts file')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        last_order_id, products_count = build_related_products(options['path'], options['rebuild'], options['count'])
+        self.stdout.write(
+            f'related products of {products_count} products updated up to order {last_order_id} '
+            f'in {time.perf_counter() - start:.2f}s'
+        )
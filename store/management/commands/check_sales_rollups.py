@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.reports import check_sales_rollups
+
+
+MAX_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = "Compares the daily sales rollups with raw paid order items (up to the rollup high-water mark)"
+
+    def handle(self, *args, **options):
+        product_mismatches, category_mismatches = check_sales_rollups()
+        for date, product_id, rollup, raw in product_mismatches[:MAX_SHOWN]:
+            self.stderr.write(f'{date} product {product_id}: rollup {rollup}, order items {raw}')
+        for date, rollup, raw in category_mismatches[:MAX_SHOWN]:
+            self.stderr.write(f'{date} categories: rollup {rollup}, products rollup {raw}')
+
+        if product_mismatches or category_mismatches:
+            raise CommandError(
+                f'{len(product_mismatches)} product days and {len(category_mismatches)} category days do not match, '
+                f'run rebuild_sales_rollups'
+            )
+        self.stdout.write('sales rollups match paid order items')
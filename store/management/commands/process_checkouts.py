@@ -0,0 +1,58 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from store.checkout import process_checkout_jobs
+
+
+NUM_WORKERS = 4
+BATCH_SIZE = 50
+POLL_INTERVAL = 0.5
+
+
+class Command(BaseCommand):
+    help = "Places orders of async checkout jobs (STORE_ASYNC_CHECKOUT = True) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=NUM_WORKERS)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Exit when there is no pending job')
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        processed = []
+        lock = threading.Lock()
+
+        def work():
+            worker_id = uuid4().hex
+            try:
+                while not stop.is_set():
+                    count = process_checkout_jobs(worker_id, options['batch_size'])
+                    if count:
+                        with lock:
+                            processed.append(count)
+                    elif options['once']:
+                        return
+                    else:
+                        time.sleep(options['poll_interval'])
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=work) for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        duration = time.perf_counter() - start
+
+        self.stdout.write(f'{sum(processed)} checkout jobs in {len(processed)} batches processed in {duration:.2f} seconds')
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.reports import ROLLUP_BATCH_SIZE, rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = "Deletes the daily sales rollups and builds them again from all paid order items (archived ones too)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help='Orders per transaction')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        last_order_id = rebuild_sales_rollups(options['batch_size'])
+        self.stdout.write(f'sales rollups rebuilt up to order {last_order_id} in {time.perf_counter() - start:.2f}s')
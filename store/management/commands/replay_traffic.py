@@ -0,0 +1,269 @@
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+from uuid import uuid4
+
+import msgpack
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import NoReverseMatch, reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from store.models import Cart, CartItem, Category, CheckoutJob, Comment, Customer, Order, Product
+from store.traffic import read_traffic
+
+
+WORKERS = 8
+CUSTOMER_USERS = 20
+# url kwargs and body/query fields that are ids, filled with ids of rows in the local db
+FIELD_POOLS = {
+    'product_pk': 'product', 'product': 'product', 'category': 'category', 'cart_pk': 'cart', 'cart_id': 'cart',
+    'order_ids': 'order', 'customer': 'customer', 'approve': 'comment', 'reject': 'comment',
+}
+# pk of <basename>-detail urls
+BASENAME_POOLS = {
+    'product': 'product', 'category': 'category', 'cart': 'cart', 'cart-items': 'cart_item', 'order': 'order',
+    'customer': 'customer', 'product-comments': 'comment', 'checkout': 'checkout_job',
+}
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def latency_summary(latencies):
+    return {
+        'count': len(latencies),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+class Replayer:
+    def __init__(self, base_url, workers):
+        url = urlsplit(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.workers = workers
+        self.connections = threading.local() # keep-alive connection per worker
+        self.lock = threading.Lock()
+        self.words = [word for name in Product.objects.values_list('name', flat=True)[:1000] for word in name.lower().split()]
+        self.pools = {
+            'product': list(Product.objects.values_list('id', flat=True)),
+            'category': list(Category.objects.values_list('id', flat=True)),
+            'cart': [str(cart_id) for cart_id in Cart.objects.values_list('id', flat=True)],
+            'cart_item': list(CartItem.objects.values_list('id', flat=True)),
+            'order': list(Order.objects.values_list('id', flat=True)),
+            'customer': list(Customer.objects.values_list('id', flat=True)),
+            'comment': list(Comment.objects.values_list('id', flat=True)),
+            'checkout_job': [str(job_id) for job_id in CheckoutJob.objects.values_list('id', flat=True)],
+        }
+        staff = get_user_model().objects.filter(is_staff=True).first()
+        if staff is None or not self.pools['product']:
+            raise CommandError('Seed the local db with setup_fake_data and create a superuser first.')
+        self.staff_token = str(AccessToken.for_user(staff))
+        users = get_user_model().objects.filter(is_staff=False, customer__isnull=False)[:CUSTOMER_USERS]
+        self.customer_tokens = [str(AccessToken.for_user(user)) for user in users]
+
+    def pick(self, pool):
+        with self.lock:
+            return random.choice(self.pools[pool]) if self.pools[pool] else 0
+
+    def fill(self, shape, name=None):
+        if isinstance(shape, dict):
+            if '$list' in shape:
+                return [self.fill(shape['$item'], name) for _ in range(shape['$list'])]
+            return {key: self.fill(item, key) for key, item in shape.items()}
+        if name in FIELD_POOLS and shape in ['int', 'uuid']:
+            return self.pick(FIELD_POOLS[name])
+        if shape == 'int':
+            return random.randint(1, 20)
+        if shape == 'float':
+            return random.random() * 100
+        if shape == 'bool':
+            return random.random() < 0.5
+        if shape == 'uuid':
+            return str(uuid4())
+        if shape == 'str':
+            return random.choice(self.words) # searches find something in the fake data
+        return None
+
+    def build_request(self, record):
+        # (method, path, headers, body) with local ids, None for records that can not be replayed
+        basename = record['url_name'].rsplit('-', 1)[0] if record['url_name'] else None
+        kwargs = {}
+        for name, shape in record['kwargs'].items():
+            pool = BASENAME_POOLS.get(basename) if name == 'pk' else FIELD_POOLS.get(name)
+            kwargs[name] = self.pick(pool) if pool else self.fill(shape, name)
+        try:
+            path = reverse(record['url_name'], kwargs=kwargs)
+        except (NoReverseMatch, TypeError):
+            return None
+        query = {**record['query'], **{name: self.fill(shape, name) for name, shape in record['query_shape'].items()}}
+        if query:
+            path = f'{path}?{urlencode(query)}'
+
+        headers = {}
+        if record['auth']:
+            token = self.staff_token if record['staff'] or not self.customer_tokens else random.choice(self.customer_tokens)
+            headers['Authorization'] = f'JWT {token}'
+        if record['accept']:
+            headers['Accept'] = record['accept']
+        if record['idempotent']:
+            headers['Idempotency-Key'] = uuid4().hex
+        body = None
+        if record['body'] is not None and record['body'] != 'binary':
+            data = self.fill(record['body'])
+            if record['content_type'] == 'application/msgpack':
+                body = msgpack.packb(data)
+            else: # forms are sent as json, the views parse both
+                body = json.dumps(data).encode()
+            headers['Content-Type'] = record['content_type'] if record['content_type'] == 'application/msgpack' else 'application/json'
+        return record['method'], path, headers, body
+
+    def send(self, method, path, headers, body):
+        connection = getattr(self.connections, 'connection', None)
+        if connection is None:
+            connection = self.connections.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.connections.connection = None
+            return None, None, (time.perf_counter() - start) * 1000
+        return response.status, content, (time.perf_counter() - start) * 1000
+
+    def track(self, record, method, status, content):
+        # carts and checkout jobs made by the replay are used by later cart item, order and checkout requests
+        if method == 'POST' and status == 201 and record['url_name'] == 'cart-list':
+            with self.lock:
+                self.pools['cart'].append(json.loads(content)['id'])
+        elif method == 'POST' and status == 202 and record['url_name'] == 'order-list': # STORE_ASYNC_CHECKOUT
+            with self.lock:
+                self.pools['checkout_job'].append(json.loads(content)['id'])
+
+    def replay_one(self, record, scheduled):
+        request = self.build_request(record)
+        if request is None:
+            return None
+        lag = max(0, time.perf_counter() - scheduled) * 1000
+        status, content, latency = self.send(*request)
+        if status is not None:
+            self.track(record, request[0], status, content)
+        return {
+            'route': f'{record["method"]} {record["url_name"]}',
+            'status': status,
+            'latency_ms': latency,
+            'recorded_latency_ms': record['latency_ms'],
+            'lag_ms': lag,
+        }
+
+    def replay(self, records, speed):
+        # speed 2 sends them twice as fast as they were recorded, 0 sends them as fast as the workers can
+        start = time.perf_counter()
+        first_time = records[0]['time']
+        futures = []
+        with ThreadPoolExecutor(self.workers) as executor:
+            for record in records:
+                scheduled = start + (record['time'] - first_time) / speed if speed else start
+                wait = scheduled - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                futures.append(executor.submit(self.replay_one, record, scheduled))
+        duration = time.perf_counter() - start
+        return [result for result in (future.result() for future in futures) if result is not None], duration
+
+
+def summarize(results, duration, label, speed):
+    routes = defaultdict(list)
+    recorded = defaultdict(list)
+    statuses = defaultdict(int)
+    for result in results:
+        statuses[str(result['status'])] += 1
+        if result['status'] is not None:
+            routes[result['route']].append(result['latency_ms'])
+            recorded[result['route']].append(result['recorded_latency_ms'])
+    return {
+        'label': label,
+        'speed': speed,
+        'requests': len(results),
+        'duration_s': duration,
+        'throughput': len(results) / duration if duration else 0,
+        'errors': sum(1 for result in results if result['status'] is None or result['status'] >= 500),
+        'statuses': dict(statuses),
+        'latency': latency_summary([result['latency_ms'] for result in results if result['status'] is not None]),
+        'lag_p95_ms': percentile([result['lag_ms'] for result in results], 95), # server or workers did not keep up
+        'routes': {
+            route: {**latency_summary(latencies), 'recorded_p50': percentile(recorded[route], 50)}
+            for route, latencies in sorted(routes.items())
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = "Replays captured traffic (TrafficCaptureMiddleware) against a local server seeded with setup_fake_data. " \
+           "Save the results of two builds with --save and compare them with --compare a.json b.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='NDJSON files or directories (default: STORE_TRAFFIC_DIR)')
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--speed', type=float, default=1.0, help='Speed multiplier, 0 is as fast as possible')
+        parser.add_argument('--workers', type=int, default=WORKERS)
+        parser.add_argument('--limit', type=int, help='Replay just the first N records')
+        parser.add_argument('--label', default='', help='Build name in the saved results')
+        parser.add_argument('--save', help='Write the results to this json file')
+        parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two saved results, nothing is replayed')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            before, after = [json.loads(open(path).read()) for path in options['compare']]
+            self.print_comparison(before, after)
+            return
+
+        records = read_traffic(options['paths'] or [settings.STORE_TRAFFIC_DIR])[:options['limit']]
+        if not records:
+            raise CommandError('There is no captured traffic. Set STORE_TRAFFIC_SAMPLE_RATE to capture some.')
+        replayer = Replayer(options['base_url'], options['workers'])
+        results, duration = replayer.replay(records, options['speed'])
+        summary = summarize(results, duration, options['label'], options['speed'])
+        self.print_summary(summary)
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(summary, file, indent=2)
+
+    def print_summary(self, summary):
+        latency = summary['latency']
+        self.stdout.write(
+            f'{summary["requests"]} requests in {summary["duration_s"]:.1f}s, {summary["throughput"]:.1f} req/s, '
+            f'{summary["errors"]} errors, statuses {summary["statuses"]}, lag p95 {summary["lag_p95_ms"]:.0f} ms'
+        )
+        self.stdout.write(f'latency p50 {latency["p50"]:.1f} ms, p95 {latency["p95"]:.1f} ms, p99 {latency["p99"]:.1f} ms')
+        self.stdout.write(f'{"":<40}{"count":>8}{"p50 ms":>10}{"p95 ms":>10}{"recorded p50":>14}')
+        for route, stats in summary['routes'].items():
+            self.stdout.write(f'{route:<40}{stats["count"]:>8}{stats["p50"]:>10.1f}{stats["p95"]:>10.1f}{stats["recorded_p50"]:>14.1f}')
+
+    def print_comparison(self, before, after):
+        def change(old, new):
+            return f'{(new - old) / old * 100:+.0f}%' if old else ''
+
+        self.stdout.write(f'{"":<40}{before["label"] or "before":>14}{after["label"] or "after":>14}{"change":>10}')
+        for name, key in [('throughput req/s', 'throughput'), ('errors', 'errors')]:
+            self.stdout.write(f'{name:<40}{before[key]:>14.1f}{after[key]:>14.1f}{change(before[key], after[key]):>10}')
+        for percent in ['p50', 'p95', 'p99']:
+            old, new = before['latency'][percent], after['latency'][percent]
+            self.stdout.write(f'{"latency " + percent + " ms":<40}{old:>14.1f}{new:>14.1f}{change(old, new):>10}')
+        for route in sorted(set(before['routes']) | set(after['routes'])):
+            old, new = before['routes'].get(route, {}).get('p50', 0), after['routes'].get(route, {}).get('p50', 0)
+            self.stdout.write(f'{route + " p50 ms":<40}{old:>14.1f}{new:>14.1f}{change(old, new):>10}')
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.reports import ROLLUP_BATCH_SIZE, SALES_ROLLUP, rollup_sales
+from store.models import RollupState
+
+
+class Command(BaseCommand):
+    help = "Adds paid orders placed since the last run to the daily sales rollups (run it from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help='Orders per transaction')
+
+    def handle(self, *args, **options):
+        state = RollupState.objects.filter(name=SALES_ROLLUP).first()
+        first_order_id = state.last_order_id if state else 0
+        start = time.perf_counter()
+        last_order_id = rollup_sales(options['batch_size'])
+        self.stdout.write(f'orders {first_order_id + 1}-{last_order_id} rolled up in {time.perf_counter() - start:.2f}s')
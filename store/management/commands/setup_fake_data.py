@@ -2,11 +2,14 @@
 import random
 from faker import Faker
 from datetime import datetime, timedelta
+from pathlib import Path
 
+from django.conf import settings
 from django.db import transaction
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 
-from store.models import Address, Cart, CartItem, Category, Comment, Order, OrderItem, Product, Discount, Customer
+from store.models import Address, ArchivedOrder, ArchivedOrderItem, Cart, CartItem, Category, CheckoutJob, Comment, Order, OrderItem, Product, Discount, Customer, RollupState
 from store.factories import (
     CartFactory,
     CategoryFactory,
@@ -22,7 +25,7 @@ from store.factories import (
 
 faker = Faker()
 
-list_of_models = [CartItem, Cart, OrderItem, Order, Product, Category, Comment, Discount, Address, Customer]
+list_of_models = [CheckoutJob, ArchivedOrderItem, ArchivedOrder, CartItem, Cart, OrderItem, Order, Product, Category, Comment, Discount, RollupState]
 
 NUM_CATEGORIES = 100
 NUM_DISCOUNTS = 10
@@ -32,7 +35,7 @@ NUM_ORDERS = 30
 NUM_CARTS = 100
 
 class Command(BaseCommand):
-    help = "Generates fake data"
+    help = "Deletes the store data and the users made by this command, then generates fake data"
 
     @transaction.atomic
     def handle(self, *args, **kwargs):
@@ -40,6 +43,16 @@ class Command(BaseCommand):
         models = list_of_models
         for m in models:
             m.objects.all().delete()
+        # customers and users of UserFactory, other users (staff, ones of replay_traffic tokens) keep their customer
+        fake_users = get_user_model().objects.filter(
+            is_staff=False, is_superuser=False, username__startswith='customer', email__endswith='@example.com',
+        )
+        Address.objects.filter(customer__user__in=fake_users).delete()
+        Customer.objects.filter(user__in=fake_users).delete()
+        fake_users.delete()
+        for user in get_user_model().objects.filter(customer__isnull=True): # customers deleted by older versions of this command
+            Customer.objects.create(user=user)
+        Path(settings.STORE_CO_PURCHASES_PATH).unlink(missing_ok=True) # co-purchases of the deleted orders
 
         self.stdout.write("Creating new data...\n")
 
@@ -78,7 +91,8 @@ class Command(BaseCommand):
         # Orders data
         print(f"Adding {NUM_ORDERS} orders...", end='')
         all_orders = [OrderFactory(
-            customer_id=random.choice(all_customers).id
+            customer_id=random.choice(all_customers).id,
+            status=random.choice([status for status, _ in Order.ORDER_STATUS]), # rollups and best sellers count paid ones
         ) for _ in range(NUM_ORDERS)]
         for order in all_orders:
             order.datetime_created = faker.date_time_ad(start_datetime=datetime(2022,6,1), end_datetime=datetime(2023,1,1))
@@ -96,6 +110,7 @@ class Command(BaseCommand):
                     unit_price=product.unit_price,
                 )
                 all_order_items.append(order_item)
+            order.update_totals() # total_price and items_count of the list and filters
         print('DONE')
 
         # Comments data
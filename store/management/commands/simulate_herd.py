@@ -0,0 +1,77 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from rest_framework.test import APIClient
+
+from store.caches import bump_catalog_generation
+from store.models import Product
+
+
+NUM_THREADS = 50
+
+
+class Command(BaseCommand):
+    help = "Sends many concurrent requests to one product/category url right after its cache gets cold or stale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Default: detail of the first product')
+        parser.add_argument('--threads', type=int, default=NUM_THREADS)
+        parser.add_argument('--cold', action='store_true', help='Clear the cache instead of making it stale')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('There is no superuser to run requests with.')
+        url = options['url'] or f"/store/products/{Product.objects.values_list('id', flat=True).first()}/"
+
+        settings.DEBUG = False
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'localhost']
+
+        client = APIClient(SERVER_NAME='localhost')
+        client.force_authenticate(user)
+        client.get(url)
+        if options['cold']:
+            cache.clear()
+        else:
+            bump_catalog_generation() # like a product was edited
+
+        barrier = threading.Barrier(options['threads'])
+        lock = threading.Lock()
+        results = {'queries': 0, 'durations': [], 'statuses': []}
+
+        def count_queries(execute, sql, params, many, context):
+            with lock:
+                results['queries'] += 1
+            return execute(sql, params, many, context)
+
+        def send_request():
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user)
+            try:
+                with connection.execute_wrapper(count_queries):
+                    barrier.wait()
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    duration = time.perf_counter() - start
+                with lock:
+                    results['durations'].append(duration)
+                    results['statuses'].append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=send_request) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        durations = sorted(results['durations'])
+        self.stdout.write(f'{len(durations)} requests to {url}')
+        self.stdout.write(f"statuses: {sorted(set(results['statuses']))}")
+        self.stdout.write(f"db queries: {results['queries']}")
+        self.stdout.write(f'p50: {durations[len(durations) // 2] * 1000:.2f} ms, max: {durations[-1] * 1000:.2f} ms')
@@ -0,0 +1,84 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.models import Cart, CheckoutJob, Order
+from store.orders import change_orders_status
+
+
+CHUNK_SIZE = 1000
+PAUSE = 0.5
+
+
+class Command(BaseCommand):
+    help = "Deletes stale carts and cancels stale unpaid orders in small chunks (run it from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cart-days', type=float, help=f'Default is STORE_CART_TTL ({settings.STORE_CART_TTL.days} days)')
+        parser.add_argument('--order-days', type=float, help=f'Default is STORE_UNPAID_ORDER_TTL ({settings.STORE_UNPAID_ORDER_TTL.days} days)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=PAUSE, help='Seconds to sleep between chunks, so locks are short and replicas can catch up')
+        parser.add_argument('--max-chunks', type=int, help='Stop after this many chunks of every table')
+
+    def sweep(self, label, get_chunk, process_chunk, options):
+        # get_chunk returns ids of the next chunk, process_chunk returns number of changed rows
+        processed = 0
+        chunks = 0
+        start = time.perf_counter()
+        paused = 0
+        while options['max_chunks'] is None or chunks < options['max_chunks']:
+            ids = get_chunk(options['chunk_size'])
+            if not ids:
+                break
+            processed += process_chunk(ids)
+            chunks += 1
+            if len(ids) < options['chunk_size']:
+                break
+            time.sleep(options['pause'])
+            paused += options['pause']
+        duration = time.perf_counter() - start
+        working = duration - paused
+        self.stdout.write(
+            f'{label}: {processed} rows in {chunks} chunks, {duration:.2f}s '
+            f'({processed / working if working else 0:.0f} rows/s without pauses)'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cart_ttl = timedelta(days=options['cart_days']) if options['cart_days'] is not None else settings.STORE_CART_TTL
+        order_ttl = timedelta(days=options['order_days']) if options['order_days'] is not None else settings.STORE_UNPAID_ORDER_TTL
+
+        # carts of pending async checkouts are kept, process_checkouts still needs them
+        checkout_cart_ids = CheckoutJob.objects \
+                                       .filter(status__in=[CheckoutJob.CHECKOUT_STATUS_PENDING, CheckoutJob.CHECKOUT_STATUS_PROCESSING]) \
+                                       .values('cart_id')
+        stale_carts = Cart.objects \
+                          .filter(created_at__lt=now - cart_ttl) \
+                          .exclude(id__in=checkout_cart_ids) \
+                          .order_by('created_at')
+
+        def delete_carts(cart_ids):
+            # cart items are deleted with them (cascade)
+            return Cart.objects.filter(id__in=cart_ids).delete()[1].get(Cart._meta.label, 0)
+
+        self.sweep(
+            'stale carts deleted',
+            lambda chunk_size: list(stale_carts.values_list('id', flat=True)[:chunk_size]),
+            delete_carts,
+            options,
+        )
+
+        # uses order_status_created_idx
+        stale_orders = Order.objects \
+                            .filter(status=Order.ORDER_STATUS_UNPAID, datetime_created__lt=now - order_ttl) \
+                            .order_by('datetime_created')
+
+        self.sweep(
+            'stale unpaid orders canceled',
+            lambda chunk_size: list(stale_orders.values_list('id', flat=True)[:chunk_size]),
+            lambda order_ids: len(change_orders_status(order_ids, Order.ORDER_STATUS_CANCELED, sender=self.__class__)),
+            options,
+        )
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.reports import ROLLUP_BATCH_SIZE, rebuild_best_sellers, update_best_sellers
+
+
+class Command(BaseCommand):
+    help = "Updates top_product and best_sellers of categories from paid orders placed since the last run (run it from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help='Orders per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Count all paid order items again and refresh every category')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['rebuild']:
+            last_order_id = rebuild_best_sellers()
+            self.stdout.write(f'best sellers rebuilt up to order {last_order_id} in {time.perf_counter() - start:.2f}s')
+            return
+        last_order_id, categories_count = update_best_sellers(options['batch_size'])
+        self.stdout.write(f'best sellers updated up to order {last_order_id}, {categories_count} categories refreshed in {time.perf_counter() - start:.2f}s')
@@ -0,0 +1,87 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from rest_framework.test import APIClient
+
+from store.models import Category, Product
+
+
+# used when there is no --config file
+DEFAULT_CONFIG = {
+    'pages': 3,
+    'orderings': ['', 'unit_price', '-unit_price', 'name'],
+    'filters': [{}],
+    'top_products': 100,
+}
+
+
+class Command(BaseCommand):
+    help = "Fills product and category read caches after deploy"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', help='JSON file like {"pages": 3, "orderings": ["", "-unit_price"], "filters": [{"inventory__gt": 0}], "top_products": 100}')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--host', default='localhost', help='Host name to send the requests with, cache keys do not depend on it')
+        parser.add_argument('--secure', action='store_true', help='Site is served over https')
+
+    def get_config(self, path):
+        config = dict(DEFAULT_CONFIG)
+        if path:
+            with open(path) as config_file:
+                config.update(json.load(config_file))
+        return config
+
+    def get_urls(self, config):
+        urls = ['/store/categories/']
+        urls += [f'/store/categories/{category_id}/' for category_id in Category.objects.values_list('id', flat=True)]
+
+        for filters in config['filters']:
+            for ordering in config['orderings']:
+                for page in range(1, config['pages'] + 1):
+                    params = dict(filters)
+                    if ordering:
+                        params['ordering'] = ordering
+                    if page > 1:
+                        params['page'] = page
+                    urls.append(f'/store/products/?{urlencode(params)}' if params else '/store/products/')
+
+        # best sellers are the hottest product pages
+        top_products = Product.objects \
+                              .annotate(order_items_count=Count('order_items')) \
+                              .order_by('-order_items_count') \
+                              .values_list('id', flat=True)[:config['top_products']]
+        urls += [f'/store/products/{product_id}/' for product_id in top_products]
+        return urls
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('There is no superuser to send requests with.')
+
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, options['host']]
+        urls = self.get_urls(self.get_config(options['config']))
+
+        def warm(url):
+            client = APIClient(SERVER_NAME=options['host'], secure=options['secure'])
+            client.force_authenticate(user)
+            try:
+                return url, client.get(url).status_code
+            finally:
+                connections.close_all()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            results = list(executor.map(warm, urls))
+        duration = time.perf_counter() - start
+
+        for url, status_code in results:
+            if status_code != 200:
+                self.stderr.write(f'{url} returned {status_code}')
+        self.stdout.write(f'{len(urls)} urls warmed in {duration:.2f} seconds with {options["workers"]} workers')
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:09
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_alter_customer_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('cart_id', models.UUIDField()),
+                ('status', models.CharField(choices=[('p', 'Pending'), ('r', 'Processing'), ('d', 'Done'), ('f', 'Failed')], default='p', max_length=1)),
+                ('claimed_by', models.CharField(blank=True, max_length=32)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='checkout_jobs', to='store.customer')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'datetime_created'], name='store_check_status_36392a_idx')],
+            },
+        ),
+    ]
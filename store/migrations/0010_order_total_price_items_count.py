@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:12
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    order_items = OrderItem.objects.filter(order=models.OuterRef('pk')).values('order')
+    Order.objects.update(
+        items_count=Coalesce(
+            models.Subquery(order_items.annotate(count=models.Count('id')).values('count')),
+            0,
+        ),
+        total_price=Coalesce(
+            models.Subquery(order_items.annotate(
+                total=models.Sum(models.F('quantity') * models.F('unit_price'), output_field=models.DecimalField()),
+            ).values('total')),
+            models.Value(0),
+            output_field=models.DecimalField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_checkoutjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
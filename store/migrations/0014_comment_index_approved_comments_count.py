@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_approved_comments_count(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    Comment = apps.get_model('store', 'Comment')
+    approved_comments = Comment.objects.filter(product=models.OuterRef('pk'), status='a').values('product')
+    Product.objects.update(
+        approved_comments_count=Coalesce(
+            models.Subquery(approved_comments.annotate(count=models.Count('id')).values('count')),
+            0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_archive_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='approved_comments_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', 'status', '-datetime_created'], name='comment_product_status_idx'),
+        ),
+        migrations.RunPython(fill_approved_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:02
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def set_claimed_at(apps, schema_editor):
+    # jobs that are processing now can be reclaimed after the timeout too
+    CheckoutJob = apps.get_model('store', 'CheckoutJob')
+    CheckoutJob.objects.filter(status='r').update(claimed_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_related_products'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkoutjob',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_claimed_at, migrations.RunPython.noop),
+    ]
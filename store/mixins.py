@@ -0,0 +1,187 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.exceptions import FieldDoesNotExist
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from . import caches
+from .renderers import ColumnarJSONRenderer
+
+
+class DynamicFieldsMixin:
+    # ?fields=id,name,price ?exclude=description ?expand=category,items.product on GET requests.
+    # serializer drops/expands fields and get_queryset use sparse_queryset() / wants() / expand_queryset()
+    # so db load just what is shown
+
+    def get_fieldset(self):
+        if self.request is None or self.request.method not in ['GET', 'HEAD']:
+            return {}
+        fieldset = {}
+        for param in ['fields', 'exclude', 'expand']:
+            value = self.request.query_params.get(param)
+            if value:
+                fieldset[param] = {name.strip() for name in value.split(',') if name.strip()}
+        return fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        context = kwargs.pop('context', None) or self.get_serializer_context()
+        kwargs['context'] = {**context, **self.get_fieldset()}
+        return super().get_serializer(*args, **kwargs)
+
+    def get_model_sources(self):
+        # model attributes that serializer shows, None when serializer can not tell it
+        if not hasattr(self, '_model_sources'):
+            serializer_class = self.get_serializer_class()
+            if hasattr(serializer_class, 'get_model_sources'):
+                self._model_sources = serializer_class(context=self.get_fieldset()).get_model_sources()
+            else:
+                self._model_sources = None
+        return self._model_sources
+
+    def wants(self, source):
+        sources = self.get_model_sources()
+        return sources is None or source in sources
+
+    def sparse_queryset(self, queryset):
+        fieldset = self.get_fieldset()
+        sources = self.get_model_sources()
+        if sources is None or not ('fields' in fieldset or 'exclude' in fieldset):
+            return queryset
+        concrete_fields = {field.name for field in queryset.model._meta.concrete_fields}
+        columns = [source for source in sources if source in concrete_fields]
+        return queryset.only(queryset.model._meta.pk.name, *columns)
+
+    def expand_queryset(self, queryset):
+        # ?expand=items.product.category --> prefetch items, items__product, items__product__category
+        # single relations are joined with select_related until the path meets a many relation
+        expand = self.get_fieldset().get('expand')
+        if not expand:
+            return queryset
+        select_related, prefetch_related = [], []
+        for path in sorted(expand):
+            field_names = path.split('.')
+            if not self.wants(field_names[0]):
+                continue
+            model = queryset.model
+            lookup = []
+            many = False
+            for field_name in field_names:
+                try:
+                    field = model._meta.get_field(field_name)
+                except FieldDoesNotExist:
+                    break
+                if not field.is_relation:
+                    break
+                lookup.append(field_name)
+                many = many or field.one_to_many or field.many_to_many
+                (prefetch_related if many else select_related).append('__'.join(lookup))
+                model = field.related_model
+        return queryset.select_related(*select_related).prefetch_related(*prefetch_related)
+
+
+class CachedReadMixin:
+    # list and retrieve responses are kept in cache (stale after any catalog change, see caches.get_or_compute)
+
+    def get_read_cache_key(self):
+        # same key for any host and order of query params, so warm_caches entries are used by real requests
+        query = urlencode(sorted(self.request.query_params.lists()), doseq=True)
+        url = f'{self.request.path}?{query}'
+        renderer_format = self.request.accepted_renderer.format # Accept header may change the data (columnar)
+        return f'read:{self.basename}:{renderer_format}:{hashlib.md5(url.encode()).hexdigest()}'
+
+    def get_links_base(self):
+        return self.request.build_absolute_uri('/')[:-1] # scheme and host
+
+    def list(self, request, *args, **kwargs):
+        # next/previous links of pagination are cached without host, every request gets its own host in them
+        data = caches.get_or_compute(
+            self.get_read_cache_key(),
+            lambda: self.change_links(super(CachedReadMixin, self).list(request, *args, **kwargs).data, self.get_links_base(), ''),
+        )
+        return Response(self.change_links(data, '', self.get_links_base()))
+
+    def change_links(self, data, old_base, new_base):
+        if not isinstance(data, dict) or 'next' not in data:
+            return data
+        data = dict(data)
+        for name in ['next', 'previous']:
+            if data.get(name) and data[name].startswith(f'{old_base}/'):
+                data[name] = new_base + data[name][len(old_base):]
+        return data
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(caches.get_or_compute(
+            self.get_read_cache_key(),
+            lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs).data,
+        ))
+
+
+class ArchiveFallbackMixin:
+    # retrieve looks in archive_model when the row is not in the hot table any more (moved by archive_history).
+    # archive models have the same field names, so get_queryset() just starts from get_model() and the
+    # same serializers work. archived rows are read only
+    model = None
+    archive_model = None
+    archived = False
+
+    def get_model(self):
+        return self.archive_model if self.archived else self.model
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.archived or self.request.method not in SAFE_METHODS:
+                raise
+        self.archived = True
+        # filter backends are made for the hot model, a detail lookup does not need them
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        obj = get_object_or_404(self.get_queryset(), **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+
+class ColumnarListMixin:
+    # list in columnar format (?format=columnar or Accept: application/vnd.store.columnar+json):
+    # {'columns': [...], 'rows': [[...], ...]} made from values_list() tuples, no model object or serializer per row.
+    # columnar_fields are (column, lookup) or (column, lookup, function for the value), nested fields are 'a.b'
+    columnar_fields = []
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
+
+    def is_columnar(self):
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return renderer is not None and renderer.format == ColumnarJSONRenderer.format
+
+    def get_columnar_fields(self):
+        # ?fields= and ?exclude= of DynamicFieldsMixin work on top level names, id is always there
+        fieldset = self.get_fieldset() if hasattr(self, 'get_fieldset') else {}
+        fields = self.columnar_fields
+        if 'fields' in fieldset:
+            fields = [field for field in fields if field[0] == 'id' or field[0].split('.')[0] in fieldset['fields']]
+        if 'exclude' in fieldset:
+            fields = [field for field in fields if field[0] == 'id' or field[0].split('.')[0] not in fieldset['exclude']]
+        return fields
+
+    def get_columnar_data(self, rows, fields):
+        converters = [(index, field[2]) for index, field in enumerate(fields) if len(field) > 2]
+        if converters:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for index, converter in converters:
+                    row[index] = converter(row[index])
+        return {'columns': [field[0] for field in fields], 'rows': rows}
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_columnar():
+            return super().list(request, *args, **kwargs)
+        fields = self.get_columnar_fields()
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None) # values_list rows have nothing to prefetch
+        rows = queryset.values_list(*[field[1] for field in fields])
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_columnar_data(page, fields))
+        return Response(self.get_columnar_data(list(rows), fields))
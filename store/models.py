@@ -8,6 +8,8 @@ class Category(models.Model):
     title = models.CharField(max_length=255)
     description = models.CharField(max_length=500, blank=True)
     top_product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    # top_product and best_sellers ([{'id', 'name', 'units'}, ...]) are kept by update_best_sellers command
+    best_sellers = models.JSONField(default=list, blank=True)
 
     def __str__(self):
         return self.title
@@ -28,6 +30,7 @@ class Product(models.Model):
     datetime_created = models.DateTimeField(auto_now_add=True)
     datetime_modified = models.DateTimeField(auto_now=True)
     discounts = models.ManyToManyField(Discount, blank=True)
+    approved_comments_count = models.PositiveIntegerField(default=0) # kept by refresh_approved_comments_counts()
 
 
 class Customer(models.Model):
@@ -68,10 +71,36 @@ class Order(models.Model):
         (ORDER_STATUS_UNPAID,'Unpaid'),
         (ORDER_STATUS_CANCELED,'Canceled'),
     ]
+    ORDER_STATUS_TRANSITIONS = { # status: statuses it can change to
+        ORDER_STATUS_UNPAID: [ORDER_STATUS_PAID, ORDER_STATUS_CANCELED],
+        ORDER_STATUS_PAID: [ORDER_STATUS_CANCELED],
+        ORDER_STATUS_CANCELED: [],
+    }
     
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='orders')
     datetime_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=1, choices=ORDER_STATUS, default=ORDER_STATUS_UNPAID)
+    # saved at checkout so order lists dont need items, update_totals() after changing items
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    items_count = models.PositiveIntegerField(default=0)
+
+    def update_totals(self):
+        totals = self.items.aggregate(
+            items_count=models.Count('id'),
+            total_price=models.Sum(models.F('quantity') * models.F('unit_price'), output_field=models.DecimalField()),
+        )
+        self.items_count = totals['items_count']
+        self.total_price = totals['total_price'] or 0
+        self.save(update_fields=['items_count', 'total_price'])
+
+    class Meta:
+        indexes = [
+            # staff order list filters (OrderFilter) and default ordering
+            models.Index(fields=['status', '-datetime_created'], name='order_status_created_idx'),
+            models.Index(fields=['-datetime_created'], name='order_created_idx'),
+            # orders of one customer, customers see just their orders
+            models.Index(fields=['customer', '-datetime_created'], name='order_customer_created_idx'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -99,11 +128,22 @@ class Comment(models.Model):
     body = models.TextField()
     datetime_created = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=2, choices=COMMENT_STATUS, default=COMMENT_STATUS_WAITING)
+    # moderation queue, a waiting comment is given to one moderator until claimed_at + MODERATION_CLAIM_TIMEOUT
+    claimed_by = models.CharField(max_length=32, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # approved comments of a product newest first (comments list)
+            models.Index(fields=['product', 'status', '-datetime_created', '-id'], name='comment_product_status_idx'),
+            # waiting comments oldest first (moderation queue)
+            models.Index(fields=['status', 'id'], name='comment_status_idx'),
+        ]
 
 
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True) # sweep_stale finds old carts with it
 
 
 class CartItem(models.Model):
@@ -113,3 +153,112 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = [['cart', 'product']]
+
+
+class CheckoutJob(models.Model): # async checkout, order is placed by process_checkouts command
+    CHECKOUT_STATUS_PENDING = 'p'
+    CHECKOUT_STATUS_PROCESSING = 'r'
+    CHECKOUT_STATUS_DONE = 'd'
+    CHECKOUT_STATUS_FAILED = 'f'
+    CHECKOUT_STATUS = [
+        (CHECKOUT_STATUS_PENDING, 'Pending'),
+        (CHECKOUT_STATUS_PROCESSING, 'Processing'),
+        (CHECKOUT_STATUS_DONE, 'Done'),
+        (CHECKOUT_STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4)
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='checkout_jobs')
+    cart_id = models.UUIDField() # not foreign key, cart is deleted after checkout
+    status = models.CharField(max_length=1, choices=CHECKOUT_STATUS, default=CHECKOUT_STATUS_PENDING)
+    claimed_by = models.CharField(max_length=32, blank=True) # worker that is processing it
+    claimed_at = models.DateTimeField(null=True, blank=True) # other workers take it after CHECKOUT_CLAIM_TIMEOUT
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.CharField(max_length=255, blank=True)
+    datetime_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'datetime_created']), # workers take oldest pending jobs
+        ]
+
+
+# archive_history command moves closed orders and moderated comments here, hot tables and their indexes stay small.
+# same field names as the hot models, so the same serializers show them (see ArchiveFallbackMixin)
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True) # id of the hot order
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='archived_orders')
+    datetime_created = models.DateTimeField()
+    status = models.CharField(max_length=1, choices=Order.ORDER_STATUS)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    items_count = models.PositiveIntegerField(default=0)
+    datetime_archived = models.DateTimeField(auto_now_add=True)
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='archived_order_items')
+    quantity = models.PositiveSmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+
+
+class ArchivedComment(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='archived_comments')
+    name = models.CharField(max_length=255)
+    body = models.TextField()
+    datetime_created = models.DateTimeField()
+    status = models.CharField(max_length=2, choices=Comment.COMMENT_STATUS)
+    datetime_archived = models.DateTimeField(auto_now_add=True)
+
+
+# sales rollups, filled by rollup_sales command from paid orders (see store/reports.py)
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['date', 'product']]
+        indexes = [
+            models.Index(fields=['product', 'date']), # sales of one product
+        ]
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['date', 'category']]
+
+
+class ProductSalesTotal(models.Model): # units sold of a product in all time, for best sellers of categories
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+') # copy of product category
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', '-units'], name='sales_total_category_units_idx'),
+        ]
+
+
+class RelatedProduct(models.Model): # frequently bought together, filled by build_related_products command
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField() # 0 is the most bought together
+    score = models.PositiveIntegerField() # orders that have both products
+
+    class Meta:
+        unique_together = [['product', 'rank']] # related products of a product in one index range
+
+
+class RollupState(models.Model): # high-water mark of a job that reads new orders
+    name = models.CharField(max_length=50, primary_key=True)
+    last_order_id = models.BigIntegerField(default=0) # orders up to this id are processed
+    datetime_modified = models.DateTimeField(auto_now=True)
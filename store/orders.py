@@ -0,0 +1,31 @@
+from django.db import transaction
+
+from .models import Order
+from .signals import orders_status_changed
+
+
+STATUS_CHUNK_SIZE = 1000
+
+
+def change_orders_status(order_ids, status, chunk_size=STATUS_CHUNK_SIZE, sender=None):
+    # one UPDATE for every chunk, orders that can not change to this status are skipped.
+    # sends one orders_status_changed signal for every chunk (not a signal per order) in the transaction of the chunk,
+    # so rollups are changed together with the status
+    source_statuses = [
+        source_status for source_status, next_statuses in Order.ORDER_STATUS_TRANSITIONS.items()
+        if status in next_statuses
+    ]
+    order_ids = list(order_ids)
+    changed_order_ids = []
+    for start in range(0, len(order_ids), chunk_size):
+        with transaction.atomic():
+            chunk = Order.objects.filter(id__in=order_ids[start:start + chunk_size], status__in=source_statuses)
+            previous_statuses = dict(chunk.select_for_update().values_list('id', 'status'))
+            if not previous_statuses:
+                continue
+            Order.objects.filter(id__in=previous_statuses).update(status=status)
+            orders_status_changed.send_robust(
+                sender or Order, status=status, order_ids=list(previous_statuses), previous_statuses=previous_statuses,
+            )
+        changed_order_ids += list(previous_statuses)
+    return changed_order_ids
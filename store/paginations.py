@@ -1,4 +1,11 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+    page_size_query_param = 'page_size' # big pages for exports (see ?format=columnar)
+    max_page_size = 1000
+
+
+class CommentPagination(CursorPagination): # keyset pagination, deep pages are as fast as the first one
+    page_size = 10
+    ordering = ('-datetime_created', '-id') # id breaks ties of comments created at the same time
@@ -0,0 +1,146 @@
+import cProfile
+import os
+import random
+import secrets
+import time
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+
+PROFILE_HEADER = 'X-Store-Profile'
+PROFILE_ID_HEADER = 'X-Store-Profile-Id' # response header, name of the saved profile
+PROFILE_SUFFIX = '.prof'
+TOKEN_SALT = 'store.profiling'
+
+# profile file names: <time>-<random>.<view>.<action>.<duration>ms.<status>.prof, so listing needs no index
+PROFILE_TIME_FORMAT = '%Y%m%dT%H%M%S%f'
+
+
+def make_profile_token(user_id):
+    # value of the X-Store-Profile header, made for staff by the profiles/token/ endpoint
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user_id))
+
+
+def is_valid_profile_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.STORE_PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature: # expired too
+        return False
+    return True
+
+
+def get_view_tag(request):
+    # (viewset or view name, action) of the resolved url
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', request.method.lower()
+    view = getattr(match.func, 'cls', None) or match.func
+    actions = getattr(match.func, 'actions', None) or {} # viewsets: {'get': 'list', ...}
+    return getattr(view, '__name__', type(view).__name__), actions.get(request.method.lower(), request.method.lower())
+
+
+def profile_name(view, action, duration, status_code):
+    stamp = f'{timezone.now():{PROFILE_TIME_FORMAT}}-{secrets.token_hex(2)}'
+    return f'{stamp}.{view}.{action}.{round(duration * 1000)}ms.{status_code}{PROFILE_SUFFIX}'
+
+
+def parse_profile_name(name):
+    stamp, view, action, duration, status_code = name[:-len(PROFILE_SUFFIX)].split('.')
+    return {
+        'id': name,
+        'view': view,
+        'action': action,
+        'duration_ms': int(duration[:-2]),
+        'status': int(status_code),
+        'datetime_created': datetime.strptime(stamp.split('-')[0], PROFILE_TIME_FORMAT).replace(tzinfo=dt_timezone.utc),
+    }
+
+
+def list_profiles():
+    # newest first
+    directory = Path(settings.STORE_PROFILES_DIR)
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in directory.glob(f'*{PROFILE_SUFFIX}'):
+        try:
+            profiles.append({**parse_profile_name(path.name), 'size': path.stat().st_size})
+        except (ValueError, FileNotFoundError): # not ours, or deleted by the disk cap meanwhile
+            continue
+    return sorted(profiles, key=lambda profile: profile['id'], reverse=True)
+
+
+def get_profile_path(name):
+    # None for names that are not a saved profile (no ../ or other files)
+    directory = Path(settings.STORE_PROFILES_DIR)
+    path = directory / name
+    if path.parent != directory or not name.endswith(PROFILE_SUFFIX) or not path.is_file():
+        return None
+    return path
+
+
+def enforce_disk_cap(directory, max_bytes):
+    # oldest profiles are deleted until all of them fit in max_bytes
+    paths = []
+    for path in directory.glob(f'*{PROFILE_SUFFIX}'):
+        try:
+            paths.append((path.name, path.stat().st_size, path))
+        except FileNotFoundError:
+            continue
+    total = sum(size for _, size, _ in paths)
+    for _, size, path in sorted(paths):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except FileNotFoundError: # another worker deleted it
+            pass
+        total -= size
+
+
+def save_profile(profile, request, response, duration):
+    directory = Path(settings.STORE_PROFILES_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    view, action = get_view_tag(request)
+    name = profile_name(view, action, duration, response.status_code)
+    temp_path = directory / f'{name}.tmp' # never listed half written
+    profile.dump_stats(temp_path)
+    os.replace(temp_path, directory / name)
+    enforce_disk_cap(directory, settings.STORE_PROFILES_MAX_BYTES)
+    return name
+
+
+class ProfilingMiddleware:
+    # cProfile of STORE_PROFILE_SAMPLE_RATE of requests and of every request with a valid X-Store-Profile header.
+    # other requests cost a header lookup and a random() call
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.STORE_PROFILE_SAMPLE_RATE
+
+    def should_profile(self, request):
+        token = request.META.get('HTTP_X_STORE_PROFILE')
+        if token is not None:
+            return is_valid_profile_token(token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: # another profiler is active in this process
+            return self.get_response(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.disable()
+        duration = time.perf_counter() - start
+        response[PROFILE_ID_HEADER] = save_profile(profile, request, response, duration)
+        return response
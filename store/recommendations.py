@@ -0,0 +1,142 @@
+import itertools
+import os
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import ArchivedOrderItem, Order, OrderItem, Product, RelatedProduct, RollupState
+from .reports import last_rollup_order_id
+
+
+RELATED_PRODUCTS_ROLLUP = 'related-products'
+RELATED_PRODUCTS_COUNT = 10
+ORDERS_CHUNK_SIZE = 100000 # orders in one orders x products matrix
+ITERATOR_CHUNK_SIZE = 10000
+
+
+def stream_order_items(min_order_id, max_order_id):
+    # (order_id, product_id) of paid orders min_order_id < id <= max_order_id, items of an order come together.
+    # orders are counted with their status when a build reads them, ones paid or canceled later are counted by --rebuild
+    return itertools.chain.from_iterable(
+        model.objects
+             .filter(order_id__gt=min_order_id, order_id__lte=max_order_id, order__status=Order.ORDER_STATUS_PAID)
+             .order_by('order_id')
+             .values_list('order_id', 'product_id')
+             .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        for model in [OrderItem, ArchivedOrderItem]
+    )
+
+
+def _chunk_co_purchases(rows, columns, orders_count, size):
+    orders = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, columns)),
+        shape=(orders_count, size),
+    )
+    return (orders.T @ orders).tocsr()
+
+
+def count_co_purchases(order_items, size):
+    # products x products matrix, [a, b] is number of orders that have both a and b
+    co_purchases = sparse.csr_matrix((size, size), dtype=np.int32)
+    rows, columns = [], []
+    orders_count = 0
+    for _, items in itertools.groupby(order_items, key=lambda item: item[0]):
+        product_ids = {product_id for _, product_id in items}
+        if len(product_ids) < 2: # no pair in it
+            continue
+        rows += [orders_count] * len(product_ids)
+        columns += product_ids
+        orders_count += 1
+        if orders_count == ORDERS_CHUNK_SIZE:
+            co_purchases += _chunk_co_purchases(rows, columns, orders_count, size)
+            rows, columns = [], []
+            orders_count = 0
+    if orders_count:
+        co_purchases += _chunk_co_purchases(rows, columns, orders_count, size)
+
+    co_purchases = co_purchases - sparse.diags(co_purchases.diagonal(), dtype=np.int32) # a product with itself
+    co_purchases.eliminate_zeros()
+    return co_purchases
+
+
+def load_co_purchases(path):
+    # returns (matrix, last order id in it)
+    path = Path(path)
+    if not path.exists():
+        return None, 0
+    with np.load(path) as saved:
+        co_purchases = sparse.csr_matrix((saved['data'], saved['indices'], saved['indptr']), shape=tuple(saved['shape']))
+        return co_purchases, int(saved['last_order_id'])
+
+
+def save_co_purchases(path, co_purchases, last_order_id):
+    # the file is replaced when the transaction commits, so it is never ahead of RollupState
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'{path.stem}.tmp.npz') # a crash never leaves a half written file
+    np.savez(
+        temp_path,
+        data=co_purchases.data,
+        indices=co_purchases.indices,
+        indptr=co_purchases.indptr,
+        shape=np.array(co_purchases.shape),
+        last_order_id=np.array(last_order_id),
+    )
+    transaction.on_commit(lambda: os.replace(temp_path, path))
+
+
+def top_related_products(co_purchases, product_ids, count=RELATED_PRODUCTS_COUNT):
+    related_products = []
+    for product_id in product_ids:
+        start, end = co_purchases.indptr[product_id], co_purchases.indptr[product_id + 1]
+        related_ids, scores = co_purchases.indices[start:end], co_purchases.data[start:end]
+        if len(scores) > count:
+            best = np.argpartition(-scores, count)[:count]
+            related_ids, scores = related_ids[best], scores[best]
+        for rank, index in enumerate(np.lexsort((related_ids, -scores))): # more orders first, then smaller id
+            related_products.append(RelatedProduct(
+                product_id=product_id,
+                related_id=int(related_ids[index]),
+                rank=rank,
+                score=int(scores[index]),
+            ))
+    return related_products
+
+
+def build_related_products(path, rebuild=False, count=RELATED_PRODUCTS_COUNT):
+    # adds paid orders placed since the last build to the saved matrix and rewrites related products of the products in them.
+    # returns (last order id, number of updated products)
+    upto = last_rollup_order_id()
+    with transaction.atomic():
+        state, _ = RollupState.objects.select_for_update().get_or_create(name=RELATED_PRODUCTS_ROLLUP) # one build at a time
+        co_purchases, last_order_id = (None, 0) if rebuild else load_co_purchases(path)
+        if last_order_id != state.last_order_id: # file is lost or older than the db (crash before it was replaced)
+            rebuild = True
+            co_purchases, last_order_id = None, 0
+        if last_order_id >= upto and not rebuild:
+            return last_order_id, 0
+
+        size = (Product.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        new_co_purchases = count_co_purchases(stream_order_items(last_order_id, upto), size)
+        if co_purchases is None:
+            co_purchases = new_co_purchases
+        else:
+            co_purchases.resize((size, size)) # new products
+            co_purchases = (co_purchases + new_co_purchases).tocsr()
+
+        if rebuild:
+            product_ids = np.flatnonzero(np.diff(co_purchases.indptr))
+            RelatedProduct.objects.all().delete()
+        else:
+            product_ids = np.flatnonzero(np.diff(new_co_purchases.indptr)) # just their rows are changed
+            RelatedProduct.objects.filter(product_id__in=product_ids.tolist()).delete()
+        RelatedProduct.objects.bulk_create(top_related_products(co_purchases, product_ids.tolist(), count), batch_size=1000)
+
+        save_co_purchases(path, co_purchases, upto)
+        state.last_order_id = upto
+        state.save()
+    return upto, len(product_ids)
@@ -0,0 +1,75 @@
+import msgpack
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+# values orjson/msgpack can not write themselves (Decimal, datetime, lazy strings, ...) are converted by DRF's
+# encoder, so they come out as they did with JSONRenderer (Decimal -> float, datetime -> '...Z', UUID -> str)
+encode_default = JSONEncoder().default
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def encode_msgpack_default(value):
+    # msgpack ints are 64 bits too, bigger ones are written as strings
+    if isinstance(value, int):
+        return str(value)
+    return encode_default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    # same bytes as JSONRenderer, written by orjson. indented output (browsable api, ?indent) stays with json.dumps.
+    # floats are the shortest repr like python's, just exponents differ (1e16 vs 1e+16) and prices never have one
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=encode_default, option=ORJSON_OPTIONS)
+        except TypeError: # orjson can not write ints over 64 bits, json.dumps can (and raises the same for the rest)
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two, they break javascript string literals
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(BaseParser):
+    media_type = 'application/json'
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    # for the mobile apps, values are the same as the JSON ones (dict keys that are not strings stay as they are)
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_msgpack_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as exc:
+            raise ParseError(f'MessagePack parse error - {str(exc) or type(exc).__name__}')
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    # list endpoints with ColumnarListMixin answer {'columns': [...], 'rows': [[...], ...]} for it
+    media_type = 'application/vnd.store.columnar+json'
+    format = 'columnar'
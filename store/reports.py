@@ -0,0 +1,298 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .caches import bump_catalog_generation
+from .models import ArchivedOrder, ArchivedOrderItem, Category, DailyCategorySales, DailyProductSales, Order, OrderItem, Product, ProductSalesTotal, RollupState
+
+
+SALES_ROLLUP = 'sales'
+# orders newer than this are left for the next run, a smaller id may still be in an uncommitted checkout
+ROLLUP_LAG = timedelta(minutes=1)
+ROLLUP_BATCH_SIZE = 10000 # orders per transaction
+STATUS_CHANGE_CHUNK_SIZE = 1000 # order ids per query when status changes are added to rollups
+
+BEST_SELLERS_ROLLUP = 'best-sellers'
+BEST_SELLERS_COUNT = 10
+
+
+def sum_sales(order_items, sales, sign=1):
+    # adds sign * [units, revenue] of order items to sales {(date, product_id): [units, revenue]}
+    rows = order_items \
+                      .annotate(date=TruncDate('order__datetime_created')) \
+                      .values('date', 'product_id') \
+                      .annotate(
+                          units=Sum('quantity'),
+                          revenue=Sum(F('quantity') * F('unit_price'), output_field=DecimalField()),
+                      ) \
+                      .order_by()
+    for row in rows:
+        total = sales[row['date'], row['product_id']]
+        total[0] += sign * row['units']
+        total[1] += sign * row['revenue']
+    return sales
+
+
+def raw_product_sales(min_order_id=None, max_order_id=None):
+    # {(date, product_id): [units, revenue]} of paid order items (archived ones too) with min_order_id < order id <= max_order_id.
+    # orders paid or canceled after they are rolled up are added or subtracted by change_sales()
+    sales = defaultdict(lambda: [0, Decimal(0)])
+    for model in [OrderItem, ArchivedOrderItem]:
+        order_items = model.objects.filter(order__status=Order.ORDER_STATUS_PAID)
+        if min_order_id is not None:
+            order_items = order_items.filter(order_id__gt=min_order_id)
+        if max_order_id is not None:
+            order_items = order_items.filter(order_id__lte=max_order_id)
+        sum_sales(order_items, sales)
+    return sales
+
+
+def _add_to_rollup(model, key_field, sales):
+    # adds {(date, key): [units, revenue]} to rollup rows, missing rows are created
+    existing_rows = {
+        (row.date, getattr(row, key_field)): row
+        for row in model.objects.filter(date__in={date for date, _ in sales}, **{f'{key_field}__in': {key for _, key in sales}})
+    }
+    new_rows, changed_rows = [], []
+    for (date, key), (units, revenue) in sales.items():
+        row = existing_rows.get((date, key))
+        if row is None:
+            new_rows.append(model(date=date, units=units, revenue=revenue, **{key_field: key}))
+        else:
+            row.units += units
+            row.revenue += revenue
+            changed_rows.append(row)
+    model.objects.bulk_create(new_rows, batch_size=1000)
+    model.objects.bulk_update(changed_rows, ['units', 'revenue'], batch_size=1000)
+
+
+def add_sales(sales):
+    product_categories = dict(Product.objects.filter(id__in={product_id for _, product_id in sales}).values_list('id', 'category_id'))
+    category_sales = defaultdict(lambda: [0, Decimal(0)])
+    for (date, product_id), (units, revenue) in sales.items():
+        total = category_sales[date, product_categories[product_id]]
+        total[0] += units
+        total[1] += revenue
+    _add_to_rollup(DailyProductSales, 'product_id', sales)
+    _add_to_rollup(DailyCategorySales, 'category_id', category_sales)
+
+
+def last_rollup_order_id():
+    # newest order id that is safe to roll up (see ROLLUP_LAG)
+    first_recent_order_id = Order.objects \
+                                 .filter(datetime_created__gte=timezone.now() - ROLLUP_LAG) \
+                                 .aggregate(Min('id'))['id__min'] # uses order_created_idx, just recent orders
+    if first_recent_order_id is not None:
+        return first_recent_order_id - 1
+    return max(
+        Order.objects.aggregate(Max('id'))['id__max'] or 0,
+        ArchivedOrder.objects.aggregate(Max('id'))['id__max'] or 0,
+    )
+
+
+def next_batch_end(last_order_id, batch_size, upto):
+    # ids have gaps (deleted orders, archive), so the batch ends at the batch_size-th order
+    batch_end = Order.objects \
+                     .filter(id__gt=last_order_id) \
+                     .order_by('id') \
+                     .values_list('id', flat=True)[batch_size - 1:batch_size]
+    return min(batch_end[0] if batch_end else upto, upto)
+
+
+def rollup_sales(batch_size=ROLLUP_BATCH_SIZE):
+    # adds orders placed since the last run (high-water mark in RollupState), returns the new high-water mark
+    upto = last_rollup_order_id()
+    while True:
+        with transaction.atomic():
+            # one job at a time
+            state, _ = RollupState.objects.select_for_update().get_or_create(name=SALES_ROLLUP)
+            if state.last_order_id >= upto:
+                return state.last_order_id
+            last_order_id = next_batch_end(state.last_order_id, batch_size, upto)
+            add_sales(raw_product_sales(state.last_order_id, last_order_id))
+            state.last_order_id = last_order_id
+            state.save()
+
+
+def rebuild_sales_rollups(batch_size=ROLLUP_BATCH_SIZE):
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailyCategorySales.objects.all().delete()
+        RollupState.objects.filter(name=SALES_ROLLUP).delete()
+    return rollup_sales(batch_size)
+
+
+def change_sales(order_ids, sign):
+    # these orders were paid (sign 1) or paid ones were canceled (sign -1), their sales are added to or subtracted from
+    # the day rows of the rolled up ones. newer orders are rolled up with their new status by the next rollup_sales.
+    # called in the transaction of the status change, so rollup_sales sees both or none of them
+    order_ids = list(order_ids)
+    with transaction.atomic():
+        state = RollupState.objects.select_for_update().filter(name=SALES_ROLLUP).first() # waits for rollup_sales
+        if state is None:
+            return {}
+        sales = defaultdict(lambda: [0, Decimal(0)])
+        for start in range(0, len(order_ids), STATUS_CHANGE_CHUNK_SIZE):
+            order_items = OrderItem.objects.filter(
+                order_id__in=order_ids[start:start + STATUS_CHANGE_CHUNK_SIZE], order_id__lte=state.last_order_id,
+            )
+            sum_sales(order_items, sales, sign)
+        if sales:
+            add_sales(sales)
+            dates = {date for date, _ in sales}
+            DailyProductSales.objects.filter(date__in=dates, units=0).delete() # all their sales were canceled
+            DailyCategorySales.objects.filter(date__in=dates, units=0).delete()
+    return sales
+
+
+def check_sales_rollups():
+    # compares rollups with raw paid order items up to the high-water mark.
+    # returns (product mismatches [(date, product_id, rollup, raw)], category mismatches [(date, rollup, raw)])
+    state = RollupState.objects.filter(name=SALES_ROLLUP).first()
+    raw = raw_product_sales(max_order_id=state.last_order_id if state else 0)
+
+    product_rollups = {}
+    product_totals_by_date = defaultdict(lambda: [0, Decimal(0)])
+    for date, product_id, units, revenue in DailyProductSales.objects.values_list('date', 'product_id', 'units', 'revenue').iterator():
+        product_rollups[date, product_id] = [units, revenue]
+        product_totals_by_date[date][0] += units
+        product_totals_by_date[date][1] += revenue
+    product_mismatches = [
+        (date, product_id, product_rollups.get((date, product_id)), raw.get((date, product_id)))
+        for date, product_id in sorted(set(product_rollups) | set(raw))
+        if product_rollups.get((date, product_id)) != raw.get((date, product_id))
+    ]
+
+    # a product may move to another category later, so categories are checked by daily totals
+    category_totals_by_date = defaultdict(lambda: [0, Decimal(0)])
+    for date, units, revenue in DailyCategorySales.objects.values_list('date', 'units', 'revenue').iterator():
+        category_totals_by_date[date][0] += units
+        category_totals_by_date[date][1] += revenue
+    category_mismatches = [
+        (date, category_totals_by_date.get(date), product_totals_by_date.get(date))
+        for date in sorted(set(category_totals_by_date) | set(product_totals_by_date))
+        if category_totals_by_date.get(date) != product_totals_by_date.get(date)
+    ]
+    return product_mismatches, category_mismatches
+
+
+def refresh_best_sellers(category_ids):
+    # top_product and best_sellers of categories from ProductSalesTotal (BEST_SELLERS_COUNT rows of the index per category)
+    for category_id in category_ids:
+        best_sellers = [
+            {'id': product_id, 'name': name, 'units': units}
+            for product_id, name, units in ProductSalesTotal.objects
+                                                          .filter(category_id=category_id, units__gt=0) # all canceled
+                                                          .order_by('-units', 'product_id')
+                                                          .values_list('product_id', 'product__name', 'units')[:BEST_SELLERS_COUNT]
+        ]
+        Category.objects.filter(id=category_id).update(
+            top_product_id=best_sellers[0]['id'] if best_sellers else None,
+            best_sellers=best_sellers,
+        )
+    if category_ids:
+        bump_catalog_generation() # update() does not send category signals
+
+
+def add_units_sold(units_by_product):
+    # adds to ProductSalesTotal, returns ids of categories that their best sellers may change
+    products = dict(Product.objects.filter(id__in=units_by_product).values_list('id', 'category_id'))
+    totals = ProductSalesTotal.objects.in_bulk(list(units_by_product))
+    category_ids = set()
+    new_totals, changed_totals = [], []
+    for product_id, units in units_by_product.items():
+        total = totals.get(product_id)
+        if total is None:
+            new_totals.append(ProductSalesTotal(product_id=product_id, category_id=products[product_id], units=units))
+        else:
+            category_ids.add(total.category_id) # product may be moved to another category
+            total.category_id = products[product_id]
+            total.units += units
+            changed_totals.append(total)
+        category_ids.add(products[product_id])
+    ProductSalesTotal.objects.bulk_create(new_totals, batch_size=1000)
+    ProductSalesTotal.objects.bulk_update(changed_totals, ['category', 'units'], batch_size=1000)
+    return category_ids
+
+
+def update_best_sellers(batch_size=ROLLUP_BATCH_SIZE):
+    # reads just paid orders placed since the last run, then refreshes categories of the sold products.
+    # orders paid or canceled after they are counted are added or subtracted by change_units_sold()
+    # returns (new high-water mark, number of refreshed categories)
+    upto = last_rollup_order_id()
+    category_ids = set()
+    while True:
+        with transaction.atomic():
+            state, _ = RollupState.objects.select_for_update().get_or_create(name=BEST_SELLERS_ROLLUP)
+            if state.last_order_id >= upto:
+                break
+            last_order_id = next_batch_end(state.last_order_id, batch_size, upto)
+            units_by_product = dict(
+                OrderItem.objects
+                         .filter(order_id__gt=state.last_order_id, order_id__lte=last_order_id, order__status=Order.ORDER_STATUS_PAID)
+                         .values('product_id')
+                         .annotate(units=Sum('quantity'))
+                         .order_by()
+                         .values_list('product_id', 'units')
+            )
+            category_ids |= add_units_sold(units_by_product)
+            state.last_order_id = last_order_id
+            state.save()
+    refresh_best_sellers(category_ids)
+    return state.last_order_id, len(category_ids)
+
+
+def paid_units_sold(max_order_id):
+    # {product_id: units} of paid order items (archived ones too)
+    units_by_product = defaultdict(int)
+    for model in [OrderItem, ArchivedOrderItem]:
+        order_items = model.objects \
+                           .filter(order_id__lte=max_order_id, order__status=Order.ORDER_STATUS_PAID) \
+                           .values('product_id') \
+                           .annotate(units=Sum('quantity')) \
+                           .order_by() \
+                           .values_list('product_id', 'units')
+        for product_id, units in order_items:
+            units_by_product[product_id] += units
+    return units_by_product
+
+
+def change_units_sold(order_ids, sign):
+    # these orders were paid (sign 1) or paid ones were canceled (sign -1), units of the counted ones are added to or
+    # subtracted from ProductSalesTotal. newer orders are counted with their new status by the next update_best_sellers.
+    # called in the transaction of the status change, like change_sales()
+    order_ids = list(order_ids)
+    with transaction.atomic():
+        state = RollupState.objects.select_for_update().filter(name=BEST_SELLERS_ROLLUP).first() # waits for update_best_sellers
+        if state is None:
+            return set()
+        units_by_product = defaultdict(int)
+        for start in range(0, len(order_ids), STATUS_CHANGE_CHUNK_SIZE):
+            order_items = OrderItem.objects \
+                                   .filter(order_id__in=order_ids[start:start + STATUS_CHANGE_CHUNK_SIZE], order_id__lte=state.last_order_id) \
+                                   .values('product_id') \
+                                   .annotate(units=Sum('quantity')) \
+                                   .order_by() \
+                                   .values_list('product_id', 'units')
+            for product_id, units in order_items:
+                units_by_product[product_id] += sign * units
+        category_ids = add_units_sold(units_by_product)
+        refresh_best_sellers(category_ids)
+    return category_ids
+
+
+def rebuild_best_sellers():
+    # from all paid order items (archived ones too), every category is refreshed
+    upto = last_rollup_order_id()
+    with transaction.atomic():
+        ProductSalesTotal.objects.all().delete()
+        RollupState.objects.filter(name=BEST_SELLERS_ROLLUP).delete()
+        add_units_sold(paid_units_sold(upto))
+        RollupState.objects.create(name=BEST_SELLERS_ROLLUP, last_order_id=upto)
+    refresh_best_sellers(list(Category.objects.values_list('id', flat=True)))
+    return upto
@@ -1,10 +1,157 @@
 from decimal import Decimal
 from rest_framework import serializers
 from django.utils.text import slugify
-from django.db import transaction
+from django.db import models, transaction
+from django.urls import reverse
+
+from . import caches
+from .checkout import place_orders
+from .autocomplete import SUGGESTIONS_LIMIT
+from .comments import MODERATION_BATCH_SIZE
+from .compiled import compile_representation, is_compilable
+from .models import Category, CheckoutJob, Discount, Product, Comment, Cart, CartItem, Customer, Order, OrderItem
+
+
+def unit_price_after_tax(unit_price):
+    return round(unit_price * Decimal(1.09), 2)
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer): # ?fields=id,name ?exclude=description ?expand=category (view put them in context)
+    # SerializerMethodFields dont have source, so say which model attributes they read
+    field_sources = {}
+    # field name -> (serializer class, kwargs), this serializer is used instead of the field in ?expand=
+    expandable_fields = {}
+
+    def __init__(self, *args, **kwargs):
+        expand = kwargs.pop('expand', None) # nested serializers get their part of expand from parent
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            expand = self.context.get('expand', ())
+        fields = self.context.get('fields')
+        exclude = self.context.get('exclude')
+        self.fields_changed = False # representation is not the default one (it can not be cached)
+        for field_name in list(self.fields):
+            if not self.is_field_requested(field_name, fields, exclude):
+                self.fields.pop(field_name)
+                self.fields_changed = True
+        self.expand_fields(expand, fields, exclude)
+
+    @staticmethod
+    def is_field_requested(field_name, fields, exclude):
+        return (fields is None or field_name in fields) and (exclude is None or field_name not in exclude)
+
+    def expand_fields(self, expand, fields, exclude):
+        nested_expand = {} # items.product.category --> {'items': {'product.category'}}
+        for path in expand:
+            field_name, _, rest = path.partition('.')
+            nested_expand.setdefault(field_name, set())
+            if rest:
+                nested_expand[field_name].add(rest)
+
+        for field_name, rest in nested_expand.items():
+            if field_name in self.expandable_fields and self.is_field_requested(field_name, fields, exclude):
+                serializer_class, field_kwargs = self.expandable_fields[field_name]
+                if issubclass(serializer_class, DynamicFieldsModelSerializer):
+                    field_kwargs = {**field_kwargs, 'expand': rest}
+                self.fields[field_name] = serializer_class(read_only=True, **field_kwargs)
+                self.fields_changed = True
+            elif field_name in self.fields and rest:
+                field = self.fields[field_name]
+                many = isinstance(field, serializers.ListSerializer) # many=True fields are ListSerializer
+                serializer = field.child if many else field
+                if isinstance(serializer, DynamicFieldsModelSerializer):
+                    field_kwargs = {**serializer._kwargs, 'expand': rest}
+                    if many:
+                        field_kwargs['many'] = True
+                    self.fields[field_name] = type(serializer)(*serializer._args, **field_kwargs)
+                    self.fields_changed = True
+
+    def get_model_sources(self):
+        # top level model attributes needed for the remaining fields (columns and relations)
+        sources = set()
+        for field_name, field in self.fields.items():
+            if field_name in self.field_sources:
+                sources.update(self.field_sources[field_name])
+            elif field.source != '*':
+                sources.add(field.source.split('.')[0])
+        return sources
+
+
+class FragmentListSerializer(serializers.ListSerializer):
+    # product fragments of the whole list are read from cache with one get_many
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if isinstance(self.child, ProductFragmentMixin):
+            return self.child.to_representation_many(items)
+        product_field = self.child.fields.get('product') # cart items and order items
+        if isinstance(product_field, ProductFragmentMixin):
+            product_field.prime([item.product for item in items])
+        return [self.child.to_representation(item) for item in items]
+
+
+class CompiledListSerializer(FragmentListSerializer):
+    # many=True responses: the child's read path is compiled into one flat function (see compiled.py),
+    # no per field dispatch or nested serializer calls per row. writes and single objects use the normal path
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if not items or isinstance(self.child, ProductFragmentMixin) or not is_compilable(self.child) \
+                or not isinstance(items[0], self.child.Meta.model):
+            return super().to_representation(items) # products: fragments from cache, misses are compiled
+        product_field = self.child.fields.get('product')
+        if isinstance(product_field, ProductFragmentMixin):
+            product_field.prime([item.product for item in items])
+        represent = compile_representation(self.child)
+        return [represent(item) for item in items]
+
+
+class ProductFragmentMixin:
+    # serialized products are kept in cache per product (see caches.py), just misses are serialized.
+    # not compilable, compiled items call its to_representation so their products come from the cache too
+
+    def is_fragment_cacheable(self):
+        return not getattr(self, 'fields_changed', False)
+
+    def prime(self, products):
+        self._primed_fragments = dict(zip([product.pk for product in products], self.to_representation_many(products)))
+
+    def to_representation(self, product):
+        primed_fragments = getattr(self, '_primed_fragments', {})
+        if product.pk in primed_fragments:
+            return primed_fragments[product.pk]
+        return self.to_representation_many([product])[0]
+
+    def represent_all(self, products):
+        # many products with the compiled function (same output), one with drf
+        if len(products) > 1:
+            represent = compile_representation(self)
+            return [represent(product) for product in products]
+        representation = super().to_representation
+        return [representation(product) for product in products]
+
+    def to_representation_many(self, products):
+        if not self.is_fragment_cacheable():
+            return self.represent_all(products)
+
+        serializer_name = type(self).__name__
+        fragments, entries = caches.get_product_fragments(serializer_name, products)
+        missing = [product for product in products if product.pk not in fragments]
+        missing_data = dict(zip(missing, self.represent_all(missing)))
+        for product, data in missing_data.items():
+            fragments[product.pk] = data
+        caches.set_product_fragments(serializer_name, entries, missing_data)
+        return [fragments[product.pk] for product in products]
+
+
+class ProductCategorySerializer(serializers.ModelSerializer): # for ?expand=category, without num_of_products query
+    class Meta:
+        model = Category
+        fields = ['id', 'title', 'description']
 
-from .models import Category, Product, Comment, Cart, CartItem, Customer, Order, OrderItem
 
+class DiscountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Discount
+        fields = ['id', 'discount', 'description']
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -13,7 +160,8 @@ class CategorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Category
-        fields = ['id', 'title', 'description', 'num_of_products']
+        fields = ['id', 'title', 'description', 'num_of_products', 'top_product', 'best_sellers']
+        read_only_fields = ['top_product', 'best_sellers'] # update_best_sellers command fills them
 
     def create(self, validated_data):
         category = Category(**validated_data)
@@ -31,20 +179,29 @@ class CategorySerializer(serializers.ModelSerializer):
 
     
 
-class ProductSerializer(serializers.ModelSerializer): # this serialize convert product obj to jsaon and vise versa/ the serialize is the bridge of db and how represent the data
+class ProductSerializer(ProductFragmentMixin, DynamicFieldsModelSerializer): # this serialize convert product obj to jsaon and vise versa/ the serialize is the bridge of db and how represent the data
     price = serializers.DecimalField(max_digits=6, decimal_places=2, source='unit_price')
     unit_price_after_tax = serializers.SerializerMethodField()
     # category = serializers.HyperlinkedRelatedField(
     #     queryset=Category.objects.all(),
     #     view_name='category-detail',
     # )
+    field_sources = {
+        'unit_price_after_tax': ['unit_price'],
+    }
+    expandable_fields = {
+        'category': (ProductCategorySerializer, {}),
+        'discounts': (DiscountSerializer, {'many': True}),
+    }
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'price', 'category', 'unit_price_after_tax', 'inventory', 'description']
+        fields = ['id', 'name', 'price', 'category', 'unit_price_after_tax', 'inventory', 'description', 'approved_comments_count']
+        read_only_fields = ['approved_comments_count']
+        list_serializer_class = CompiledListSerializer
 
     def get_unit_price_after_tax(self, product):
-        return round(product.unit_price * Decimal(1.09), 2)
+        return unit_price_after_tax(product.unit_price)
 
     def validate(self, data):
         if len(data['name']) < 6:
@@ -66,17 +223,41 @@ class ProductSerializer(serializers.ModelSerializer): # this serialize convert p
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
-        fields = ['id', 'name', 'body']
+        fields = ['id', 'name', 'body', 'datetime_created']
 
     def create(self, validated_data):
         product_id = self.context['product_id']
         return Comment.objects.create(product_id=product_id, **validated_data)
 
 
-class CartProductSerializer(serializers.ModelSerializer):
+class ModerationCommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = ['id', 'product', 'name', 'body', 'datetime_created']
+
+
+class ModerationClaimSerializer(serializers.Serializer):
+    batch_size = serializers.IntegerField(min_value=1, max_value=100, default=MODERATION_BATCH_SIZE)
+    after = serializers.IntegerField(required=False) # last comment id of the previous batch
+
+
+class ModerationDecisionSerializer(serializers.Serializer):
+    approve = serializers.ListField(child=serializers.IntegerField(), default=list)
+    reject = serializers.ListField(child=serializers.IntegerField(), default=list)
+
+    def validate(self, data):
+        if set(data['approve']) & set(data['reject']):
+            raise serializers.ValidationError('A comment can not be approved and rejected together.')
+        if not data['approve'] and not data['reject']:
+            raise serializers.ValidationError('There is no comment to moderate.')
+        return data
+
+
+class CartProductSerializer(ProductFragmentMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'unit_price', ]
+        list_serializer_class = FragmentListSerializer
 
 
 class AddCartItemSerializer(serializers.ModelSerializer): # for post
@@ -106,23 +287,33 @@ class UpdateCartItemSerializer(serializers.ModelSerializer):
         fields = ['quantity']
 
 
-class CartItemSerializer(serializers.ModelSerializer): # this one show information
+class CartItemSerializer(DynamicFieldsModelSerializer): # this one show information
     product = CartProductSerializer()
     item_total = serializers.SerializerMethodField()
+    field_sources = {
+        'item_total': ['quantity', 'product'],
+    }
+    expandable_fields = {
+        'product': (ProductSerializer, {}),
+    }
 
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity', 'item_total']
+        list_serializer_class = CompiledListSerializer
 
     def get_item_total(self, cart_item):
         return cart_item.quantity * cart_item.product.unit_price
 
 
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(DynamicFieldsModelSerializer):
     # id = serializers.UUIDField(read_only=True)
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField()
+    field_sources = {
+        'total_price': ['items'],
+    }
 
     class Meta:
         model = Cart
@@ -155,33 +346,55 @@ class OrderCustomerSerializer(serializers.ModelSerializer):
         fields = ['id', 'first_name', 'last_name', 'email', ]
 
 
-class OrderItmeProductSerializer(serializers.ModelSerializer):
+class OrderItmeProductSerializer(ProductFragmentMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'unit_price', ]
+        list_serializer_class = FragmentListSerializer
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(DynamicFieldsModelSerializer):
     product = OrderItmeProductSerializer()
+    expandable_fields = {
+        'product': (ProductSerializer, {}),
+    }
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'quantity', 'unit_price']
+        list_serializer_class = FragmentListSerializer
 
-class OrderSerializer(serializers.ModelSerializer): # show orders
+class OrderSerializer(DynamicFieldsModelSerializer): # show orders
     items = OrderItemSerializer(many=True)
     class Meta:
         model = Order
-        fields = ['id', 'status', 'datetime_created', 'items']
+        fields = ['id', 'status', 'datetime_created', 'items', 'items_count', 'total_price']
         read_only_fields = ['customer', 'status']
+        list_serializer_class = CompiledListSerializer
 
 
-class OrderForAdminSerializer(serializers.ModelSerializer): 
+class OrderForAdminSerializer(DynamicFieldsModelSerializer): 
     items = OrderItemSerializer(many=True)
     customer = OrderCustomerSerializer()
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'status', 'datetime_created', 'items']
+        fields = ['id', 'customer', 'status', 'datetime_created', 'items', 'items_count', 'total_price']
         read_only_fields = ['customer', 'status']
+        list_serializer_class = CompiledListSerializer
+
+
+class OrderSummarySerializer(DynamicFieldsModelSerializer): # ?summary=true, order list without items
+    class Meta:
+        model = Order
+        fields = ['id', 'status', 'datetime_created', 'items_count', 'total_price']
+        list_serializer_class = CompiledListSerializer
+
+
+class OrderSummaryForAdminSerializer(DynamicFieldsModelSerializer):
+    customer = OrderCustomerSerializer()
+    class Meta:
+        model = Order
+        fields = ['id', 'customer', 'status', 'datetime_created', 'items_count', 'total_price']
+        list_serializer_class = CompiledListSerializer
 
 class OrderCreateSerializer(serializers.Serializer):
     cart_id = serializers.UUIDField()
@@ -205,34 +418,10 @@ class OrderCreateSerializer(serializers.Serializer):
             user_id = self.context['user_id']
             customer = Customer.objects.get(user_id=user_id)
 
-            order = Order()
-            order.customer = customer
-            order.save()
-
-            cart_items = CartItem.objects.filter(cart_id=cart_id)
-
-            order_items = [
-                OrderItem(
-                    order=order,
-                    product=cart_item.product,
-                    unit_price=cart_item.product.unit_price,
-                    quantity=cart_item.quantity,
-                ) for cart_item in cart_items
-            ]
-
-            # order_items = []
-            # for cart_item in cart_items:
-            #     order_item = OrderItem()
-            #     order_item.order = order
-            #     order_item.product_id = cart_item.product_id
-            #     order_item.quantity = cart_item.quantity
-            #     order_item.unit_price = cart_item.product.unit_price
-            #     order_items.append(order_item)
-
-            OrderItem.objects.bulk_create(order_items) # its create all items with one hit
-
-            Cart.objects.get(id=cart_id).delete()
-
+            # same code as async checkout workers, they place many orders together
+            order = place_orders([(customer.id, cart_id)])[0]
+            if order is None:
+                raise serializers.ValidationError({'cart_id': 'Your cart is empty!'})
             return order
     
         
@@ -241,3 +430,78 @@ class OrderUpdateSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['status']
 
+    def validate_status(self, status):
+        if self.instance is not None and status != self.instance.status \
+                and status not in Order.ORDER_STATUS_TRANSITIONS[self.instance.status]:
+            raise serializers.ValidationError(f'Order status can not change from {self.instance.get_status_display()} to {dict(Order.ORDER_STATUS)[status]}.')
+        return status
+
+
+class OrderBulkStatusSerializer(serializers.Serializer):
+    MAX_ORDERS = 100000
+
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_ORDERS)
+    status = serializers.ChoiceField(choices=Order.ORDER_STATUS)
+
+
+class CheckoutJobSerializer(serializers.ModelSerializer): # async checkout status, order is null until it is done
+    order = OrderSerializer(read_only=True)
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CheckoutJob
+        fields = ['id', 'status', 'status_url', 'order', 'error', 'datetime_created']
+
+    def get_status_url(self, checkout_job):
+        url = reverse('checkout-detail', kwargs={'pk': checkout_job.id})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField() # /store/products/1/ or products/1/
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    MAX_REQUESTS = 20
+
+    requests = BatchItemSerializer(many=True, allow_empty=False, max_length=MAX_REQUESTS)
+    parallel = serializers.BooleanField(default=False) # run read only requests at the same time
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    GROUP_DAY = 'day'
+    GROUP_PRODUCT = 'product'
+    GROUP_CATEGORY = 'category'
+    GROUPS = [GROUP_DAY, GROUP_PRODUCT, GROUP_CATEGORY]
+
+    start = serializers.DateField()
+    end = serializers.DateField() # inclusive
+    group = serializers.ChoiceField(choices=GROUPS, default=GROUP_DAY)
+    category = serializers.IntegerField(required=False)
+    product = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=1000, default=100) # for product and category groups
+
+    def validate(self, data):
+        if data['start'] > data['end']:
+            raise serializers.ValidationError('start should be before end.')
+        if 'product' in data and data['group'] != self.GROUP_DAY:
+            raise serializers.ValidationError('product filter is just for group=day.')
+        return data
+
+
+class ProductSuggestionQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=SUGGESTIONS_LIMIT)
+
+
+class ProfileSerializer(serializers.Serializer): # saved by ProfilingMiddleware
+    id = serializers.CharField()
+    view = serializers.CharField()
+    action = serializers.CharField()
+    duration_ms = serializers.IntegerField()
+    status = serializers.IntegerField()
+    size = serializers.IntegerField()
+    datetime_created = serializers.DateTimeField()
@@ -1,3 +1,4 @@
 from django.dispatch import Signal
 
-order_created = Signal()
\ No newline at end of file
+order_created = Signal()
+orders_status_changed = Signal() # one signal for a chunk of orders, in its transaction: status, order_ids, previous_statuses {order_id: status}
@@ -1,11 +1,62 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
 
-from store.models import Customer
+from store.autocomplete import product_names
+from store.caches import bump_catalog_generation, delete_product_fragments
+from store.comments import refresh_approved_comments_counts
+from store.models import Category, Comment, Customer, Order, Product
+from store.reports import change_sales, change_units_sold
+from store.signals import orders_status_changed
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_profile_for_newly_created_user(sender, instance, created, **kwargs):
     if created:
         Customer.objects.create(user=instance)
-        
\ No newline at end of file
+
+
+@receiver([post_save, post_delete], sender=Product)
+def delete_cached_product_fragments(sender, instance, **kwargs):
+    delete_product_fragments(instance.id)
+
+
+@receiver(post_save, sender=Product)
+def update_product_names_on_save(sender, instance, **kwargs):
+    product_names.product_changed(instance.id, instance.name)
+
+
+@receiver(post_delete, sender=Product)
+def update_product_names_on_delete(sender, instance, **kwargs):
+    product_names.product_changed(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def make_catalog_read_caches_stale(sender, **kwargs):
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=Comment)
+def refresh_approved_comments_count_on_save(sender, instance, created, **kwargs):
+    # a new waiting comment does not change it, an edited one may be approved or unapproved
+    if not created or instance.status == Comment.COMMENT_STATUS_APPROVED:
+        refresh_approved_comments_counts([instance.product_id])
+
+
+@receiver(post_delete, sender=Comment)
+def refresh_approved_comments_count_on_delete(sender, instance, **kwargs):
+    if instance.status == Comment.COMMENT_STATUS_APPROVED:
+        refresh_approved_comments_counts([instance.product_id])
+
+
+@receiver(orders_status_changed)
+def update_sales_of_changed_orders(sender, status, order_ids, previous_statuses, **kwargs):
+    # sales rollups and best sellers count just paid orders, other changes (unpaid to canceled) do not change them
+    if status == Order.ORDER_STATUS_PAID:
+        paid_order_ids, sign = order_ids, 1
+    else:
+        paid_order_ids, sign = [order_id for order_id in order_ids if previous_statuses[order_id] == Order.ORDER_STATUS_PAID], -1
+    if not paid_order_ids:
+        return
+    change_sales(paid_order_ids, sign)
+    change_units_sold(paid_order_ids, sign)
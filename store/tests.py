@@ -1,3 +1,1220 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, skipIfDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import caches
+from .archive import archive_comments, archive_orders
+from .autocomplete import NAMES_VERSION_KEY, ProductNameIndex, names_change_key
+from .checkout import CHECKOUT_CLAIM_TIMEOUT, claim_checkout_jobs, place_orders, process_checkout_jobs
+from .comments import MODERATION_CLAIM_TIMEOUT, delete_comments, refresh_approved_comments_counts
+from .compiled import RepresentationCompiler, compile_representation
+from .factories import CartFactory, CartItemFactory, CategoryFactory, CommentFactory, CustomerFactory, OrderFactory, OrderItemFactory, ProductFactory
+from .facets import PRICE_BUCKETS, product_facets
+from .filters import OrderFilter
+from .profiling import PROFILE_ID_HEADER, ProfilingMiddleware, enforce_disk_cap, get_profile_path
+from .models import ArchivedComment, ArchivedOrder, Cart, Category, CheckoutJob, Comment, Customer, DailyCategorySales, DailyProductSales, Order, Product, RelatedProduct
+from .orders import change_orders_status
+from .recommendations import build_related_products
+from .renderers import FastJSONRenderer, MessagePackParser, MessagePackRenderer
+from .reports import check_sales_rollups, rebuild_best_sellers, rollup_sales, update_best_sellers
+from .serializers import CartItemSerializer, OrderForAdminSerializer, OrderSerializer, ProductSerializer
+from .signals import orders_status_changed
+from .traffic import TRAFFIC_FILE_NAME, get_traffic_handler, read_traffic, traffic_logger
+
+
+def rollup_sales_upto_now():
+    # orders of the tests are newer than ROLLUP_LAG
+    with mock.patch('store.reports.ROLLUP_LAG', timedelta(0)):
+        return rollup_sales()
+
+
+def update_best_sellers_upto_now():
+    with mock.patch('store.reports.ROLLUP_LAG', timedelta(0)):
+        return update_best_sellers()
+
+
+class StoreTestCase(TestCase):
+    # a catalog, a cart and orders of one customer, and api clients for staff and the customer
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = CategoryFactory()
+        ProductFactory.create_batch(3, category=cls.category)
+        cls.products = list(Product.objects.order_by('id')) # decimal prices
+        cls.customer = CustomerFactory()
+        cls.cart = CartFactory()
+        for product in cls.products:
+            CartItemFactory(cart=cls.cart, product=product, quantity=2)
+        cls.orders = []
+        for _ in range(2):
+            order = OrderFactory(customer=cls.customer, status=Order.ORDER_STATUS_UNPAID)
+            for product in cls.products:
+                OrderItemFactory(order=order, product=product, quantity=1, unit_price=product.unit_price)
+            order.update_totals()
+            cls.orders.append(order)
+        cls.staff = get_user_model().objects.create_superuser('staff', 'staff@example.com', 'pass')
+
+    def setUp(self):
+        cache.clear() # read caches and product fragments
+        self.staff_client = APIClient()
+        self.staff_client.force_authenticate(self.staff)
+        self.customer_client = APIClient()
+        self.customer_client.force_authenticate(self.customer.user)
+
+
+class SparseFieldsetTests(StoreTestCase):
+    def test_product_list_fields(self):
+        with self.assertNumQueries(2): # count and page
+            response = self.staff_client.get('/store/products/?fields=id,name')
+        self.assertEqual(response.status_code, 200)
+        for product in response.data['results']:
+            self.assertEqual(set(product), {'id', 'name'})
+
+    def test_product_list_exclude(self):
+        response = self.staff_client.get('/store/products/?exclude=description,inventory')
+        self.assertEqual(set(response.data['results'][0]), {
+            'id', 'name', 'price', 'category', 'unit_price_after_tax', 'approved_comments_count',
+        })
+
+    def test_product_fields_load_just_their_columns(self):
+        with self.assertNumQueries(2) as queries:
+            self.staff_client.get('/store/products/?fields=id,name')
+        page_query = queries.captured_queries[-1]['sql']
+        self.assertIn('"store_product"."name"', page_query)
+        self.assertNotIn('"store_product"."description"', page_query)
+
+    def test_cart_without_items_skips_prefetch(self):
+        with self.assertNumQueries(1):
+            response = self.customer_client.get(f'/store/carts/{self.cart.id}/?fields=id')
+        self.assertEqual(response.data, {'id': str(self.cart.id)})
+
+        with self.assertNumQueries(3): # cart, items, products
+            response = self.customer_client.get(f'/store/carts/{self.cart.id}/')
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(response.data['total_price'], sum(2 * product.unit_price for product in self.products))
+
+    def test_order_list_fields(self):
+        with self.assertNumQueries(1): # no items or customer
+            response = self.staff_client.get('/store/orders/?fields=id,status')
+        self.assertEqual([set(order) for order in response.data], [{'id', 'status'}] * 2)
+
+    def test_fields_are_ignored_on_writes(self):
+        response = self.customer_client.post(f'/store/carts/{self.cart.id}/items/?fields=id', {
+            'product': self.products[0].id, 'quantity': 1,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(set(response.data), {'id', 'product', 'quantity'})
+
+
+class ExpandTests(StoreTestCase):
+    def test_product_category_is_an_id_without_expand(self):
+        response = self.staff_client.get('/store/products/')
+        self.assertEqual(response.data['results'][0]['category'], self.category.id)
+
+    def test_product_list_expand(self):
+        with self.assertNumQueries(3): # count, page with category join, discounts
+            response = self.staff_client.get('/store/products/?expand=category,discounts')
+        product = response.data['results'][0]
+        self.assertEqual(product['category'], {
+            'id': self.category.id, 'title': self.category.title, 'description': self.category.description,
+        })
+        self.assertEqual(product['discounts'], [])
+
+    def test_cart_items_expand_product(self):
+        with self.assertNumQueries(3): # cart, items, products
+            response = self.customer_client.get(f'/store/carts/{self.cart.id}/?expand=items.product')
+        product = response.data['items'][0]['product']
+        self.assertEqual(product['id'], self.products[0].id)
+        self.assertIn('unit_price_after_tax', product) # ProductSerializer, not CartProductSerializer
+
+    def test_order_items_expand_product_category(self):
+        with self.assertNumQueries(3): # orders, items with products, categories
+            response = self.customer_client.get('/store/orders/?expand=items.product.category')
+        product = response.data[0]['items'][0]['product']
+        self.assertEqual(product['category']['id'], self.category.id)
+
+    def test_expand_of_unknown_field_is_ignored(self):
+        response = self.staff_client.get('/store/products/?expand=nothing')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['category'], self.category.id)
+
+
+class CompiledRepresentationTests(StoreTestCase):
+    def test_compiled_output_is_drf_output(self):
+        products = list(Product.objects.prefetch_related('discounts'))
+        cart_items = list(self.cart.items.select_related('product'))
+        orders = list(Order.objects.prefetch_related('items__product').select_related('customer__user'))
+        cases = [
+            (ProductSerializer, products, {}),
+            (ProductSerializer, products, {'fields': ['id', 'price', 'unit_price_after_tax']}),
+            (ProductSerializer, products, {'expand': ['category', 'discounts']}),
+            (CartItemSerializer, cart_items, {}),
+            (CartItemSerializer, cart_items, {'expand': ['product']}),
+            (OrderSerializer, orders, {}),
+            (OrderForAdminSerializer, orders, {'expand': ['items.product']}),
+        ]
+        for serializer_class, instances, context in cases:
+            with self.subTest(serializer=serializer_class.__name__, context=context):
+                serializer = serializer_class(context=context)
+                represent = compile_representation(serializer)
+                self.assertEqual(
+                    [represent(instance) for instance in instances],
+                    [serializers.Serializer.to_representation(serializer, instance) for instance in instances],
+                )
+
+    def test_code_is_compiled_once_and_bound_to_every_serializer(self):
+        first, second = ProductSerializer(), ProductSerializer()
+        with mock.patch.object(RepresentationCompiler, 'compile', autospec=True, side_effect=RepresentationCompiler.compile) as compile:
+            compile_representation(first)
+            represent = compile_representation(second)
+        self.assertLessEqual(compile.call_count, 1) # other tests may have compiled it already
+        self.assertIn(second, [getattr(value, '__self__', None) for value in represent.__globals__.values()])
+
+    def test_compiled_lists_use_product_fragments(self):
+        self.staff_client.get('/store/products/')
+        self.customer_client.get('/store/orders/')
+        for product in self.products:
+            fragments = cache.get(caches.product_fragment_key(product.id))
+            self.assertIn('ProductSerializer', fragments)
+            self.assertIn('OrderItmeProductSerializer', fragments)
+
+
+class BatchTests(StoreTestCase):
+    def test_sub_requests_run_in_order_as_the_user(self):
+        response = self.customer_client.post('/store/batch/', {'requests': [
+            {'path': f'/store/carts/{self.cart.id}/?fields=id'},
+            {'method': 'POST', 'path': f'carts/{self.cart.id}/items/', 'body': {'product': self.products[0].id, 'quantity': 1}},
+            {'path': f'/store/carts/{self.cart.id}/items/?fields=quantity'},
+            {'path': '/store/orders/?fields=id'},
+            {'path': '/store/customers/'}, # staff only
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data], [200, 201, 200, 200, 403])
+        self.assertEqual(response.data[0]['body'], {'id': str(self.cart.id)})
+        self.assertEqual(sorted(item['quantity'] for item in response.data[2]['body']), [2, 2, 3])
+        self.assertEqual(len(response.data[3]['body']), 2)
+
+    def test_unknown_and_nested_paths(self):
+        response = self.staff_client.post('/store/batch/', {'requests': [
+            {'path': '/store/nothing/'},
+            {'method': 'POST', 'path': '/store/batch/', 'body': {'requests': []}},
+        ]}, format='json')
+        self.assertEqual([item['status'] for item in response.data], [404, 400])
+
+    def test_failed_sub_request_does_not_fail_the_batch(self):
+        with mock.patch('store.views.product_names.search', side_effect=RuntimeError), \
+                self.assertLogs('store.views', 'ERROR'):
+            response = self.staff_client.post('/store/batch/', {'requests': [
+                {'path': '/store/products/suggest/?q=a'},
+                {'path': f'/store/products/{self.products[0].id}/?fields=id'},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['status'] for item in response.data], [500, 200])
+        self.assertEqual(response.data[1]['body'], {'id': self.products[0].id})
+
+    def test_streaming_responses_are_not_batched(self):
+        profile = tempfile.NamedTemporaryFile(suffix='.prof')
+        self.addCleanup(profile.close)
+        with mock.patch('store.views.get_profile_path', return_value=Path(profile.name)):
+            response = self.staff_client.post('/store/batch/', {'requests': [
+                {'path': '/store/profiles/1.prof/'},
+                {'path': f'/store/products/{self.products[0].id}/?fields=id'},
+            ]}, format='json')
+        self.assertEqual([item['status'] for item in response.data], [400, 200])
+        self.assertEqual(response.data[0]['body'], {'detail': 'Streaming responses can not be batched.'})
+
+    def test_too_many_requests(self):
+        response = self.staff_client.post('/store/batch/', {'requests': [{'path': '/store/products/'}] * 21}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductNameIndexTests(SimpleTestCase):
+    def test_warmed_once_per_process(self):
+        index = ProductNameIndex()
+        with mock.patch('store.autocomplete.threading.Thread') as thread:
+            index.warm()
+            index.warm()
+            self.assertEqual(thread.return_value.start.call_count, 1)
+            with mock.patch('store.autocomplete.os.getpid', return_value=os.getpid() + 1): # a forked worker
+                index._after_fork()
+                index.warm()
+            self.assertEqual(thread.return_value.start.call_count, 2)
+
+
+class ProductNameChangesTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index, self.other_worker = ProductNameIndex(), ProductNameIndex()
+        self.index._build()
+        self.other_worker._build()
+
+    def check_changes(self):
+        self.index._checked_at = 0 # REFRESH_INTERVAL passed
+        return self.index.get_index()
+
+    def test_changes_of_other_workers_are_applied_without_a_build(self):
+        product = self.products[0]
+        self.other_worker.product_changed(product.id, 'Zebra stripes')
+        self.other_worker.product_changed(self.products[1].id)
+        with mock.patch.object(self.index, '_start_build') as start_build:
+            self.check_changes()
+        start_build.assert_not_called()
+        self.assertEqual(self.index.search('zebra'), [(product.id, 'Zebra stripes')])
+        self.assertFalse(self.index.get_index().contains(self.products[1].id, self.products[1].name))
+
+    def test_lost_change_builds_the_index_again(self):
+        self.other_worker.product_changed(self.products[0].id, 'Zebra stripes')
+        cache.delete(names_change_key(cache.get(NAMES_VERSION_KEY)))
+        with mock.patch.object(self.index, '_start_build') as start_build:
+            self.check_changes()
+            start_build.assert_not_called() # may be written a moment later
+            self.check_changes()
+        start_build.assert_called_once()
+
+    def test_db_is_searched_until_the_index_is_built(self):
+        index = ProductNameIndex()
+        product = self.products[0]
+        with mock.patch.object(index, '_start_build') as start_build:
+            suggestions = index.search(product.name[:4].upper())
+        start_build.assert_called_once()
+        self.assertIn((product.id, product.name), suggestions)
+
+
+class SingleFlightCacheTests(SimpleTestCase):
+    threads = 8
+
+    def setUp(self):
+        cache.clear()
+
+    def run_threads(self, function):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(function())) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_cold_key_is_computed_once(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2) # the other threads come while it is computed
+            return {'value': len(calls)}
+
+        threads, results = self.run_threads(lambda: caches.get_or_compute('test:cold', compute))
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 1}] * self.threads)
+
+    def test_stale_entry_is_served_while_one_thread_recomputes(self):
+        caches.get_or_compute('test:stale', lambda: 'old')
+        caches.bump_catalog_generation()
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'new'
+
+        threads, results = self.run_threads(lambda: caches.get_or_compute('test:stale', compute))
+        deadline = time.monotonic() + 5
+        while len(results) < self.threads - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(results, ['old'] * (self.threads - 1)) # nobody waited for the new value
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results[-1], 'new')
+        self.assertEqual(caches.get_or_compute('test:stale', lambda: 'not computed'), 'new')
+
+
+class RendererTests(SimpleTestCase):
+    data = {
+        'price': Decimal('12.50'),
+        'created': datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+        'day': date(2026, 1, 2),
+        'id': UUID('12345678-1234-5678-1234-567812345678'),
+        'label': gettext_lazy('Pending'),
+        'text': 'line\u2028paragraph\u2029é',
+        'items': [{'quantity': 2, 'discount': 0.1}, None, True],
+        1: 'int key',
+    }
+
+    def test_fast_json_renderer_writes_the_same_bytes_as_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_ints_over_64_bits(self):
+        data = {**self.data, 'big': 2 ** 70} # orjson can not write it, json.dumps does
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        content = MessagePackRenderer().render({'big': 2 ** 70})
+        self.assertEqual(MessagePackParser().parse(BytesIO(content)), {'big': str(2 ** 70)})
+
+    def test_message_pack_round_trip(self):
+        data = {key: value for key, value in self.data.items() if isinstance(key, str)} # the parser takes str keys only
+        parsed = MessagePackParser().parse(BytesIO(MessagePackRenderer().render(data)))
+        self.assertEqual(parsed, json.loads(JSONRenderer().render(data)))
+
+    def test_message_pack_parse_error(self):
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(BytesIO(b'\xc1'))
+
+
+class WarmCachesTests(StoreTestCase):
+    def test_warmed_entries_are_used_by_requests(self):
+        config = os.path.join(tempfile.mkdtemp(), 'config.json')
+        self.addCleanup(os.remove, config)
+        with open(config, 'w') as config_file:
+            json.dump({'pages': 1, 'orderings': ['name'], 'filters': [{'inventory__gt': 0, 'page_size': 1}], 'top_products': 3}, config_file)
+        # requests are sent in this thread and its connection is kept, the test db is in its transaction
+        executor = mock.MagicMock()
+        executor.return_value.__enter__.return_value.map = lambda function, urls: map(function, urls)
+        with mock.patch('store.management.commands.warm_caches.ThreadPoolExecutor', executor), \
+                mock.patch('store.management.commands.warm_caches.connections'):
+            call_command('warm_caches', '--config', config, '--host', 'warm.example.com', stdout=StringIO())
+
+        with mock.patch('rest_framework.mixins.ListModelMixin.list') as list_products, \
+                mock.patch('rest_framework.mixins.RetrieveModelMixin.retrieve') as retrieve_product:
+            response = self.staff_client.get('/store/products/?page_size=1&ordering=name&inventory__gt=0') # other order and host
+            self.staff_client.get(f'/store/products/{self.products[0].id}/')
+        list_products.assert_not_called()
+        retrieve_product.assert_not_called()
+        self.assertEqual(response.data['results'][0]['name'], min(product.name for product in self.products))
+        self.assertTrue(response.data['next'].startswith('http://testserver/store/products/?'))
+
+
+class FacetTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        other_category = CategoryFactory()
+        for unit_price, inventory in [(5, 1), (10, 3), (99.99, 10), (500, 11), (2000, 50)]:
+            ProductFactory(category=other_category, unit_price=unit_price, inventory=inventory)
+
+    def naive_facets(self, products):
+        categories = {}
+        for product in products:
+            categories.setdefault(product.category_id, []).append(product)
+        return {
+            'category': sorted(
+                [{'id': category_id, 'title': items[0].category.title, 'count': len(items)} for category_id, items in categories.items()],
+                key=lambda row: (-row['count'], row['id']),
+            ),
+            'price': [
+                {'min': low, 'max': high, 'count': sum(low <= product.unit_price and (high is None or product.unit_price < high) for product in products)}
+                for low, high in PRICE_BUCKETS
+            ],
+            'inventory': [
+                {'value': '<3', 'count': sum(product.inventory < 3 for product in products)},
+                {'value': '3<=10', 'count': sum(3 <= product.inventory <= 10 for product in products)},
+                {'value': '>10', 'count': sum(product.inventory > 10 for product in products)},
+            ],
+        }
+
+    def test_counts_match_a_naive_count(self):
+        self.assertEqual(product_facets(Product.objects.all()), self.naive_facets(list(Product.objects.all())))
+        response = self.staff_client.get('/store/products/?facets=true&inventory__gt=2&page_size=2&page=2')
+        self.assertEqual(response.data['facets'], self.naive_facets(list(Product.objects.filter(inventory__gt=2))))
+
+    def test_counts_are_refreshed_after_a_product_save(self):
+        self.staff_client.get('/store/products/?facets=1')
+        product = Product.objects.filter(inventory__gt=10).exclude(category=self.category).first()
+        product.category = self.category
+        product.inventory = 0
+        product.save()
+        response = self.staff_client.get('/store/products/?facets=1&page_size=1') # same filters, other page
+        self.assertEqual(response.data['facets'], self.naive_facets(list(Product.objects.all())))
+
+
+class ColumnarTests(StoreTestCase):
+    def get_rows(self, url, **headers):
+        response = self.staff_client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        table = data.get('results', data) # orders are not paginated
+        return data, [dict(zip(table['columns'], row)) for row in table['rows']]
+
+    def flatten(self, item, columns):
+        # serializer item as columns, nested fields are 'a.b'
+        flat = {}
+        for column in columns:
+            value = item
+            for name in column.split('.'):
+                value = value[name]
+            flat[column] = value
+        return flat
+
+    def assert_same_as_serializer(self, url, columnar_url, **headers):
+        expected = json.loads(self.staff_client.get(url).content)
+        expected = expected['results'] if isinstance(expected, dict) else expected
+        _, rows = self.get_rows(columnar_url, **headers)
+        self.assertTrue(rows)
+        self.assertEqual(rows, [self.flatten(item, rows[0].keys()) for item in expected])
+
+    def test_products_are_the_same_as_serializer(self):
+        self.assert_same_as_serializer('/store/products/?ordering=name', '/store/products/?ordering=name&format=columnar')
+        self.assert_same_as_serializer(
+            '/store/products/?ordering=name', '/store/products/?ordering=name',
+            HTTP_ACCEPT='application/vnd.store.columnar+json',
+        )
+
+    def test_orders_are_the_same_as_serializer(self):
+        self.assert_same_as_serializer('/store/orders/', '/store/orders/?format=columnar')
+        data, _ = self.get_rows('/store/orders/?format=columnar')
+        self.assertIn('customer.email', data['columns'])
+        self.assertEqual(len(data['items']['rows']), 6)
+
+    def test_fields_and_exclude_keep_id(self):
+        data, _ = self.get_rows('/store/products/?format=columnar&fields=name')
+        self.assertEqual(data['results']['columns'], ['id', 'name'])
+        data, _ = self.get_rows('/store/products/?format=columnar&exclude=id,description')
+        self.assertEqual(data['results']['columns'][0], 'id')
+        self.assertNotIn('description', data['results']['columns'])
+
+    def test_pagination_links(self):
+        ProductFactory.create_batch(2, category=self.category)
+        data, rows = self.get_rows('/store/products/?format=columnar&ordering=name&page_size=2')
+        self.assertEqual(data['count'], 5)
+        self.assertIsNone(data['previous'])
+        ids = [row['id'] for row in rows]
+        url = data['next']
+        while url:
+            self.assertIn('format=columnar', url)
+            data, rows = self.get_rows(url)
+            ids += [row['id'] for row in rows]
+            url = data['next']
+        self.assertEqual(ids, list(Product.objects.order_by('name').values_list('id', flat=True)))
+
+
+class CheckoutTests(StoreTestCase):
+    def add_job(self, **kwargs):
+        return CheckoutJob.objects.create(customer=self.customer, cart_id=self.cart.id, **kwargs)
+
+    def test_cart_twice_in_a_batch_is_placed_once(self):
+        orders = place_orders([(self.customer.id, self.cart.id), (self.customer.id, self.cart.id)])
+        self.assertIsNotNone(orders[0])
+        self.assertIsNone(orders[1])
+        self.assertEqual(orders[0].items.count(), 3)
+        self.assertEqual(orders[0].total_price, sum(2 * product.unit_price for product in self.products))
+        self.assertFalse(Cart.objects.filter(id=self.cart.id).exists())
+
+    def test_pending_jobs_are_placed(self):
+        job = self.add_job()
+        empty_cart_job = CheckoutJob.objects.create(customer=self.customer, cart_id=uuid4())
+        self.assertEqual(process_checkout_jobs('worker', 10), 2)
+        job.refresh_from_db()
+        empty_cart_job.refresh_from_db()
+        self.assertEqual(job.status, CheckoutJob.CHECKOUT_STATUS_DONE)
+        self.assertEqual(job.order.items_count, 3)
+        self.assertEqual(empty_cart_job.status, CheckoutJob.CHECKOUT_STATUS_FAILED)
+
+    def test_jobs_of_a_dead_worker_are_reclaimed(self):
+        stuck_job = self.add_job(
+            status=CheckoutJob.CHECKOUT_STATUS_PROCESSING,
+            claimed_by='dead',
+            claimed_at=timezone.now() - CHECKOUT_CLAIM_TIMEOUT - timedelta(seconds=1),
+        )
+        self.assertEqual(process_checkout_jobs('worker', 10), 1)
+        stuck_job.refresh_from_db()
+        self.assertEqual(stuck_job.status, CheckoutJob.CHECKOUT_STATUS_DONE)
+        self.assertEqual(stuck_job.claimed_by, 'worker')
+
+    def test_jobs_of_a_working_worker_are_not_reclaimed(self):
+        self.add_job(status=CheckoutJob.CHECKOUT_STATUS_PROCESSING, claimed_by='alive', claimed_at=timezone.now())
+        self.assertEqual(process_checkout_jobs('worker', 10), 0)
+
+    def test_job_reclaimed_meanwhile_is_skipped(self):
+        job = self.add_job()
+        claimed_jobs = claim_checkout_jobs('slow', 10)
+        CheckoutJob.objects.filter(id=job.id).update(claimed_by='other') # claim timed out and another worker took it
+        with mock.patch('store.checkout.claim_checkout_jobs', return_value=claimed_jobs):
+            process_checkout_jobs('slow', 10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CheckoutJob.CHECKOUT_STATUS_PROCESSING)
+        self.assertTrue(Cart.objects.filter(id=self.cart.id).exists())
+
+
+class IdempotencyTests(StoreTestCase):
+    def post_order(self, cart_id, key):
+        return self.customer_client.post('/store/orders/', {'cart_id': str(cart_id)}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_gets_the_first_response(self):
+        response = self.post_order(self.cart.id, 'key-1')
+        self.assertEqual(response.status_code, 200)
+        retry = self.post_order(self.cart.id, 'key-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, response.data)
+        self.assertEqual(Order.objects.filter(customer=self.customer).count(), 3) # 2 of setUpTestData and this one
+
+    def test_same_key_with_another_body_is_a_conflict(self):
+        self.post_order(self.cart.id, 'key-1')
+        response = self.post_order(uuid4(), 'key-1')
+        self.assertEqual(response.status_code, 409)
+
+    def test_failed_request_is_run_again(self):
+        response = self.post_order(uuid4(), 'key-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post_order(uuid4(), 'key-1').status_code, 400) # not a replay or conflict
+
+    def test_keys_of_users_are_separate(self):
+        self.post_order(self.cart.id, 'key-1')
+        self.customer_client.force_authenticate(self.staff)
+        response = self.post_order(self.cart.id, 'key-1')
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+    def test_request_in_progress_is_a_conflict(self):
+        cache.add('test:idempotency', {'in_progress': 'other', 'fingerprint': 'body'}, 60)
+        with mock.patch('store.caches.IDEMPOTENCY_WAIT', 0):
+            with self.assertRaises(caches.IdempotencyConflict):
+                caches.run_idempotent('test:idempotency', 'body', lambda: 'result')
+
+    def test_expired_marker_taken_by_a_retry_is_kept(self):
+        def run(): # our marker expires while we run and a retry takes the key
+            cache.set('test:idempotency', {'in_progress': 'retry', 'fingerprint': 'body'}, 60)
+            return 'first'
+
+        self.assertEqual(caches.run_idempotent('test:idempotency', 'body', run), ('first', False))
+        self.assertEqual(cache.get('test:idempotency'), {'in_progress': 'retry', 'fingerprint': 'body'})
+
+
+class OrderAdminTests(StoreTestCase):
+    def change_form_data(self, order, **changes):
+        items = list(order.items.order_by('id'))
+        data = {
+            'customer': order.customer_id,
+            'status': order.status,
+            'items-TOTAL_FORMS': len(items),
+            'items-INITIAL_FORMS': len(items),
+            'items-MIN_NUM_FORMS': 1,
+            'items-MAX_NUM_FORMS': 1000,
+        }
+        for index, item in enumerate(items):
+            data.update({
+                f'items-{index}-id': item.id,
+                f'items-{index}-order': order.id,
+                f'items-{index}-product': item.product_id,
+                f'items-{index}-quantity': item.quantity,
+                f'items-{index}-unit_price': item.unit_price,
+            })
+        return {**data, **changes}
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+        self.order = self.orders[0]
+        self.url = reverse('admin:store_order_change', args=[self.order.id])
+
+    def test_totals_are_not_recomputed_without_item_changes(self):
+        with mock.patch.object(Order, 'update_totals') as update_totals:
+            response = self.client.post(self.url, self.change_form_data(self.order))
+        self.assertEqual(response.status_code, 302)
+        update_totals.assert_not_called()
+
+    def test_totals_are_recomputed_after_item_changes(self):
+        response = self.client.post(self.url, self.change_form_data(self.order, **{'items-0-quantity': 5}))
+        self.assertEqual(response.status_code, 302)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, 5 * self.products[0].unit_price + sum(product.unit_price for product in self.products[1:]))
+
+
+class OrderFilterIndexTests(StoreTestCase):
+    def get_plan(self, params, user_id=None):
+        # same queryset as OrderViewSet list
+        queryset = Order.objects.all()
+        if user_id is not None:
+            queryset = queryset.filter(customer__user_id=user_id)
+        return OrderFilter(params, queryset=queryset).qs.order_by('-datetime_created')[:100].explain()
+
+    def test_filters_use_their_index(self):
+        month_ago = (timezone.now() - timedelta(days=30)).isoformat()
+        week_ago = (timezone.now() - timedelta(days=7)).isoformat()
+        created_range = {'datetime_created__gte': month_ago, 'datetime_created__lt': week_ago}
+        scenarios = [
+            ({'status': Order.ORDER_STATUS_PAID}, None, 'order_status_created_idx'),
+            ({'status': Order.ORDER_STATUS_UNPAID, **created_range}, None, 'order_status_created_idx'),
+            ({'status': Order.ORDER_STATUS_PAID, 'total_price__gte': 100}, None, 'order_status_created_idx'),
+            (created_range, None, 'order_created_idx'),
+            ({}, None, 'order_created_idx'),
+            ({'customer': self.customer.id}, None, 'order_customer_created_idx'),
+            ({'customer': self.customer.id, **created_range}, None, 'order_customer_created_idx'),
+            ({}, self.customer.user_id, 'order_customer_created_idx'), # customers see their own orders
+        ]
+        for params, user_id, index_name in scenarios:
+            with self.subTest(params=params, user_id=user_id):
+                self.assertIn(index_name, self.get_plan(params, user_id))
+
+    def test_filters_return_matching_orders(self):
+        self.orders[0].status = Order.ORDER_STATUS_PAID
+        self.orders[0].save()
+        response = self.staff_client.get('/store/orders/', {'status': Order.ORDER_STATUS_PAID, 'fields': 'id'})
+        self.assertEqual(response.data, [{'id': self.orders[0].id}])
+        response = self.staff_client.get('/store/orders/', {'total_price__gte': self.orders[1].total_price + 1, 'fields': 'id'})
+        self.assertEqual(response.data, [])
+
+
+class OrderStatusTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.unpaid, self.paid = self.orders
+        Order.objects.filter(id=self.paid.id).update(status=Order.ORDER_STATUS_PAID)
+        self.canceled = OrderFactory(customer=self.customer, status=Order.ORDER_STATUS_CANCELED)
+
+    def get_statuses(self):
+        return dict(Order.objects.values_list('id', 'status'))
+
+    def test_allowed_transitions_change_and_others_are_skipped(self):
+        changed = change_orders_status([self.unpaid.id, self.paid.id, self.canceled.id, 0], Order.ORDER_STATUS_PAID)
+        self.assertEqual(changed, [self.unpaid.id])
+        self.assertEqual(self.get_statuses(), {
+            self.unpaid.id: Order.ORDER_STATUS_PAID,
+            self.paid.id: Order.ORDER_STATUS_PAID,
+            self.canceled.id: Order.ORDER_STATUS_CANCELED,
+        })
+
+    def test_canceled_is_final(self):
+        changed = change_orders_status([self.unpaid.id, self.paid.id, self.canceled.id], Order.ORDER_STATUS_CANCELED, chunk_size=1)
+        self.assertEqual(sorted(changed), sorted([self.unpaid.id, self.paid.id]))
+        self.assertEqual(change_orders_status([self.canceled.id], Order.ORDER_STATUS_UNPAID), [])
+
+    def test_one_signal_for_a_chunk_of_changed_orders(self):
+        receiver = mock.Mock()
+        orders_status_changed.connect(receiver)
+        self.addCleanup(orders_status_changed.disconnect, receiver)
+        change_orders_status([self.unpaid.id, self.paid.id], Order.ORDER_STATUS_CANCELED)
+        receiver.assert_called_once()
+        self.assertEqual(receiver.call_args.kwargs['status'], Order.ORDER_STATUS_CANCELED)
+        self.assertEqual(sorted(receiver.call_args.kwargs['order_ids']), sorted([self.unpaid.id, self.paid.id]))
+        self.assertEqual(receiver.call_args.kwargs['previous_statuses'], {
+            self.unpaid.id: Order.ORDER_STATUS_UNPAID, self.paid.id: Order.ORDER_STATUS_PAID,
+        })
+
+        receiver.reset_mock()
+        order_ids = list(Order.objects.exclude(status=Order.ORDER_STATUS_CANCELED).values_list('id', flat=True))
+        change_orders_status(order_ids, Order.ORDER_STATUS_CANCELED, chunk_size=1)
+        self.assertEqual(receiver.call_count, len(order_ids)) # one for every chunk
+
+        receiver.reset_mock()
+        change_orders_status([self.canceled.id], Order.ORDER_STATUS_PAID) # nothing changed
+        receiver.assert_not_called()
+
+    def test_bulk_status_endpoint(self):
+        data = {'order_ids': [self.unpaid.id, self.canceled.id], 'status': Order.ORDER_STATUS_PAID}
+        self.assertEqual(self.customer_client.post('/store/orders/bulk_status/', data, format='json').status_code, 403)
+        response = self.staff_client.post('/store/orders/bulk_status/', data, format='json')
+        self.assertEqual(response.data, {'changed': 1, 'skipped': 1})
+
+    def test_admin_changes_status_just_with_actions(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('admin:store_order_change', args=[self.canceled.id]), {
+            'customer': self.customer.id,
+            'status': Order.ORDER_STATUS_PAID,
+            'items-TOTAL_FORMS': 0, 'items-INITIAL_FORMS': 0, 'items-MIN_NUM_FORMS': 1, 'items-MAX_NUM_FORMS': 1000,
+        })
+        self.assertEqual(response.status_code, 302) # saved, without status
+        self.client.post(reverse('admin:store_order_changelist'), {
+            'action': 'mark_paid',
+            '_selected_action': [self.unpaid.id, self.canceled.id],
+        })
+        statuses = self.get_statuses()
+        self.assertEqual(statuses[self.unpaid.id], Order.ORDER_STATUS_PAID)
+        self.assertEqual(statuses[self.canceled.id], Order.ORDER_STATUS_CANCELED)
+
+
+class SweepStaleTests(StoreTestCase):
+    def age(self, queryset, field, age):
+        queryset.update(**{field: timezone.now() - age - timedelta(minutes=1)})
+
+    def test_only_stale_unpaid_orders_and_carts_are_swept(self):
+        stale_order, fresh_order = self.orders
+        paid_order = OrderFactory(customer=self.customer, status=Order.ORDER_STATUS_PAID)
+        self.age(Order.objects.filter(id__in=[stale_order.id, paid_order.id]), 'datetime_created', settings.STORE_UNPAID_ORDER_TTL)
+        fresh_cart, checkout_cart = CartFactory(), CartFactory()
+        CheckoutJob.objects.create(customer=self.customer, cart_id=checkout_cart.id)
+        self.age(Cart.objects.exclude(id=fresh_cart.id), 'created_at', settings.STORE_CART_TTL)
+
+        with mock.patch('store.management.commands.sweep_stale.change_orders_status', wraps=change_orders_status) as change_status, \
+                mock.patch('store.signals.handlers.change_sales') as change_sales, \
+                mock.patch('store.signals.handlers.change_units_sold') as change_units_sold:
+            call_command('sweep_stale', '--pause', '0', stdout=StringIO())
+
+        change_status.assert_called_once_with([stale_order.id], Order.ORDER_STATUS_CANCELED, sender=mock.ANY)
+        change_sales.assert_not_called() # unpaid -> canceled does not change sales
+        change_units_sold.assert_not_called()
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[stale_order.id], Order.ORDER_STATUS_CANCELED)
+        self.assertEqual(statuses[fresh_order.id], Order.ORDER_STATUS_UNPAID)
+        self.assertEqual(statuses[paid_order.id], Order.ORDER_STATUS_PAID)
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {fresh_cart.id, checkout_cart.id})
+
+    def test_chunks(self):
+        self.age(Order.objects.all(), 'datetime_created', settings.STORE_UNPAID_ORDER_TTL)
+        with mock.patch('store.management.commands.sweep_stale.change_orders_status', wraps=change_orders_status) as change_status:
+            call_command('sweep_stale', '--pause', '0', '--chunk-size', '1', '--max-chunks', '1', stdout=StringIO())
+        change_status.assert_called_once()
+        self.assertEqual(Order.objects.filter(status=Order.ORDER_STATUS_UNPAID).count(), 1)
+
+
+class CommentTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.products[0]
+        CommentFactory.create_batch(15, product=self.product, status=Comment.COMMENT_STATUS_APPROVED)
+        CommentFactory.create_batch(3, product=self.product, status=Comment.COMMENT_STATUS_WAITING)
+        CommentFactory.create_batch(2, product=self.products[1], status=Comment.COMMENT_STATUS_APPROVED)
+        Comment.objects.update(datetime_created=timezone.now()) # all at the same time, ties are ordered by id
+
+    def get_approved_comments_counts(self):
+        return dict(Product.objects.values_list('id', 'approved_comments_count'))
+
+    def test_cursor_pages_have_every_approved_comment_once(self):
+        ids = []
+        url = f'/store/products/{self.product.id}/comments/'
+        while url:
+            response = self.staff_client.get(url)
+            ids += [comment['id'] for comment in response.data['results']]
+            url = response.data['next']
+        expected_ids = Comment.objects \
+                              .filter(product=self.product, status=Comment.COMMENT_STATUS_APPROVED) \
+                              .order_by('-id') \
+                              .values_list('id', flat=True)
+        self.assertEqual(ids, list(expected_ids))
+
+    def test_approved_counts_are_kept_on_save(self):
+        self.assertEqual(self.get_approved_comments_counts()[self.product.id], 15)
+        comment = Comment.objects.filter(status=Comment.COMMENT_STATUS_WAITING).first()
+        comment.status = Comment.COMMENT_STATUS_APPROVED
+        comment.save()
+        self.assertEqual(self.get_approved_comments_counts()[self.product.id], 16)
+
+    def test_delete_comments_refreshes_counts_once(self):
+        self.assertEqual(Comment._meta.related_objects, ()) # else delete_comments falls back to queryset.delete()
+        comments = Comment.objects.filter(product__in=self.products[:2])
+        with mock.patch('store.comments.refresh_approved_comments_counts', wraps=refresh_approved_comments_counts) as refresh:
+            self.assertEqual(delete_comments(comments), 20)
+        refresh.assert_called_once_with({self.products[0].id, self.products[1].id})
+        counts = self.get_approved_comments_counts()
+        self.assertEqual((counts[self.products[0].id], counts[self.products[1].id]), (0, 0))
+
+    def test_admin_delete_selected_refreshes_counts_once(self):
+        self.client.force_login(self.staff)
+        comment_ids = list(Comment.objects.filter(product=self.product).values_list('id', flat=True)[:5])
+        with mock.patch('store.comments.refresh_approved_comments_counts', wraps=refresh_approved_comments_counts) as refresh:
+            response = self.client.post(reverse('admin:store_comment_changelist'), {
+                'action': 'delete_selected',
+                '_selected_action': comment_ids,
+                'post': 'yes',
+            })
+        self.assertEqual(response.status_code, 302)
+        refresh.assert_called_once()
+        self.assertFalse(Comment.objects.filter(id__in=comment_ids).exists())
+        approved_count = Comment.objects.filter(product=self.product, status=Comment.COMMENT_STATUS_APPROVED).count()
+        self.assertEqual(self.get_approved_comments_counts()[self.product.id], approved_count)
+
+    def moderator_client(self, username):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_superuser(username, f'{username}@example.com', 'pass'))
+        return client
+
+    def claim(self, client, **data):
+        response = client.post('/store/comment-moderation/claim/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [comment['id'] for comment in response.data['results']]
+
+    def test_moderators_never_claim_the_same_comment(self):
+        waiting_ids = list(Comment.objects.filter(status=Comment.COMMENT_STATUS_WAITING).order_by('id').values_list('id', flat=True))
+        first = self.claim(self.moderator_client('mod1'), batch_size=2)
+        second = self.claim(self.moderator_client('mod2'), batch_size=2)
+        self.assertEqual(first, waiting_ids[:2])
+        self.assertEqual(second, waiting_ids[2:])
+        self.assertEqual(self.claim(self.moderator_client('mod3')), [])
+
+    @skipIfDBFeature('has_select_for_update_skip_locked') # there locked rows are skipped
+    def test_claim_checks_the_claim_again_in_the_update(self):
+        # another moderator claims the comments between the select and the update
+        other = self.moderator_client('mod2')
+        update = QuerySet.update
+
+        def claim_first(queryset, **kwargs):
+            if not hasattr(claim_first, 'done'):
+                claim_first.done = True
+                self.claim(other)
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', claim_first):
+            self.assertEqual(self.claim(self.moderator_client('mod1')), [])
+        self.assertEqual(Comment.objects.filter(status=Comment.COMMENT_STATUS_WAITING).exclude(claimed_by='').count(), 3)
+
+    def test_stale_claims_are_reclaimed(self):
+        moderator = self.moderator_client('mod1')
+        claimed = self.claim(moderator)
+        self.assertEqual(self.claim(self.moderator_client('mod2')), [])
+        Comment.objects.filter(id__in=claimed).update(claimed_at=timezone.now() - MODERATION_CLAIM_TIMEOUT - timedelta(seconds=1))
+        self.assertEqual(self.claim(self.moderator_client('mod3')), claimed)
+
+    def test_decide_only_moderates_own_claims(self):
+        owner, other = self.moderator_client('mod1'), self.moderator_client('mod2')
+        approved, rejected, _ = self.claim(owner)
+        response = other.post('/store/comment-moderation/decide/', {'approve': [approved]}, format='json')
+        self.assertEqual(response.data, {'moderated': 0, 'skipped': 1})
+        self.assertEqual(Comment.objects.get(id=approved).status, Comment.COMMENT_STATUS_WAITING)
+
+        response = owner.post('/store/comment-moderation/decide/', {'approve': [approved], 'reject': [rejected]}, format='json')
+        self.assertEqual(response.data, {'moderated': 2, 'skipped': 0})
+        statuses = dict(Comment.objects.filter(id__in=[approved, rejected]).values_list('id', 'status'))
+        self.assertEqual(statuses, {approved: Comment.COMMENT_STATUS_APPROVED, rejected: Comment.COMMENT_STATUS_NOT_APPROVED})
+        self.assertEqual(self.get_approved_comments_counts()[self.product.id], 16)
+
+
+class ArchiveTests(StoreTestCase):
+    def test_orders_are_moved_and_still_readable(self):
+        order = Order.objects.get(id=self.orders[0].id)
+        Order.objects.filter(id=order.id).update(status=Order.ORDER_STATUS_PAID)
+        self.assertEqual(archive_orders(Order.objects.filter(id=order.id)), 1)
+        self.assertFalse(Order.objects.filter(id=order.id).exists())
+        self.assertEqual(ArchivedOrder.objects.get(id=order.id).items.count(), 3)
+        response = self.customer_client.get(f'/store/orders/{order.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_price'], order.total_price)
+
+    def test_checkout_jobs_of_archived_orders_are_deleted(self):
+        archived_order, other_order = self.orders
+        Order.objects.filter(id=archived_order.id).update(status=Order.ORDER_STATUS_PAID)
+        done_job = CheckoutJob.objects.create(customer=self.customer, cart_id=uuid4(), status=CheckoutJob.CHECKOUT_STATUS_DONE, order=archived_order)
+        other_job = CheckoutJob.objects.create(customer=self.customer, cart_id=uuid4(), status=CheckoutJob.CHECKOUT_STATUS_DONE, order=other_order)
+        archive_orders(Order.objects.filter(id=archived_order.id))
+        self.assertFalse(CheckoutJob.objects.filter(id=done_job.id).exists()) # not a done job without order
+        self.assertEqual(CheckoutJob.objects.get(id=other_job.id).order_id, other_order.id)
+
+    def test_claimed_comments_are_moved(self):
+        comment = CommentFactory(product=self.products[0], status=Comment.COMMENT_STATUS_APPROVED, claimed_by='moderator', claimed_at=timezone.now())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).approved_comments_count, 1)
+        self.assertEqual(archive_comments(Comment.objects.all()), 1)
+        self.assertEqual(ArchivedComment.objects.get(id=comment.id).body, comment.body)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).approved_comments_count, 0)
+
+
+class SalesRollupTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.unpaid, self.paid = self.orders
+        Order.objects.filter(id=self.paid.id).update(status=Order.ORDER_STATUS_PAID)
+        rollup_sales_upto_now()
+
+    def get_units(self):
+        return dict(DailyProductSales.objects.values_list('product_id').annotate(total=Sum('units')))
+
+    def assert_rollups_match(self):
+        self.assertEqual(check_sales_rollups(), ([], []))
+
+    def test_just_paid_orders_are_rolled_up(self):
+        self.assertEqual(self.get_units(), {product.id: 1 for product in self.products})
+        self.assertEqual(
+            DailyCategorySales.objects.get(category=self.category).revenue,
+            Order.objects.get(id=self.paid.id).total_price,
+        )
+        self.assert_rollups_match()
+
+    def test_orders_paid_after_the_rollup_are_added(self):
+        change_orders_status([self.unpaid.id], Order.ORDER_STATUS_PAID)
+        self.assertEqual(self.get_units(), {product.id: 2 for product in self.products})
+        self.assert_rollups_match()
+
+    def test_canceled_paid_orders_are_removed(self):
+        response = self.staff_client.patch(f'/store/orders/{self.paid.id}/', {'status': Order.ORDER_STATUS_CANCELED})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_units(), {})
+        self.assert_rollups_match()
+
+    def test_canceled_unpaid_orders_do_not_change_rollups(self):
+        with mock.patch('store.signals.handlers.change_sales') as change_sales:
+            change_orders_status([self.unpaid.id], Order.ORDER_STATUS_CANCELED)
+        change_sales.assert_not_called()
+
+    def test_other_days_are_not_changed(self):
+        old_order = OrderFactory(customer=self.customer, status=Order.ORDER_STATUS_PAID)
+        Order.objects.filter(id=old_order.id).update(datetime_created=timezone.now() - timedelta(days=3))
+        OrderItemFactory(order=old_order, product=self.products[0], quantity=4, unit_price=self.products[0].unit_price)
+        rollup_sales_upto_now()
+        old_day = DailyProductSales.objects.get(product=self.products[0], units=4)
+        change_orders_status([self.paid.id], Order.ORDER_STATUS_CANCELED)
+        self.assertEqual(list(DailyProductSales.objects.values_list('id', 'units')), [(old_day.id, 4)])
+        self.assert_rollups_match()
+
+    def test_orders_after_the_high_water_mark_wait_for_the_next_rollup(self):
+        order = OrderFactory(customer=self.customer, status=Order.ORDER_STATUS_UNPAID)
+        OrderItemFactory(order=order, product=self.products[0], quantity=5, unit_price=self.products[0].unit_price)
+        change_orders_status([order.id], Order.ORDER_STATUS_PAID)
+        self.assertEqual(self.get_units()[self.products[0].id], 1)
+        rollup_sales_upto_now()
+        self.assertEqual(self.get_units()[self.products[0].id], 6)
+        self.assert_rollups_match()
+
+
+class BestSellersTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.unpaid, self.paid = self.orders
+        Order.objects.filter(id=self.paid.id).update(status=Order.ORDER_STATUS_PAID)
+        update_best_sellers_upto_now()
+
+    def get_units(self):
+        return {item['id']: item['units'] for item in Category.objects.get(id=self.category.id).best_sellers}
+
+    def test_just_paid_orders_are_counted(self):
+        self.assertEqual(self.get_units(), {product.id: 1 for product in self.products})
+
+    def test_orders_paid_after_the_update_are_added(self):
+        change_orders_status([self.unpaid.id], Order.ORDER_STATUS_PAID)
+        self.assertEqual(self.get_units(), {product.id: 2 for product in self.products})
+
+    def test_canceled_paid_orders_are_removed(self):
+        response = self.staff_client.patch(f'/store/orders/{self.paid.id}/', {'status': Order.ORDER_STATUS_CANCELED})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_units(), {})
+
+    def test_changes_match_a_rebuild(self):
+        change_orders_status([self.unpaid.id], Order.ORDER_STATUS_PAID)
+        change_orders_status([self.paid.id], Order.ORDER_STATUS_CANCELED)
+        units = self.get_units()
+        with mock.patch('store.reports.ROLLUP_LAG', timedelta(0)):
+            rebuild_best_sellers()
+        self.assertEqual(self.get_units(), units)
+        self.assertEqual(units, {product.id: 1 for product in self.products})
+
+    def test_rebuild_counts_just_paid_orders(self):
+        change_orders_status([self.unpaid.id], Order.ORDER_STATUS_PAID)
+        with mock.patch('store.reports.ROLLUP_LAG', timedelta(0)):
+            rebuild_best_sellers()
+        self.assertEqual(self.get_units(), {product.id: 2 for product in self.products})
+
+
+class RelatedProductsTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'co_purchases.npz')
+
+    def build(self, rebuild=False):
+        with mock.patch('store.reports.ROLLUP_LAG', timedelta(0)), self.captureOnCommitCallbacks(execute=True):
+            return build_related_products(self.path, rebuild)
+
+    def get_related(self):
+        return list(RelatedProduct.objects.order_by('product_id', 'rank').values_list('product_id', 'related_id', 'rank', 'score'))
+
+    def place_paid_order(self, products):
+        order = OrderFactory(customer=self.customer, status=Order.ORDER_STATUS_PAID)
+        for product in products:
+            OrderItemFactory(order=order, product=product, quantity=1, unit_price=product.unit_price)
+        return order
+
+    def test_just_paid_orders_are_counted(self):
+        self.build()
+        self.assertEqual(self.get_related(), [])
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_incremental_build_equals_rebuild(self):
+        first, second, third = self.products
+        Order.objects.filter(id__in=[order.id for order in self.orders]).update(status=Order.ORDER_STATUS_PAID)
+        self.build()
+        # same score, smaller id first
+        self.assertEqual(self.get_related()[:2], [(first.id, second.id, 0, 2), (first.id, third.id, 1, 2)])
+
+        new_product = ProductFactory(category=self.category)
+        self.place_paid_order([first, third, new_product])
+        self.place_paid_order([third, new_product])
+        self.build()
+        related = self.get_related()
+        self.assertIn((first.id, third.id, 0, 3), related)
+        self.assertIn((third.id, new_product.id, 2, 2), related)
+
+        self.build(rebuild=True)
+        self.assertEqual(self.get_related(), related)
+
+    def test_lost_file_is_rebuilt(self):
+        Order.objects.filter(id=self.orders[0].id).update(status=Order.ORDER_STATUS_PAID)
+        self.build()
+        os.remove(self.path)
+        self.place_paid_order(self.products[:2])
+        self.build()
+        self.assertIn((self.products[0].id, self.products[1].id, 0, 2), self.get_related())
+
+    def test_file_is_not_replaced_when_the_build_fails(self):
+        Order.objects.filter(id=self.orders[0].id).update(status=Order.ORDER_STATUS_PAID)
+        with mock.patch('store.recommendations.RelatedProduct.objects.bulk_create', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.build()
+        self.assertFalse(os.path.exists(self.path))
+
+
+class ProfilingTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = os.path.join(directory.name, 'profiles')
+        override = self.settings(STORE_PROFILES_DIR=self.directory, STORE_PROFILE_SAMPLE_RATE=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def get_token(self):
+        return self.staff_client.post('/store/profiles/token/').data['token']
+
+    def test_request_with_a_token_is_profiled(self):
+        response = self.staff_client.get('/store/products/', HTTP_X_STORE_PROFILE=self.get_token())
+        self.assertEqual(response.status_code, 200)
+        name = response[PROFILE_ID_HEADER]
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, name)))
+        self.assertEqual(self.staff_client.get('/store/profiles/').data[0]['id'], name)
+        response = self.staff_client.get(f'/store/profiles/{name}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content))
+
+    def test_bad_expired_and_missing_tokens_are_not_profiled(self):
+        token = self.get_token()
+        for headers in [{'HTTP_X_STORE_PROFILE': token + 'x'}, {'HTTP_X_STORE_PROFILE': ''}, {}]:
+            self.assertNotIn(PROFILE_ID_HEADER, self.staff_client.get('/store/products/', **headers))
+        with self.settings(STORE_PROFILE_TOKEN_MAX_AGE=timedelta(seconds=-1)):
+            self.assertNotIn(PROFILE_ID_HEADER, APIClient().get('/store/products/', HTTP_X_STORE_PROFILE=token))
+        self.assertFalse(os.path.exists(self.directory))
+
+    def test_sample_rate(self):
+        request = RequestFactory().get('/store/products/')
+        with self.settings(STORE_PROFILE_SAMPLE_RATE=0.1):
+            middleware = ProfilingMiddleware(lambda request: None)
+        with mock.patch('store.profiling.random.random', return_value=0.05):
+            self.assertTrue(middleware.should_profile(request))
+        with mock.patch('store.profiling.random.random', return_value=0.5):
+            self.assertFalse(middleware.should_profile(request))
+        with mock.patch('store.profiling.random.random') as random:
+            self.assertFalse(ProfilingMiddleware(lambda request: None).should_profile(request)) # rate 0
+        random.assert_not_called()
+
+    def test_disk_cap_deletes_the_oldest_profiles(self):
+        os.makedirs(self.directory)
+        names = [f'2026010{day}T000000000000-abcd.ProductViewSet.list.5ms.200.prof' for day in range(1, 5)]
+        for name in names:
+            with open(os.path.join(self.directory, name), 'wb') as file:
+                file.write(b'x' * 100)
+        enforce_disk_cap(Path(self.directory), 250)
+        self.assertEqual(sorted(os.listdir(self.directory)), names[2:])
+
+    def test_retrieve_is_just_for_profile_files(self):
+        os.makedirs(self.directory)
+        outside = os.path.join(os.path.dirname(self.directory), 'outside.prof')
+        with open(outside, 'wb') as file:
+            file.write(b'secret')
+        self.assertIsNone(get_profile_path('../outside.prof'))
+        self.assertIsNone(get_profile_path(outside))
+        for name in ['..%2Foutside.prof', '%2E%2E%2Foutside.prof', '..']:
+            self.assertEqual(self.staff_client.get(f'/store/profiles/{name}/').status_code, 404)
+        self.assertEqual(self.customer_client.get('/store/profiles/').status_code, 403)
+
+
+class TrafficTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        override = self.settings(STORE_TRAFFIC_DIR=self.directory, STORE_TRAFFIC_SAMPLE_RATE=1)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self.remove_traffic_handlers)
+
+    def remove_traffic_handlers(self):
+        for handler in list(traffic_logger.handlers):
+            traffic_logger.removeHandler(handler)
+            handler.close()
+
+    def capture(self):
+        token = str(AccessToken.for_user(self.staff))
+        client = APIClient(HTTP_AUTHORIZATION=f'JWT {token}')
+        client.get(f'/store/products/{self.products[0].id}/?search=secretword&page=2')
+        client.post(f'/store/carts/{self.cart.id}/items/', {'product': self.products[1].id, 'quantity': 3}, format='json')
+        client.patch(f'/store/customers/{self.customer.id}/', {'birth_date': '1999-12-31'}, format='json')
+        client.get(f'/store/checkouts/{uuid4()}/')
+        return token, open(os.path.join(self.directory, TRAFFIC_FILE_NAME)).read()
+
+    def test_captured_records_are_anonymized(self):
+        token, content = self.capture()
+        for secret in [token, 'secretword', str(self.cart.id), '1999-12-31']:
+            self.assertNotIn(secret, content)
+        product, cart_item, customer, checkout = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(product['kwargs'], {'pk': 'int'})
+        self.assertEqual(product['query'], {'page': '2'}) # safe params keep their values
+        self.assertEqual(product['query_shape'], {'search': 'str'})
+        self.assertEqual((product['auth'], product['staff']), ('JWTAuthentication', True))
+        self.assertEqual(cart_item['kwargs'], {'cart_pk': 'uuid'})
+        self.assertEqual(cart_item['body'], {'product': 'int', 'quantity': 'int'})
+        self.assertEqual(customer['body'], {'birth_date': 'str'})
+        self.assertEqual(checkout['url_name'], 'checkout-detail')
+
+    def test_rotation(self):
+        with self.settings(STORE_TRAFFIC_FILE_MAX_BYTES=100, STORE_TRAFFIC_FILES=2):
+            handler = get_traffic_handler()
+        traffic_logger.addHandler(handler)
+        traffic_logger.setLevel('INFO')
+        for index in range(10):
+            traffic_logger.info(json.dumps({'time': index, 'padding': 'x' * 40}))
+        self.assertEqual(sorted(os.listdir(self.directory)), [TRAFFIC_FILE_NAME, f'{TRAFFIC_FILE_NAME}.1', f'{TRAFFIC_FILE_NAME}.2'])
+        times = [record['time'] for record in read_traffic([self.directory])]
+        self.assertEqual(times, sorted(times))
+        self.assertEqual(times[-1], 9)
+        self.assertLess(len(times), 10) # the oldest ones are deleted
+
+    def test_replay_uses_local_ids(self):
+        self.capture()
+        job = CheckoutJob.objects.create(customer=self.customer, cart_id=uuid4())
+        product_ids = {str(product.id) for product in self.products}
+        sent = []
+
+        def send(replayer, method, path, headers, body):
+            sent.append((method, path, body))
+            return 200, b'{}', 1.0
+
+        saved = os.path.join(self.directory, 'result.json')
+        with mock.patch('store.management.commands.replay_traffic.Replayer.send', send), \
+                mock.patch('store.management.commands.replay_traffic.Replayer.track'):
+            call_command('replay_traffic', self.directory, '--speed', '0', '--save', saved, '--label', 'a', stdout=StringIO())
+        paths = {method: (path, body) for method, path, body in sent}
+        self.assertEqual(paths['POST'][0], f'/store/carts/{self.cart.id}/items/')
+        self.assertIn(str(json.loads(paths['POST'][1])['product']), product_ids)
+        customer_ids = {str(customer_id) for customer_id in Customer.objects.values_list('id', flat=True)}
+        self.assertIn(paths['PATCH'][0].split('/')[3], customer_ids)
+        gets = sorted(path for method, path, _ in sent if method == 'GET')
+        self.assertEqual(gets[0], f'/store/checkouts/{job.id}/')
+        self.assertIn(gets[1].split('/')[3], product_ids)
+        self.assertIn('search=', gets[1])
+        self.assertIn('page=2', gets[1])
+
+        summary = json.load(open(saved))
+        self.assertEqual((summary['label'], summary['requests'], summary['errors']), ('a', 4, 0))
+        output = StringIO()
+        call_command('replay_traffic', '--compare', saved, saved, stdout=output)
+        self.assertIn('throughput req/s', output.getvalue())
 
-# Create your tests here.
@@ -0,0 +1,147 @@
+import json
+import logging
+import random
+import re
+import time
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import msgpack
+from django.conf import settings
+
+
+TRAFFIC_FILE_NAME = 'traffic.ndjson' # rotated files are traffic.ndjson.1 (newest) ... .N (oldest)
+# values of these query params are kept, they are not personal and say what the request costs
+SAFE_QUERY_PARAMS = {
+    'page', 'page_size', 'ordering', 'fields', 'exclude', 'expand', 'format', 'facets', 'summary', 'status', 'group',
+    'limit',
+}
+UUID_PATTERN = re.compile(r'^[0-9a-f]{8}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{4}-?[0-9a-f]{12}$', re.IGNORECASE)
+INT_PATTERN = re.compile(r'^-?\d+$')
+
+logger = logging.getLogger(__name__)
+traffic_logger = logging.getLogger('store.traffic.records') # just the NDJSON lines
+
+
+def value_shape(value):
+    # type names instead of values: 'int', 'float', 'bool', 'str', 'uuid', 'null',
+    # {'key': shape, ...} and {'$list': length, '$item': shape of the first item}
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        if UUID_PATTERN.match(value):
+            return 'uuid'
+        return 'int' if INT_PATTERN.match(value) else 'str'
+    if isinstance(value, (list, tuple)):
+        return {'$list': len(value), '$item': value_shape(value[0]) if value else 'null'}
+    if isinstance(value, dict):
+        return {str(key): value_shape(item) for key, item in value.items()}
+    return 'str'
+
+
+def body_shape(request):
+    if not request.body:
+        return None
+    try:
+        if request.content_type == 'application/json':
+            return value_shape(json.loads(request.body))
+        if request.content_type == 'application/msgpack':
+            return value_shape(msgpack.unpackb(request.body, raw=False))
+        if request.content_type in ['application/x-www-form-urlencoded', 'multipart/form-data']:
+            return value_shape(request.POST.dict())
+    except ValueError:
+        pass
+    return 'binary'
+
+
+def request_record(request, response, start, duration):
+    # anonymized: route and shapes, no ids, search texts, bodies or users
+    match = request.resolver_match
+    drf_request = (getattr(response, 'renderer_context', None) or {}).get('request') # view authenticated it
+    authenticator = getattr(drf_request, 'successful_authenticator', None)
+    user = getattr(drf_request, 'user', None) or getattr(request, 'user', None)
+    query, query_shape = {}, {}
+    for name, value in request.GET.items():
+        if name in SAFE_QUERY_PARAMS:
+            query[name] = value
+        else:
+            query_shape[name] = value_shape(value)
+    return {
+        'time': start,
+        'method': request.method,
+        'url_name': match.url_name if match else None,
+        'route': match.route if match else None,
+        'kwargs': {name: value_shape(value) for name, value in match.kwargs.items()} if match else {},
+        'query': query,
+        'query_shape': query_shape,
+        'content_type': request.content_type if request.body else None,
+        'body': body_shape(request),
+        'idempotent': 'HTTP_IDEMPOTENCY_KEY' in request.META,
+        'accept': request.META.get('HTTP_ACCEPT'),
+        'auth': type(authenticator).__name__ if authenticator else None,
+        'staff': bool(getattr(user, 'is_staff', False)),
+        'status': response.status_code,
+        'latency_ms': round(duration * 1000, 2),
+    }
+
+
+def get_traffic_handler():
+    # one handler per process. workers append whole lines (O_APPEND), a rotation at the same time may lose a few records
+    directory = Path(settings.STORE_TRAFFIC_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(
+        directory / TRAFFIC_FILE_NAME,
+        maxBytes=settings.STORE_TRAFFIC_FILE_MAX_BYTES,
+        backupCount=settings.STORE_TRAFFIC_FILES,
+    )
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+def read_traffic(paths):
+    # records of NDJSON files (directories: all rotated files, oldest first) sorted by time
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            rotated = sorted(path.glob(f'{TRAFFIC_FILE_NAME}.*'), key=lambda file: int(file.suffix[1:]), reverse=True)
+            files += [*rotated, *path.glob(TRAFFIC_FILE_NAME)]
+        else:
+            files.append(path)
+    records = []
+    for file in files:
+        with file.open() as lines:
+            records += [json.loads(line) for line in lines if line.strip()]
+    return sorted(records, key=lambda record: record['time'])
+
+
+class TrafficCaptureMiddleware:
+    # writes STORE_TRAFFIC_SAMPLE_RATE of requests to rotating NDJSON files for the replay_traffic command.
+    # other requests cost a random() call
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.STORE_TRAFFIC_SAMPLE_RATE
+        if self.sample_rate > 0 and not traffic_logger.handlers:
+            traffic_logger.addHandler(get_traffic_handler())
+            traffic_logger.setLevel(logging.INFO)
+            traffic_logger.propagate = False
+
+    def __call__(self, request):
+        if not (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return self.get_response(request)
+
+        request.body # read before the view, so the body is still there for the record
+        start = time.time()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+        try:
+            traffic_logger.info(json.dumps(request_record(request, response, start, duration)))
+        except Exception: # a broken record never breaks the response
+            logger.exception('Traffic record failed')
+        return response
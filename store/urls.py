@@ -10,6 +10,9 @@ router.register('categories', views.CategoryViewSet, basename='category')
 router.register('carts', views.CartViewSet, basename='cart')
 router.register('customers', views.CustomerViewSet, basename='customer')
 router.register('orders', views.OrderViewSet, basename='order')
+router.register('checkouts', views.CheckoutJobViewSet, basename='checkout')
+router.register('comment-moderation', views.CommentModerationViewSet, basename='comment-moderation')
+router.register('profiles', views.ProfileViewSet, basename='profile')
 
 # Nested: url haye to dar to
 products_router = routers.NestedDefaultRouter(router, 'products', lookup='product') # localhost:8000/store/products/1(product-pk)/
@@ -18,7 +21,10 @@ products_router.register('comments', views.CommentViewSet, basename='product-com
 cart_item_router = routers.NestedDefaultRouter(router, 'carts', lookup='cart')
 cart_item_router.register('items', views.CartItemViewSet, basename='cart-items')
 
-urlpatterns = router.urls + products_router.urls + cart_item_router.urls
+urlpatterns = router.urls + products_router.urls + cart_item_router.urls + [
+    path('batch/', views.BatchView.as_view(), name='batch'),
+    path('reports/sales/', views.SalesReportView.as_view(), name='sales-report'),
+]
 
 # urlpatterns = [
 #     path('', include(router.urls))
@@ -1,5 +1,17 @@
+import hashlib
+import json
+import logging
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import FileResponse, Http404
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Prefetch
+from django.db import connections, transaction
+from django.db.models import Count, Prefetch, Sum
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import resolve, reverse, Resolver404
 
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
@@ -10,21 +22,32 @@ from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet # just li
 from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.viewsets import GenericViewSet
-from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
+from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, ListModelMixin
 from rest_framework.permissions import IsAdminUser, IsAuthenticated, AllowAny, DjangoModelPermissions
 from django_filters.rest_framework import DjangoFilterBackend
 
 
-from .models import Comment, OrderItem, Product, Category, Cart, CartItem, Customer, Order
-from .serializers import OrderForAdminSerializer, OrderItemSerializer, OrderSerializer, ProductSerializer, CategorySerializer, CommentSerializer, CartSerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer, CustomerSerializer, OrderCreateSerializer, OrderUpdateSerializer
-from .filters import ProductFilter
-from .paginations import DefaultPagination
+from .models import DailyCategorySales, DailyProductSales, RelatedProduct, RollupState, ArchivedComment, ArchivedOrder, ArchivedOrderItem, CheckoutJob, Comment, OrderItem, Product, Category, Cart, CartItem, Customer, Order
+from .serializers import BatchSerializer, ProductSuggestionQuerySerializer, SalesReportQuerySerializer, ModerationClaimSerializer, ModerationCommentSerializer, ModerationDecisionSerializer, CheckoutJobSerializer, OrderBulkStatusSerializer, OrderForAdminSerializer, OrderSummarySerializer, OrderSummaryForAdminSerializer, OrderItemSerializer, OrderSerializer, ProductSerializer, CategorySerializer, CommentSerializer, CartSerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer, CustomerSerializer, ProfileSerializer, OrderCreateSerializer, OrderUpdateSerializer, unit_price_after_tax
+from .filters import OrderFilter, ProductFilter
+from .paginations import CommentPagination, DefaultPagination
 from .permissions import IsAdminUserOrReadOnly, SendPrivateEmailToCustomerPermission, CustomDjangoModelPermissions
-from .signals import order_created
+from .signals import order_created, orders_status_changed
+from .orders import change_orders_status
+from .comments import claim_waiting_comments, moderate_comments
+from .reports import SALES_ROLLUP
+from . import caches
+from .autocomplete import product_names
+from .facets import product_facets
+from .profiling import PROFILE_HEADER, get_profile_path, list_profiles, make_profile_token
+from .mixins import ArchiveFallbackMixin, CachedReadMixin, ColumnarListMixin, DynamicFieldsMixin
+from .decorators import idempotent
 
-class ProductViewSet(ModelViewSet):
+logger = logging.getLogger(__name__)
+
+
+class ProductViewSet(CachedReadMixin, DynamicFieldsMixin, ColumnarListMixin, ModelViewSet):
     serializer_class = ProductSerializer
-    queryset = Product.objects.all()
     filter_backends = [SearchFilter, DjangoFilterBackend, OrderingFilter]
     ordering_fields = ['name', 'unit_price', 'inventory']
     search_fields = ['name', 'category__title']
@@ -32,6 +55,18 @@ class ProductViewSet(ModelViewSet):
     # filterset_fields = ['category_id', 'inventory']
     filterset_class = ProductFilter
     permission_classes = [CustomDjangoModelPermissions]
+    facets_ignored_params = ['page', 'page_size', 'format', 'ordering', 'fields', 'exclude', 'expand', 'facets']
+    # same values as ProductSerializer (?expand= is not supported)
+    columnar_fields = [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('price', 'unit_price'),
+        ('category', 'category_id'),
+        ('unit_price_after_tax', 'unit_price', unit_price_after_tax),
+        ('inventory', 'inventory'),
+        ('description', 'description'),
+        ('approved_comments_count', 'approved_comments_count'),
+    ]
 
     # def get_queryset(self):
     #     queryset = Product.objects.all()
@@ -40,17 +75,57 @@ class ProductViewSet(ModelViewSet):
     #         queryset = queryset.filter(category_id=category_id_parameter)
     #     return queryset
 
+    def get_queryset(self):
+        return self.expand_queryset(self.sparse_queryset(Product.objects.all()))
+
     def get_serializer_context(self):
         return {'request':self.request}
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ['true', '1']: # sidebar counts of the same filters
+            response.data = {**response.data, 'facets': self.get_facets()}
+        return response
+
+    def get_facets(self):
+        # cached by filters only, so every page and ordering of a filter uses the same counts
+        params = urlencode(sorted(
+            (name, value) for name, value in self.request.query_params.items()
+            if name not in self.facets_ignored_params
+        ))
+        return caches.get_or_compute(
+            f'facets:product:{hashlib.md5(params.encode()).hexdigest()}',
+            lambda: product_facets(self.filter_queryset(Product.objects.all())),
+        )
+
+    @action(detail=False)
+    def suggest(self, request): # search as you type, ?q=prefix of name. from memory (the db while a worker builds it)
+        serializer = ProductSuggestionQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        suggestions = product_names.search(serializer.validated_data['q'], serializer.validated_data['limit'])
+        return Response([{'id': product_id, 'name': name} for product_id, name in suggestions])
+
+    @action(detail=True)
+    def related(self, request, pk): # frequently bought together, build_related_products command fills them
+        related_products = RelatedProduct.objects \
+                                         .filter(product_id=pk) \
+                                         .select_related('related') \
+                                         .order_by('rank')
+        serializer = ProductSerializer(
+            [related_product.related for related_product in related_products],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
     def destroy(self, request, pk):
         product = get_object_or_404(Product.objects.select_related('category'), pk=pk)
-        if product.order_items.count() > 0:
+        if product.order_items.exists() or product.archived_order_items.exists():
             return Response({'error':'There is some order items including this product. Please remove them first.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         product.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(CachedReadMixin, ModelViewSet):
     serializer_class = CategorySerializer
     queryset = Category.objects.prefetch_related('products').all()
     permission_classes = [IsAdminUserOrReadOnly]
@@ -63,33 +138,80 @@ class CategoryViewSet(ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CommentViewSet(CreateModelMixin,RetrieveModelMixin,GenericViewSet):
+class CommentViewSet(ArchiveFallbackMixin, CreateModelMixin,RetrieveModelMixin,ListModelMixin,GenericViewSet):
     serializer_class = CommentSerializer
+    pagination_class = CommentPagination
+    model = Comment
+    archive_model = ArchivedComment
 
     def get_queryset(self):
         product_pk = self.kwargs['product_pk']
-        return Comment.objects.filter(product_id=product_pk).all()
+        queryset = self.get_model().objects.filter(product_id=product_pk).all()
+        if self.action == 'list': # storefront shows just approved ones, uses comment_product_status_idx
+            queryset = queryset.filter(status=Comment.COMMENT_STATUS_APPROVED)
+        return queryset
     
     def get_serializer_context(self):
-        return {'product_pk': self.kwargs['product_pk']}
+        return {'product_id': self.kwargs['product_pk']}
     
     # def my_comment(self, request):
     #     user_id = request.user.id 
     #     customer = Customer.objects.get(user_id=user_id)
     
 
-class CartViewSet(ModelViewSet):
+class CommentModerationViewSet(GenericViewSet):
+    # moderators claim a batch of waiting comments, then send their decisions for it
+    serializer_class = ModerationCommentSerializer
+    permission_classes = [IsAdminUser]
+
+    @action(detail=False, methods=['POST'])
+    def claim(self, request):
+        serializer = ModerationClaimSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        comments = claim_waiting_comments(
+            str(request.user.id),
+            serializer.validated_data['batch_size'],
+            serializer.validated_data.get('after'),
+        )
+        return Response({
+            'after': comments[-1].id if comments else None, # for the next claim
+            'results': ModerationCommentSerializer(comments, many=True).data,
+        })
+
+    @action(detail=False, methods=['POST'])
+    def decide(self, request): # {"approve": [...], "reject": [...]}
+        serializer = ModerationDecisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        approve, reject = serializer.validated_data['approve'], serializer.validated_data['reject']
+        comments = Comment.objects.filter( # just comments that this moderator claimed
+            id__in=[*approve, *reject],
+            status=Comment.COMMENT_STATUS_WAITING,
+            claimed_by=str(request.user.id),
+        )
+        moderated = moderate_comments(comments, approve)
+        return Response({'moderated': moderated, 'skipped': len(approve) + len(reject) - moderated})
+
+
+class CartViewSet(DynamicFieldsMixin, ModelViewSet):
     serializer_class = CartSerializer
-    queryset = Cart.objects.prefetch_related('items__product').all()
     lookup_value_regex = '[0-9a-fA-F]{8}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{4}\-?[0-9a-fA-F]{12}'  # regex: its a string format that check the data is this format or not
 
+    def get_queryset(self):
+        queryset = Cart.objects.all()
+        if self.wants('items'): # dont prefetch items when client dont want items or total_price
+            queryset = queryset.prefetch_related('items__product')
+        return self.expand_queryset(self.sparse_queryset(queryset))
+
 
-class CartItemViewSet(ModelViewSet):
+class CartItemViewSet(DynamicFieldsMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_queryset(self):
         cart_pk = self.kwargs['cart_pk']
-        return CartItem.objects.select_related('product').filter(cart_id=cart_pk).all()
+        queryset = CartItem.objects.filter(cart_id=cart_pk).all()
+        if self.wants('product'):
+            queryset = queryset.select_related('product')
+        return self.expand_queryset(self.sparse_queryset(queryset))
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -100,27 +222,63 @@ class CartItemViewSet(ModelViewSet):
     
     def get_serializer_context(self):
         return {'cart_pk': self.kwargs['cart_pk']}
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
     
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(ArchiveFallbackMixin, DynamicFieldsMixin, ColumnarListMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete', 'options', 'head']
+    model = Order
+    archive_model = ArchivedOrder # old closed orders, just for retrieve
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = OrderFilter # every filter has an index in Order.Meta
+    ordering_fields = ['datetime_created', 'total_price']
+    ordering = ['-datetime_created']
+    # columnar list has orders in rows and their items in a second table ('items', order column is the order id)
+    columnar_fields = [
+        ('id', 'id'),
+        ('status', 'status'),
+        ('datetime_created', 'datetime_created'),
+        ('items_count', 'items_count'),
+        ('total_price', 'total_price'),
+    ]
+    columnar_customer_fields = [
+        ('customer.id', 'customer_id'),
+        ('customer.first_name', 'customer__user__first_name'),
+        ('customer.last_name', 'customer__user__last_name'),
+        ('customer.email', 'customer__user__email'),
+    ]
+    columnar_item_fields = [
+        ('order', 'order_id'),
+        ('id', 'id'),
+        ('product.id', 'product_id'),
+        ('product.name', 'product__name'),
+        ('product.unit_price', 'product__unit_price'),
+        ('quantity', 'quantity'),
+        ('unit_price', 'unit_price'),
+    ]
     # permission_classes = [IsAuthenticated] # its classes so just class name
 
     def get_permissions(self): # its permissions so we should classname()
-        if self.request.method in ['PATCH', 'DELETE']: # its better that admin dont have permission to delete too.
+        if self.request.method in ['PATCH', 'DELETE'] or self.action == 'bulk_status': # its better that admin dont have permission to delete too.
             return [IsAdminUser()]
         return [IsAuthenticated()]
     
     def get_queryset(self):
-        queryset = Order.objects \
-                    .prefetch_related(
-                        Prefetch( # in normal prefetch we dont use select_related or more but use complicate quesrt. --> query in prefetch
-                            'items', # our query will minimum
-                            queryset=OrderItem.objects.select_related('product'),
-                        )
-                    ) \
-                    .select_related('customer__user') \
-                    .all()
+        queryset = self.get_model().objects.all()
+        if self.wants('items'):
+            order_items = ArchivedOrderItem.objects if self.archived else OrderItem.objects
+            queryset = queryset.prefetch_related(
+                Prefetch( # in normal prefetch we dont use select_related or more but use complicate quesrt. --> query in prefetch
+                    'items', # our query will minimum
+                    queryset=order_items.select_related('product'),
+                )
+            )
+        if self.wants('customer'):
+            queryset = queryset.select_related('customer__user')
+        queryset = self.expand_queryset(self.sparse_queryset(queryset))
         
         user = self.request.user
 
@@ -136,22 +294,68 @@ class OrderViewSet(ModelViewSet):
         if  self.request.method == 'PATCH':
             return OrderUpdateSerializer
 
+        summary = self.action == 'list' and self.request.query_params.get('summary') in ['true', '1'] # dont load items
+
         if self.request.user.is_staff:
-            return OrderForAdminSerializer
-        return OrderSerializer
+            return OrderSummaryForAdminSerializer if summary else OrderForAdminSerializer
+        return OrderSummarySerializer if summary else OrderSerializer
     
     def get_serializer_context(self):
         return {'user_id': self.request.user.id}
+
+    def get_columnar_fields(self):
+        fields = super().get_columnar_fields()
+        if self.request.user.is_staff and self.wants('customer'):
+            fields = [fields[0], *self.columnar_customer_fields, *fields[1:]] # where OrderForAdminSerializer has it
+        return fields
+
+    def get_columnar_data(self, rows, fields):
+        data = super().get_columnar_data(rows, fields)
+        if self.wants('items'): # not with ?summary=true
+            order_items = OrderItem.objects \
+                                   .filter(order_id__in=[row[0] for row in rows]) \
+                                   .order_by('order_id', 'id') \
+                                   .values_list(*[field[1] for field in self.columnar_item_fields])
+            data['items'] = super().get_columnar_data(list(order_items), self.columnar_item_fields)
+        return data
     
+    @idempotent
     def create(self, request, *args, **kwargs): # when order was created we want to show it. data is return to view so we should overight create
         create_order_serializer = OrderCreateSerializer(data=request.data, context={'user_id': self.request.user.id})
         create_order_serializer.is_valid(raise_exception=True)  
+
+        if settings.STORE_ASYNC_CHECKOUT: # process_checkouts command places the order, client polls status_url
+            customer_id = Customer.objects.values_list('id', flat=True).get(user_id=self.request.user.id)
+            checkout_job = CheckoutJob.objects.create(customer_id=customer_id, cart_id=create_order_serializer.validated_data['cart_id'])
+            serializer = CheckoutJobSerializer(checkout_job, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
         created_order = create_order_serializer.save()
 
         order_created.send_robust(self.__class__, order=created_order)
 
         serializer = OrderSerializer(created_order)
         return Response(serializer.data)
+
+    def perform_update(self, serializer):
+        old_status = serializer.instance.status
+        with transaction.atomic():
+            order = serializer.save()
+            if order.status != old_status: # same signal as bulk_status, sales rollups follow it
+                orders_status_changed.send_robust(
+                    self.__class__, status=order.status, order_ids=[order.id], previous_statuses={order.id: old_status},
+                )
+
+    @action(detail=False, methods=['POST'])
+    def bulk_status(self, request): # payment reconciliation: {"order_ids": [...], "status": "p"}
+        serializer = OrderBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        order_ids = set(serializer.validated_data['order_ids'])
+        changed_order_ids = change_orders_status(order_ids, serializer.validated_data['status'], sender=self.__class__)
+        return Response({
+            'changed': len(changed_order_ids),
+            'skipped': len(order_ids) - len(changed_order_ids), # not found or status can not change to this one
+        })
         
         
 
@@ -159,6 +363,19 @@ class OrderViewSet(ModelViewSet):
 
 
 
+class CheckoutJobViewSet(RetrieveModelMixin, GenericViewSet):
+    serializer_class = CheckoutJobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return CheckoutJob.objects \
+                          .select_related('order') \
+                          .prefetch_related(
+                              Prefetch('order__items', queryset=OrderItem.objects.select_related('product')),
+                          ) \
+                          .filter(customer__user_id=self.request.user.id)
+
+
 class CustomerViewSet(ModelViewSet):
     serializer_class = CustomerSerializer
     queryset = Customer.objects.all()
@@ -181,6 +398,147 @@ class CustomerViewSet(ModelViewSet):
     def send_private_email(self, request, pk):
         return Response(f'Email was sending successfully to user {pk=}!')
     
+class SalesReportView(APIView):
+    # revenue and units in a date range, read from daily rollups (rollup_sales command) not from order items
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        serializer = SalesReportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        query = serializer.validated_data
+        group = query['group']
+
+        totals = {'units': Sum('units'), 'revenue': Sum('revenue')}
+        if group == SalesReportQuerySerializer.GROUP_PRODUCT or 'product' in query:
+            sales = DailyProductSales.objects.filter(date__range=(query['start'], query['end']))
+            if 'product' in query:
+                sales = sales.filter(product_id=query['product'])
+            if 'category' in query:
+                sales = sales.filter(product__category_id=query['category'])
+        else: # category rollup is smaller
+            sales = DailyCategorySales.objects.filter(date__range=(query['start'], query['end']))
+            if 'category' in query:
+                sales = sales.filter(category_id=query['category'])
+
+        if group == SalesReportQuerySerializer.GROUP_DAY:
+            results = sales.values('date').annotate(**totals).order_by('date')
+        elif group == SalesReportQuerySerializer.GROUP_PRODUCT:
+            results = sales.values('product_id', 'product__name').annotate(**totals).order_by('-revenue')[:query['limit']]
+        else:
+            results = sales.values('category_id', 'category__title').annotate(**totals).order_by('-revenue')[:query['limit']]
+
+        state = RollupState.objects.filter(name=SALES_ROLLUP).first()
+        return Response({
+            'last_order_id': state.last_order_id if state else 0, # newer orders are not in the report yet
+            'results': list(results),
+        })
+
+
+class ProfileViewSet(GenericViewSet):
+    # profiles of ProfilingMiddleware, retrieve downloads the pstats file (python -m pstats <file>, snakeviz, ...)
+    serializer_class = ProfileSerializer
+    permission_classes = [IsAdminUser]
+    lookup_value_regex = '[^/]+' # file names have dots
+
+    def list(self, request):
+        return Response(self.get_serializer(list_profiles(), many=True).data)
+
+    def retrieve(self, request, pk):
+        path = get_profile_path(pk)
+        if path is None:
+            raise Http404
+        return FileResponse(path.open('rb'), as_attachment=True, filename=path.name, content_type='application/octet-stream')
+
+    @action(detail=False, methods=['POST'])
+    def token(self, request): # send it in the X-Store-Profile header, that request is profiled
+        return Response({
+            'header': PROFILE_HEADER,
+            'token': make_profile_token(request.user.id),
+            'expires_in': int(settings.STORE_PROFILE_TOKEN_MAX_AGE.total_seconds()),
+        })
+
+
+class BatchView(APIView):
+    # many store api calls in one http request. user is authenticated one time and sub requests use it,
+    # so jwt is decoded once and permissions are cached on the same user object
+    permission_classes = [AllowAny] # every sub request checks its own view permissions
+    max_workers = 4
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        sub_requests = serializer.validated_data['requests']
+
+        if not serializer.validated_data['parallel']:
+            return Response([self.run(request, sub_request) for sub_request in sub_requests])
+
+        # consecutive GET requests run together, other methods run alone and in order
+        responses = []
+        group = []
+        for sub_request in sub_requests + [None]:
+            if sub_request is not None and sub_request['method'] == 'GET':
+                group.append(sub_request)
+                continue
+            if group:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(group))) as executor:
+                    responses += executor.map(lambda item: self.run_in_thread(request, item), group)
+                group = []
+            if sub_request is not None:
+                responses.append(self.run(request, sub_request))
+        return Response(responses)
+
+    def run_in_thread(self, request, sub_request):
+        try:
+            return self.run(request, sub_request)
+        finally:
+            connections.close_all() # every thread has its own db connection
+
+    def run(self, request, sub_request):
+        store_prefix = reverse('batch')[:-len('batch/')]
+        path, _, query_string = sub_request['path'].partition('?')
+        if path.startswith(store_prefix):
+            path = path[len(store_prefix):]
+        path = path.lstrip('/')
+
+        try:
+            match = resolve(f'/{path}', urlconf='store.urls')
+        except Resolver404:
+            return {'status': status.HTTP_404_NOT_FOUND, 'body': {'detail': 'Not found.'}}
+        if getattr(match.func, 'cls', None) is self.__class__:
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': 'Batch requests can not be nested.'}}
+
+        body = json.dumps(sub_request['body']).encode() if 'body' in sub_request else b''
+        environ = {
+            **request._request.META,
+            'REQUEST_METHOD': sub_request['method'],
+            'PATH_INFO': store_prefix + path,
+            'QUERY_STRING': query_string,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        }
+        environ.pop('HTTP_AUTHORIZATION', None)
+        http_request = WSGIRequest(environ)
+        http_request._force_auth_user = request.user
+        http_request._force_auth_token = request.auth
+
+        try:
+            response = match.func(http_request, *match.args, **match.kwargs)
+        except Exception: # one broken sub request does not fail the whole batch
+            logger.exception('Batch sub request %s %s failed', sub_request['method'], sub_request['path'])
+            return {'status': status.HTTP_500_INTERNAL_SERVER_ERROR, 'body': {'detail': 'A server error occurred.'}}
+        if response.streaming: # file downloads, reading them into the batch response would load the whole file
+            response.close()
+            return {'status': status.HTTP_400_BAD_REQUEST, 'body': {'detail': 'Streaming responses can not be batched.'}}
+        if hasattr(response, 'data'): # drf response, no need to render and parse it again
+            data = response.data
+        elif response.content and response.get('Content-Type', '').startswith('application/json'):
+            data = json.loads(response.content)
+        else:
+            data = None
+        return {'status': response.status_code, 'body': data}
+
+
 # APIView
 # class ProductList(ListCreateAPIView): # the get and post method in listcreateapiview 
 #     serializer_class = ProductSerializer